@@ -82,7 +82,10 @@ resource "aws_lambda_function" "archive" {
     DB_PASSWORD = "${var.DB_PASSWORD}",
     DB_USER = "${var.DB_USER}",
     DB_NAME = "${var.DB_NAME}",
-    SCHEMA_NAME = "${var.SCHEMA_NAME}"
+    SCHEMA_NAME = "${var.SCHEMA_NAME}",
+    EXPIRY_MODE = "switch",
+    ARCHIVE_CODEC = "zstd",
+    ARCHIVE_SINK = "parquet"
     }
   }
 
@@ -135,6 +138,50 @@ schedule_expression = "cron(0 * ? * * *)"
   }
 }
 
+resource "aws_lambda_function" "compact" {
+  function_name = "pigasus-archive-compact"
+  role = aws_iam_role.archive_lambda.arn
+
+  architectures = ["arm64"]
+  timeout = 300
+  memory_size = 1024
+
+  package_type = "Image"
+  image_uri = "${aws_ecr_repository.archive_ecr.repository_url}:latest"
+
+  image_config {
+    command = ["compact.handler"]
+  }
+
+  depends_on = [
+    aws_cloudwatch_log_group.archive_log_group,
+    null_resource.initialise_archive_ecr
+  ]
+
+  environment {
+    variables = {
+    COMPACT_DAYS = "1",
+    COMPACT_LAG_DAYS = "2",
+    ARCHIVE_CODEC = "zstd"
+    }
+  }
+}
+
+resource "aws_scheduler_schedule" "compact_schedule" {
+  name = "pigasus-archive-compact"
+
+  flexible_time_window {
+    mode = "OFF"
+  }
+
+schedule_expression = "cron(30 2 * * ? *)"
+
+  target {
+    arn = aws_lambda_function.compact.arn
+    role_arn = aws_iam_role.archive_scheduler.arn
+  }
+}
+
 resource "aws_s3_bucket" "archive" {
   bucket = "pigasus-archive"
   force_destroy = true
@@ -16,7 +16,7 @@ resource "null_resource" "initialise_pipeline_ecr" {
   provisioner "local-exec" {
     command = <<EOT
       aws ecr get-login-password --region eu-west-2 | docker login --username AWS --password-stdin ${local.account_id}.dkr.ecr.eu-west-2.amazonaws.com
-      docker build --platform linux/arm64 --provenance false -t pigasus-pipeline .
+      docker build --platform linux/arm64 --provenance false -t pigasus-pipeline -f ../pipeline/Dockerfile ..
       docker tag pigasus-pipeline:latest ${aws_ecr_repository.pipeline_ecr.repository_url}:latest
       docker push ${aws_ecr_repository.pipeline_ecr.repository_url}:latest    
     EOT
@@ -69,6 +69,7 @@ resource "aws_lambda_function" "pipeline" {
 
   package_type = "Image"
   image_uri = "${aws_ecr_repository.pipeline_ecr.repository_url}:latest"
+  timeout = 60
 
   depends_on = [
     aws_cloudwatch_log_group.pipeline_log_group,
@@ -0,0 +1,5 @@
+"""Makes the shared database modules importable from every stage's tests."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "database"))
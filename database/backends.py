@@ -0,0 +1,192 @@
+"""Database backends for the pipeline: SQL Server in production and a SQLite
+stand-in so extract, transform, upload and archive can run locally.
+Each backend is a dialect of the statement fragments that differ between them."""
+
+import re
+import sqlite3
+from pathlib import Path
+from datetime import datetime, date
+from decimal import Decimal
+
+import pymssql
+
+SQLITE_SCHEMA = Path(__file__).parent / "sqlite_schema.sql"
+
+DATABASE_ERRORS = (pymssql.Error, sqlite3.Error)
+
+SQLSERVER = {
+    "name": "mssql",
+    "temp_table": "alpha.#{name}",
+    "drop_temp_table": "IF OBJECT_ID('tempdb..#{name}') IS NOT NULL DROP TABLE alpha.#{name};",
+    "truncate": "TRUNCATE TABLE {table};",
+    "lock_hint": "WITH (UPDLOCK, HOLDLOCK)",
+    "use_database": "USE plants;",
+    "now": "CURRENT_TIMESTAMP",
+    "merge_botanists": """
+        MERGE alpha.botanist as target
+        USING {source} as source
+        ON target.phone_number = source.phone_number
+        WHEN MATCHED AND EXISTS (
+            SELECT target.name, target.email EXCEPT SELECT source.name, source.email
+        ) THEN
+            UPDATE SET name = source.name, email = source.email
+        WHEN NOT MATCHED THEN
+            INSERT (name, email, phone_number)
+            VALUES (source.name, source.email, source.phone_number)
+        ;
+        """,
+    "update_botanists": "",
+    "delete_chunk": """
+        WITH chunk AS (
+            SELECT TOP ({limit}) * FROM alpha.reading
+            WHERE {condition}
+            ORDER BY at, reading_id
+        )
+        DELETE FROM chunk;
+        """,
+    "lock_wait_ms": """
+        SELECT COALESCE(SUM(wait_time_ms), 0) AS lock_wait_ms
+        FROM sys.dm_exec_session_wait_stats
+        WHERE session_id = @@SPID AND LEFT(wait_type, 4) = 'LCK_';
+        """
+}
+
+SQLITE = {
+    "name": "sqlite",
+    "temp_table": "temp.{name}",
+    "drop_temp_table": "DROP TABLE IF EXISTS temp.{name};",
+    "truncate": "DELETE FROM {table};",
+    "lock_hint": "",
+    "use_database": "",
+    "now": "datetime('now', 'localtime')",
+    "merge_botanists": """
+        INSERT INTO alpha.botanist (name, email, phone_number)
+        SELECT DISTINCT source.name, source.email, source.phone_number
+        FROM {source} AS source
+        WHERE NOT EXISTS (
+            SELECT 1 FROM alpha.botanist AS target
+            WHERE target.phone_number = source.phone_number
+        );
+        """,
+    "update_botanists": """
+        UPDATE alpha.botanist
+        SET name = source.name, email = source.email
+        FROM {source} AS source
+        WHERE alpha.botanist.phone_number = source.phone_number
+        AND (alpha.botanist.name IS NOT source.name OR alpha.botanist.email IS NOT source.email);
+        """,
+    "delete_chunk": """
+        DELETE FROM alpha.reading
+        WHERE reading_id IN (
+            SELECT reading_id FROM alpha.reading
+            WHERE {condition}
+            ORDER BY at, reading_id
+            LIMIT {limit}
+        );
+        """,
+    "lock_wait_ms": ""
+}
+
+
+def get_dialect(conn: object) -> dict[str, str]:
+    """Returns the statement dialect for a connection; anything that is not
+    a SQLite stand-in is treated as SQL Server."""
+    return SQLITE if getattr(conn, "dialect", None) == "sqlite" else SQLSERVER
+
+
+def to_sqlite_value(value: object) -> object:
+    """Returns a parameter converted to a type sqlite3 stores natively."""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def parse_datetime(value: bytes) -> datetime:
+    """Returns a DATETIME column value read back from SQLite."""
+    return datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_converter("DATETIME", parse_datetime)
+
+
+class SQLiteCursor:
+    """A sqlite3 cursor that accepts the pymssql calling conventions used by
+    the pipeline: %s placeholders, seq_of_parameters and use as a context manager."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def __enter__(self) -> "SQLiteCursor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self._cursor, name)
+
+    def execute(self, sql: str, params: tuple = ()) -> "SQLiteCursor":
+        """Runs one statement, translating placeholders and parameter types."""
+        self._cursor.execute(sql.replace("%s", "?"),
+                             tuple(to_sqlite_value(value) for value in params))
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: list[tuple]) -> "SQLiteCursor":
+        """Runs one statement for each parameter tuple."""
+        self._cursor.executemany(sql.replace("%s", "?"),
+                                 [tuple(to_sqlite_value(value) for value in params)
+                                  for params in seq_of_parameters])
+        return self
+
+
+class SQLiteConnection:
+    """A sqlite3 connection, with the pipeline's tables in an attached database
+    named alpha so the SQL Server table names can be used unchanged."""
+
+    dialect = "sqlite"
+
+    def __init__(self, path: str, as_dict: bool = False):
+        self._conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.execute("ATTACH DATABASE ? AS alpha;", (path,))
+        if as_dict:
+            self._conn.row_factory = lambda cursor, row: {
+                column[0]: value for column, value in zip(cursor.description, row)}
+
+    def cursor(self) -> SQLiteCursor:
+        """Returns a new cursor."""
+        return SQLiteCursor(self._conn.cursor())
+
+    def commit(self) -> None:
+        """Commits the current transaction."""
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        """Rolls back the current transaction."""
+        self._conn.rollback()
+
+    def close(self) -> None:
+        """Closes the connection."""
+        self._conn.close()
+
+
+def connect_sqlite(path: str, as_dict: bool = False) -> SQLiteConnection:
+    """Returns a connection to a SQLite stand-in database, creating its tables if needed."""
+    conn = SQLiteConnection(path, as_dict)
+    create_sqlite_schema(conn)
+    return conn
+
+
+def create_sqlite_schema(conn: SQLiteConnection) -> None:
+    """Creates the SQLite equivalent of the migrated SQL Server schema."""
+    statements = re.split(r";\s*\n", SQLITE_SCHEMA.read_text(encoding="utf-8"))
+    with conn.cursor() as cursor:
+        for statement in statements:
+            if statement.strip():
+                cursor.execute(statement)
+    conn.commit()
@@ -0,0 +1,85 @@
+"""Keeps database connections open across warm Lambda invocations.
+Connections are checked with a cheap query before reuse and reopened if dead."""
+
+# pylint: disable=no-name-in-module
+
+import logging
+from time import perf_counter
+from typing import Callable
+
+from pymssql import Connection
+
+_connections: dict[str, Connection] = {}
+_metrics = {"connects": 0, "connect_seconds": 0.0, "reuses": 0, "reconnects": 0}
+
+
+def ping(conn: Connection) -> bool:
+    """Returns whether the connection can still run a trivial query."""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1;")
+        cursor.fetchall()
+        cursor.close()
+        return True
+    except Exception:  # pylint: disable=broad-exception-caught
+        return False
+
+
+def open_timed(connect: Callable[[], Connection]) -> Connection:
+    """Returns a new connection, recording how long the login took."""
+    start = perf_counter()
+    conn = connect()
+    _metrics["connects"] += 1
+    _metrics["connect_seconds"] += perf_counter() - start
+    return conn
+
+
+def get_pooled_connection(name: str, connect: Callable[[], Connection]) -> Connection:
+    """Returns the live connection kept under name, opening one with connect
+    if there is none or the kept one fails its ping."""
+    conn = _connections.get(name)
+    if conn is not None:
+        if ping(conn):
+            _metrics["reuses"] += 1
+            return conn
+        logging.warning("Pooled connection %s failed its ping, reconnecting.", name)
+        _metrics["reconnects"] += 1
+        discard(name)
+
+    conn = open_timed(connect)
+    _connections[name] = conn
+    return conn
+
+
+def discard(name: str, only: Connection | None = None) -> None:
+    """Closes and forgets the connection kept under name, if any.
+    Given only, the kept connection is left alone unless it is that connection."""
+    if only is not None and _connections.get(name) is not only:
+        return
+    conn = _connections.pop(name, None)
+    if conn is None:
+        return
+    try:
+        conn.close()
+    except Exception:  # pylint: disable=broad-exception-caught
+        logging.warning("Could not close pooled connection %s.", name)
+
+
+def close_all() -> None:
+    """Closes every kept connection."""
+    for name in list(_connections):
+        discard(name)
+
+
+def connection_metrics() -> dict[str, float]:
+    """Returns connect count, total and mean connect time, reuse and reconnect counts."""
+    connects = _metrics["connects"]
+    return {
+        **_metrics,
+        "mean_connect_seconds": _metrics["connect_seconds"] / connects if connects else 0.0
+    }
+
+
+def reset_metrics() -> None:
+    """Zeroes the connection metrics."""
+    _metrics.update({"connects": 0, "connect_seconds": 0.0, "reuses": 0, "reconnects": 0})
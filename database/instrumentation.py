@@ -0,0 +1,144 @@
+"""Statement-level timing and round-trip accounting for database connections.
+Wrapping a connection records latency, round-trips and rows affected for every
+statement, grouped by statement template, without changing how it is used."""
+
+import re
+import logging
+from os import environ
+from collections import Counter
+from time import perf_counter
+
+SLOW_STATEMENT_SECONDS = float(environ.get("SLOW_STATEMENT_SECONDS", "inf"))
+
+_stats: dict[str, dict[str, float]] = {}
+
+
+def statement_template(sql: str) -> str:
+    """Returns the statement with whitespace collapsed and repeated
+    placeholder groups, such as multi-row VALUES and IN lists, folded to one."""
+    template = " ".join(sql.split())
+    template = re.sub(r"%s(, %s)+", "%s, ...", template)
+    template = re.sub(r"\(%s, \.\.\.\)(, \(%s, \.\.\.\))+", "(%s, ...), ...", template)
+    template = re.sub(r"\(%s\)(, \(%s\))+", "(%s), ...", template)
+    return template
+
+
+def parameter_shape(params: tuple | None) -> str:
+    """Returns how many parameters were bound and their types, never their values."""
+    if not params:
+        return "no params"
+    types = Counter(type(value).__name__ for value in params)
+    counts = ", ".join(f"{name} x{count}" for name, count in types.items())
+    return f"{len(params)} params ({counts})"
+
+
+def record(template: str, seconds: float, round_trips: int, rows: int,
+           params: tuple | None = None) -> None:
+    """Adds one statement's timing to its template's totals, logging it if slow."""
+    stats = _stats.setdefault(template, {"statements": 0, "round_trips": 0, "rows": 0,
+                                         "total_seconds": 0.0, "max_seconds": 0.0})
+    stats["statements"] += 1
+    stats["round_trips"] += round_trips
+    stats["rows"] += max(rows, 0)
+    stats["total_seconds"] += seconds
+    stats["max_seconds"] = max(stats["max_seconds"], seconds)
+    if seconds >= SLOW_STATEMENT_SECONDS:
+        logging.warning("Slow statement (%.3fs, %s): %s",
+                        seconds, parameter_shape(params), template)
+
+
+class InstrumentedCursor:
+    """A cursor that records every statement it runs."""
+
+    def __init__(self, cursor: object):
+        self._cursor = cursor
+
+    def __enter__(self) -> "InstrumentedCursor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._cursor.close()
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self._cursor, name)
+
+    def execute(self, sql: str, params: tuple | None = None) -> object:
+        """Runs and times one statement."""
+        start = perf_counter()
+        if params is None:
+            result = self._cursor.execute(sql)
+        else:
+            result = self._cursor.execute(sql, params)
+        record(statement_template(sql), perf_counter() - start, 1,
+               self._cursor.rowcount, params)
+        return result
+
+    def executemany(self, sql: str, seq_of_parameters: list[tuple]) -> object:
+        """Runs and times one statement per parameter tuple, counting each as a round-trip."""
+        start = perf_counter()
+        result = self._cursor.executemany(sql, seq_of_parameters=seq_of_parameters)
+        record(statement_template(sql), perf_counter() - start, len(seq_of_parameters),
+               self._cursor.rowcount, seq_of_parameters[0] if seq_of_parameters else None)
+        return result
+
+
+class InstrumentedConnection:
+    """A connection whose cursors, commits and rollbacks are recorded."""
+
+    def __init__(self, conn: object):
+        self._conn = conn
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self._conn, name)
+
+    def cursor(self) -> InstrumentedCursor:
+        """Returns an instrumented cursor."""
+        return InstrumentedCursor(self._conn.cursor())
+
+    def commit(self) -> None:
+        """Commits, recording the round-trip."""
+        start = perf_counter()
+        self._conn.commit()
+        record("COMMIT", perf_counter() - start, 1, 0)
+
+    def rollback(self) -> None:
+        """Rolls back, recording the round-trip."""
+        start = perf_counter()
+        self._conn.rollback()
+        record("ROLLBACK", perf_counter() - start, 1, 0)
+
+
+def instrument(conn: object) -> InstrumentedConnection:
+    """Returns the connection wrapped so its statements are recorded."""
+    if isinstance(conn, InstrumentedConnection):
+        return conn
+    return InstrumentedConnection(conn)
+
+
+def unwrap(conn: object) -> object:
+    """Returns the connection underneath an instrumented one, or conn itself."""
+    if isinstance(conn, InstrumentedConnection):
+        return conn._conn  # pylint: disable=protected-access
+    return conn
+
+
+def run_summary() -> dict[str, dict[str, float]]:
+    """Returns the totals recorded per statement template since the last reset."""
+    return {template: dict(stats) for template, stats in _stats.items()}
+
+
+def summary_lines() -> list[str]:
+    """Returns a line per statement template with its time, round-trips and rows,
+    slowest first, after a line with the run's totals."""
+    summary = sorted(_stats.items(), key=lambda item: item[1]["total_seconds"], reverse=True)
+    lines = [f"{sum(stats['round_trips'] for _, stats in summary)} round-trips "
+             f"across {len(summary)} statement templates."]
+    for template, stats in summary:
+        lines.append(f"{stats['total_seconds']:.3f}s total, {stats['max_seconds']:.3f}s max, "
+                     f"{stats['round_trips']} round-trips, {stats['rows']} rows: {template[:200]}")
+    return lines
+
+
+def reset() -> None:
+    """Clears the recorded statement totals."""
+    _stats.clear()
@@ -0,0 +1,191 @@
+"""Applies the versioned schema migrations in database/migrations in order,
+recording each in alpha.schema_migration so the schema evolves in place."""
+
+# pylint: disable=no-member
+
+import re
+import hashlib
+import logging
+from os import environ
+from pathlib import Path
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import pymssql
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+MIGRATION_NAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+BATCH_SEPARATOR = re.compile(r"^\s*GO\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def main() -> None:
+    """Migrates the database named in the environment, optionally checking index usage."""
+    parser = ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--baseline", type=int,
+                        help="mark migrations up to this version as applied without running them")
+    parser.add_argument("--check-indexes", action="store_true",
+                        help="report whether each query-supporting index is used")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    conn = get_connection()
+    if args.baseline:
+        baseline(conn, args.baseline)
+    migrate(conn)
+    if args.check_indexes:
+        for index, result in check_index_usage(conn).items():
+            logging.info("%s used: %s (%.3fs)", index, result["used"], result["seconds"])
+    conn.close()
+
+
+def get_connection() -> pymssql.Connection:
+    """Returns a connection to the database named in the environment."""
+    return pymssql.connect(
+        server=environ["DB_HOST"],
+        port=int(environ["DB_PORT"]),
+        user=environ["DB_USER"],
+        password=environ["DB_PASSWORD"],
+        database=environ["DB_NAME"]
+    )
+
+
+def list_migrations(directory: Path = MIGRATIONS_DIR) -> list[tuple[int, str, Path]]:
+    """Returns (version, name, path) for each migration script, ordered by version."""
+    migrations = []
+    for path in directory.glob("*.sql"):
+        match = MIGRATION_NAME.match(path.name)
+        if not match:
+            raise ValueError(f"Badly named migration: {path.name}")
+        migrations.append((int(match.group(1)), match.group(2), path))
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Duplicate migration versions.")
+    return sorted(migrations)
+
+
+def checksum(path: Path) -> str:
+    """Returns the sha256 of a migration script."""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def split_batches(sql: str) -> list[str]:
+    """Returns the script split into batches on lines containing only GO."""
+    return [batch.strip() for batch in BATCH_SEPARATOR.split(sql) if batch.strip()]
+
+
+def ensure_migration_table(conn: pymssql.Connection) -> None:
+    """Creates the migration tracking table if it does not exist."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            IF OBJECT_ID('alpha.schema_migration') IS NULL
+            CREATE TABLE alpha.schema_migration (
+                version INT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                checksum CHAR(64) NOT NULL,
+                applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+    conn.commit()
+
+
+def applied_migrations(conn: pymssql.Connection) -> dict[int, str]:
+    """Returns the checksum of every applied migration, keyed by version."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT version, checksum FROM alpha.schema_migration;")
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def record_migration(cursor: pymssql.Cursor, version: int, name: str, path: Path) -> None:
+    """Adds a migration to the tracking table."""
+    cursor.execute(
+        "INSERT INTO alpha.schema_migration (version, name, checksum) VALUES (%s, %s, %s);",
+        (version, name, checksum(path)))
+
+
+def apply_migration(conn: pymssql.Connection, version: int, name: str, path: Path) -> None:
+    """Runs every batch of one migration and records it, all in one transaction."""
+    try:
+        with conn.cursor() as cursor:
+            for batch in split_batches(path.read_text(encoding="utf-8")):
+                cursor.execute(batch)
+            record_migration(cursor, version, name, path)
+        conn.commit()
+    except pymssql.Error:
+        conn.rollback()
+        raise
+    logging.info("Applied migration %04d_%s.", version, name)
+
+
+def migrate(conn: pymssql.Connection, directory: Path = MIGRATIONS_DIR) -> list[int]:
+    """Applies every pending migration in version order, returning the versions applied.
+    Raises ValueError if an applied migration's script has since been edited."""
+    ensure_migration_table(conn)
+    applied = applied_migrations(conn)
+
+    newly_applied = []
+    for version, name, path in list_migrations(directory):
+        if version in applied:
+            if applied[version].strip() != checksum(path):
+                raise ValueError(f"Migration {version:04d}_{name} changed after being applied.")
+            continue
+        apply_migration(conn, version, name, path)
+        newly_applied.append(version)
+    return newly_applied
+
+
+def baseline(conn: pymssql.Connection, up_to: int, directory: Path = MIGRATIONS_DIR) -> None:
+    """Marks migrations up to a version as applied, for databases built before migrations."""
+    ensure_migration_table(conn)
+    applied = applied_migrations(conn)
+    with conn.cursor() as cursor:
+        for version, name, path in list_migrations(directory):
+            if version <= up_to and version not in applied:
+                record_migration(cursor, version, name, path)
+    conn.commit()
+
+
+def index_checks() -> dict[str, tuple[str, tuple]]:
+    """Returns, per index, a representative query for the access path it supports."""
+    now = datetime.now()
+    return {
+        "ix_reading_at": (
+            "SELECT reading_id, plant_id, soil_moisture, temperature, at, botanist_id, "
+            "last_watered FROM alpha.reading WHERE at >= %s AND at < %s;",
+            (now - timedelta(hours=25), now - timedelta(hours=24))),
+        "ux_reading_plant_at": (
+            "SELECT soil_moisture, temperature, at FROM alpha.reading "
+            "WHERE plant_id = %s AND at >= %s;",
+            (1, now - timedelta(hours=1))),
+        "ix_location_lat_long_region": (
+            "SELECT location_id FROM alpha.location "
+            "WHERE latitude = %s AND longitude = %s AND region_id = %s;",
+            (0, 0, 1))
+    }
+
+
+def check_index_usage(conn: pymssql.Connection) -> dict[str, dict[str, float | bool]]:
+    """Returns, per index, whether the estimated plan of its query uses it
+    and how long the query took to run."""
+    results = {}
+    with conn.cursor() as cursor:
+        for index, (query, params) in index_checks().items():
+            cursor.execute("SET SHOWPLAN_XML ON;")
+            cursor.execute(query, params)
+            plan = "".join(str(row[0]) for row in cursor.fetchall())
+            cursor.execute("SET SHOWPLAN_XML OFF;")
+
+            start = perf_counter()
+            cursor.execute(query, params)
+            cursor.fetchall()
+            results[index] = {"used": f'Index="[{index}]"' in plan,
+                              "seconds": perf_counter() - start}
+    return results
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
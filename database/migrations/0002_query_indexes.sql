@@ -0,0 +1,10 @@
+-- Covers the archive's time-window scans on reading.at
+CREATE NONCLUSTERED INDEX ix_reading_at
+    ON alpha.reading (at)
+    INCLUDE (plant_id, soil_moisture, temperature, botanist_id, last_watered);
+GO
+
+-- Supports location matching when uploading new plants
+CREATE NONCLUSTERED INDEX ix_location_lat_long_region
+    ON alpha.location (latitude, longitude, region_id);
+GO
@@ -0,0 +1,74 @@
+-- Partitions alpha.reading by the hour of its reading time so expired hours
+-- can be switched out to alpha.reading_expired and truncated, rather than deleted
+-- row by row. Boundaries start 48 hours back; anything older shares the first
+-- partition and is switched out on the next archive run.
+DECLARE @start DATETIME = DATEADD(HOUR, DATEDIFF(HOUR, 0, CURRENT_TIMESTAMP) - 48, 0);
+DECLARE @boundaries NVARCHAR(MAX) = N'';
+DECLARE @hour INT = 0;
+WHILE @hour <= 96
+BEGIN
+    SET @boundaries += CASE WHEN @hour > 0 THEN N', ' ELSE N'' END
+        + N'''' + CONVERT(NVARCHAR(19), DATEADD(HOUR, @hour, @start), 126) + N'''';
+    SET @hour += 1;
+END;
+EXEC (N'CREATE PARTITION FUNCTION pf_reading_hour (DATETIME) AS RANGE RIGHT FOR VALUES ('
+    + @boundaries + N');');
+GO
+
+CREATE PARTITION SCHEME ps_reading_hour AS PARTITION pf_reading_hour ALL TO ([PRIMARY]);
+GO
+
+-- Partition switching needs every index aligned on at, so the clustered key
+-- becomes (at, reading_id)
+CREATE TABLE alpha.reading_partitioned (
+    reading_id INT IDENTITY(1,1) NOT NULL,
+    plant_id INT NOT NULL,
+    soil_moisture DECIMAL NOT NULL,
+    temperature DECIMAL NOT NULL,
+    at DATETIME NOT NULL,
+    botanist_id SMALLINT NOT NULL,
+    last_watered DATETIME NOT NULL,
+    FOREIGN KEY (botanist_id) REFERENCES alpha.botanist(botanist_id),
+    FOREIGN KEY (plant_id) REFERENCES alpha.plant(plant_id),
+    CONSTRAINT pk_reading PRIMARY KEY CLUSTERED (at, reading_id)
+) ON ps_reading_hour (at);
+GO
+
+SET IDENTITY_INSERT alpha.reading_partitioned ON;
+INSERT INTO alpha.reading_partitioned
+    (reading_id, plant_id, soil_moisture, temperature, at, botanist_id, last_watered)
+SELECT reading_id, plant_id, soil_moisture, temperature, at, botanist_id, last_watered
+FROM alpha.reading;
+SET IDENTITY_INSERT alpha.reading_partitioned OFF;
+GO
+
+DROP TABLE alpha.reading;
+GO
+
+EXEC sp_rename 'alpha.reading_partitioned', 'reading';
+GO
+
+CREATE NONCLUSTERED INDEX ix_reading_at
+    ON alpha.reading (at)
+    INCLUDE (plant_id, soil_moisture, temperature, botanist_id, last_watered)
+    ON ps_reading_hour (at);
+GO
+
+-- Switch target for expired partitions; its columns and indexes must match
+-- alpha.reading exactly
+CREATE TABLE alpha.reading_expired (
+    reading_id INT IDENTITY(1,1) NOT NULL,
+    plant_id INT NOT NULL,
+    soil_moisture DECIMAL NOT NULL,
+    temperature DECIMAL NOT NULL,
+    at DATETIME NOT NULL,
+    botanist_id SMALLINT NOT NULL,
+    last_watered DATETIME NOT NULL,
+    CONSTRAINT pk_reading_expired PRIMARY KEY CLUSTERED (at, reading_id)
+) ON [PRIMARY];
+GO
+
+CREATE NONCLUSTERED INDEX ix_reading_expired_at
+    ON alpha.reading_expired (at)
+    INCLUDE (plant_id, soil_moisture, temperature, botanist_id, last_watered);
+GO
@@ -0,0 +1,8 @@
+-- High-water mark of the readings each archive job has exported and expired,
+-- so every run works on the slice between it and a single cutoff
+CREATE TABLE alpha.archive_watermark (
+    job VARCHAR(30) PRIMARY KEY,
+    archived_until DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+GO
@@ -0,0 +1,34 @@
+-- Makes (plant_id, at) unique so a retried upload cannot store a reading twice.
+-- Databases built from an earlier schema.sql may carry it as a constraint;
+-- that is replaced by the covering, partition-aligned index below.
+IF OBJECT_ID('alpha.uq_reading_plant_at', 'UQ') IS NOT NULL
+    ALTER TABLE alpha.reading DROP CONSTRAINT uq_reading_plant_at;
+GO
+
+-- Readings stored twice by retried uploads before the key existed would stop
+-- the index being built; the earliest copy of each is kept
+WITH copies AS (
+    SELECT ROW_NUMBER() OVER (PARTITION BY plant_id, at ORDER BY reading_id) AS copy
+    FROM alpha.reading
+)
+DELETE FROM copies WHERE copy > 1;
+GO
+
+WITH copies AS (
+    SELECT ROW_NUMBER() OVER (PARTITION BY plant_id, at ORDER BY reading_id) AS copy
+    FROM alpha.reading_expired
+)
+DELETE FROM copies WHERE copy > 1;
+GO
+
+CREATE UNIQUE NONCLUSTERED INDEX ux_reading_plant_at
+    ON alpha.reading (plant_id, at)
+    INCLUDE (soil_moisture, temperature, botanist_id, last_watered)
+    ON ps_reading_hour (at);
+GO
+
+-- The switch target's indexes must match alpha.reading exactly
+CREATE UNIQUE NONCLUSTERED INDEX ux_reading_expired_plant_at
+    ON alpha.reading_expired (plant_id, at)
+    INCLUDE (soil_moisture, temperature, botanist_id, last_watered);
+GO
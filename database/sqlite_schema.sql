@@ -0,0 +1,71 @@
+CREATE TABLE IF NOT EXISTS alpha.botanist (
+    botanist_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email VARCHAR(20),
+    name VARCHAR(20) NOT NULL,
+    phone_number VARCHAR(20) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alpha.country (
+    country_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    country_code VARCHAR(2) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alpha.region (
+    region_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    region_name VARCHAR(20),
+    country_id SMALLINT REFERENCES country(country_id)
+);
+
+CREATE TABLE IF NOT EXISTS alpha.location (
+    location_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    latitude DECIMAL NOT NULL,
+    longitude DECIMAL NOT NULL,
+    region_id INT NOT NULL REFERENCES region(region_id)
+);
+
+CREATE TABLE IF NOT EXISTS alpha.license (
+    license_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    license_name TEXT NOT NULL,
+    license_url TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alpha.image (
+    image_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    license_id SMALLINT REFERENCES license(license_id),
+    original_url TEXT NOT NULL,
+    medium_url TEXT,
+    small_url TEXT,
+    regular_url TEXT,
+    thumbnail_url TEXT
+);
+
+CREATE TABLE IF NOT EXISTS alpha.plant (
+    plant_id INTEGER PRIMARY KEY,
+    location_id INT NOT NULL REFERENCES location(location_id),
+    scientific_name VARCHAR(30),
+    image_id INT REFERENCES image(image_id),
+    common_name VARCHAR(30) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alpha.reading (
+    reading_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plant_id INT NOT NULL REFERENCES plant(plant_id),
+    soil_moisture DECIMAL NOT NULL,
+    temperature DECIMAL NOT NULL,
+    at DATETIME NOT NULL,
+    botanist_id SMALLINT NOT NULL REFERENCES botanist(botanist_id),
+    last_watered DATETIME NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS alpha.ix_reading_at ON reading (at);
+
+CREATE UNIQUE INDEX IF NOT EXISTS alpha.ux_reading_plant_at ON reading (plant_id, at);
+
+CREATE INDEX IF NOT EXISTS alpha.ix_location_lat_long_region
+    ON location (latitude, longitude, region_id);
+
+CREATE TABLE IF NOT EXISTS alpha.archive_watermark (
+    job VARCHAR(30) PRIMARY KEY,
+    archived_until DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
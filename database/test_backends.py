@@ -0,0 +1,67 @@
+"""Tests for the database backends."""
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+import numpy as np
+import pytest
+
+from backends import get_dialect, connect_sqlite, to_sqlite_value, SQLITE, SQLSERVER
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / "plants.sqlite")
+
+
+def test_get_dialect_sqlite(sqlite_path):
+    assert get_dialect(connect_sqlite(sqlite_path)) is SQLITE
+
+
+def test_get_dialect_defaults_to_sql_server():
+    assert get_dialect(MagicMock()) is SQLSERVER
+
+
+def test_dialects_define_same_fragments():
+    assert SQLITE.keys() == SQLSERVER.keys()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (datetime(2025, 2, 6, 12, 30, 1), "2025-02-06 12:30:01"),
+    (Decimal("1.5"), 1.5),
+    (np.int64(3), 3),
+    ("text", "text")
+])
+def test_to_sqlite_value(value, expected):
+    assert to_sqlite_value(value) == expected
+
+
+def test_sqlite_schema_uses_alpha_names(sqlite_path):
+    conn = connect_sqlite(sqlite_path)
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO alpha.botanist (name, email, phone_number) VALUES (%s, %s, %s);",
+                       ("Carl", "carl@example.com", "123"))
+        cursor.execute("SELECT botanist_id, phone_number FROM alpha.botanist;")
+        assert cursor.fetchall() == [(1, "123")]
+
+
+def test_sqlite_datetimes_round_trip(sqlite_path):
+    conn = connect_sqlite(sqlite_path, as_dict=True)
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE TABLE temp.t (at DATETIME);")
+        cursor.execute("INSERT INTO temp.t VALUES (%s);", (datetime(2025, 2, 6, 12, 0),))
+        cursor.execute("SELECT at FROM temp.t;")
+        assert cursor.fetchall() == [{"at": datetime(2025, 2, 6, 12, 0)}]
+
+
+def test_sqlite_executemany_accepts_keyword(sqlite_path):
+    conn = connect_sqlite(sqlite_path)
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE TABLE temp.t (x INT);")
+        cursor.executemany("INSERT INTO temp.t VALUES (%s);", seq_of_parameters=[(1,), (2,)])
+        cursor.execute("SELECT COUNT(*) FROM temp.t;")
+        assert cursor.fetchone() == (2,)
+
+
+def test_connect_sqlite_is_repeatable(sqlite_path):
+    connect_sqlite(sqlite_path).close()
+    connect_sqlite(sqlite_path).close()
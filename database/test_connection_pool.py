@@ -0,0 +1,83 @@
+"""Tests for the shared connection pool."""
+from unittest.mock import MagicMock
+import pytest
+
+import connection_pool
+from connection_pool import (
+    ping, get_pooled_connection, discard, close_all, connection_metrics, reset_metrics
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_pool():
+    """Starts every test with no kept connections and zeroed metrics."""
+    close_all()
+    reset_metrics()
+    yield
+    close_all()
+
+
+def test_ping_healthy_connection():
+    assert ping(MagicMock())
+
+
+def test_ping_dead_connection():
+    conn = MagicMock()
+    conn.cursor.return_value.execute.side_effect = OSError("connection reset")
+    assert not ping(conn)
+
+
+def test_connection_reused():
+    connect = MagicMock()
+
+    first = get_pooled_connection("test", connect)
+    second = get_pooled_connection("test", connect)
+
+    assert first is second
+    connect.assert_called_once()
+    assert connection_metrics()["reuses"] == 1
+
+
+def test_dead_connection_replaced():
+    dead, fresh = MagicMock(), MagicMock()
+    dead.cursor.return_value.execute.side_effect = OSError("connection reset")
+    connect = MagicMock(side_effect=[dead, fresh])
+
+    get_pooled_connection("test", connect)
+    conn = get_pooled_connection("test", connect)
+
+    assert conn is fresh
+    dead.close.assert_called_once()
+    assert connection_metrics()["reconnects"] == 1
+
+
+def test_connections_kept_per_name():
+    connect = MagicMock(side_effect=[MagicMock(), MagicMock()])
+    assert get_pooled_connection("a", connect) is not get_pooled_connection("b", connect)
+
+
+def test_connect_time_recorded():
+    get_pooled_connection("test", MagicMock())
+    metrics = connection_metrics()
+    assert metrics["connects"] == 1
+    assert metrics["mean_connect_seconds"] >= 0
+
+
+def test_discard_closes_connection():
+    conn = MagicMock()
+    get_pooled_connection("test", MagicMock(return_value=conn))
+
+    discard("test")
+
+    conn.close.assert_called_once()
+    assert "test" not in connection_pool._connections
+
+
+def test_discard_leaves_other_connection_kept():
+    conn = MagicMock()
+    get_pooled_connection("test", MagicMock(return_value=conn))
+
+    discard("test", only=MagicMock())
+
+    conn.close.assert_not_called()
+    assert connection_pool._connections["test"] is conn
@@ -0,0 +1,104 @@
+"""Tests for statement instrumentation."""
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+import pytest
+
+import instrumentation
+from instrumentation import (
+    statement_template, parameter_shape, instrument, run_summary, summary_lines, reset
+)
+from backends import connect_sqlite, get_dialect, SQLITE
+
+
+@pytest.fixture(autouse=True)
+def empty_stats():
+    """Starts every test with nothing recorded."""
+    reset()
+    yield
+    reset()
+
+
+def test_statement_template_collapses_whitespace():
+    assert statement_template("SELECT 1\n        FROM   alpha.plant;") == \
+        "SELECT 1 FROM alpha.plant;"
+
+
+def test_statement_template_folds_values_rows():
+    two_rows = "INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s);"
+    three_rows = "INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s);"
+    assert statement_template(two_rows) == statement_template(three_rows) == \
+        "INSERT INTO t (a, b) VALUES (%s, ...), ...;"
+
+
+def test_statement_template_folds_in_list():
+    assert statement_template("SELECT id FROM t WHERE id IN (%s, %s, %s);") == \
+        "SELECT id FROM t WHERE id IN (%s, ...);"
+
+
+def test_parameter_shape_has_no_values():
+    shape = parameter_shape((1, 2, "secret", datetime(2025, 2, 6)))
+    assert shape == "4 params (int x2, str x1, datetime x1)"
+    assert "secret" not in shape
+
+
+def test_parameter_shape_empty():
+    assert parameter_shape(None) == "no params"
+
+
+def test_statements_grouped_by_template():
+    conn = instrument(MagicMock())
+    conn._conn.cursor.return_value.rowcount = 2
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO t VALUES (%s), (%s);", (1, 2))
+        cursor.execute("INSERT INTO t VALUES (%s), (%s), (%s);", (1, 2, 3))
+    conn.commit()
+
+    summary = run_summary()
+    assert summary["INSERT INTO t VALUES (%s), ...;"]["statements"] == 2
+    assert summary["INSERT INTO t VALUES (%s), ...;"]["rows"] == 4
+    assert summary["COMMIT"]["round_trips"] == 1
+
+
+def test_executemany_counts_round_trip_per_row():
+    conn = instrument(MagicMock())
+    conn._conn.cursor.return_value.rowcount = 3
+    with conn.cursor() as cursor:
+        cursor.executemany("INSERT INTO t VALUES (%s);", seq_of_parameters=[(1,), (2,), (3,)])
+    assert run_summary()["INSERT INTO t VALUES (%s);"]["round_trips"] == 3
+
+
+def test_unknown_rowcount_not_counted():
+    conn = instrument(MagicMock())
+    conn._conn.cursor.return_value.rowcount = -1
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1;")
+    assert run_summary()["SELECT 1;"]["rows"] == 0
+
+
+def test_instrument_is_idempotent():
+    conn = instrument(MagicMock())
+    assert instrument(conn) is conn
+
+
+def test_instrumented_sqlite_keeps_dialect(tmp_path):
+    conn = instrument(connect_sqlite(str(tmp_path / "plants.sqlite")))
+    assert get_dialect(conn) is SQLITE
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM alpha.plant WHERE plant_id IN (%s, %s);", (1, 2))
+        assert cursor.fetchone() == (0,)
+    assert "SELECT COUNT(*) FROM alpha.plant WHERE plant_id IN (%s, ...);" in run_summary()
+
+
+def test_summary_lines_slowest_first():
+    instrumentation.record("SELECT 1;", 0.1, 1, 0)
+    instrumentation.record("SELECT 2;", 0.5, 1, 0)
+    lines = summary_lines()
+    assert lines[0] == "2 round-trips across 2 statement templates."
+    assert lines[1].endswith("SELECT 2;")
+
+
+def test_slow_statement_logged_with_shape(caplog):
+    with patch.object(instrumentation, "SLOW_STATEMENT_SECONDS", 0):
+        instrumentation.record("SELECT %s;", 0.2, 1, 0, ("secret",))
+    assert "1 params (str x1)" in caplog.text
+    assert "secret" not in caplog.text
@@ -0,0 +1,100 @@
+"""Tests for the schema migration runner."""
+from unittest.mock import MagicMock
+import pytest
+
+from migrate import (
+    list_migrations, split_batches, checksum, migrate, baseline, check_index_usage,
+    MIGRATIONS_DIR
+)
+
+
+@pytest.fixture
+def migrations_dir(tmp_path):
+    (tmp_path / "0001_first.sql").write_text("CREATE TABLE a (x INT);\nGO\nCREATE TABLE b (y INT);")
+    (tmp_path / "0002_second.sql").write_text("CREATE INDEX ix ON a (x);")
+    return tmp_path
+
+
+def mock_connection(applied: list) -> tuple[MagicMock, MagicMock]:
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = applied
+    return conn, cursor
+
+
+def test_list_migrations_ordered(migrations_dir):
+    assert [(v, n) for v, n, _ in list_migrations(migrations_dir)] == [(1, "first"), (2, "second")]
+
+
+def test_list_migrations_rejects_bad_name(migrations_dir):
+    (migrations_dir / "third.sql").write_text("")
+    with pytest.raises(ValueError):
+        list_migrations(migrations_dir)
+
+
+def test_list_migrations_rejects_duplicate_version(migrations_dir):
+    (migrations_dir / "0002_again.sql").write_text("")
+    with pytest.raises(ValueError):
+        list_migrations(migrations_dir)
+
+
+def test_repository_migrations_are_valid():
+    versions = [version for version, _, _ in list_migrations(MIGRATIONS_DIR)]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_reading_natural_key_is_built_after_removing_duplicates():
+    path = next(path for _, name, path in list_migrations(MIGRATIONS_DIR)
+                if name == "reading_natural_key")
+    batches = split_batches(path.read_text(encoding="utf-8"))
+
+    assert "IF OBJECT_ID('alpha.uq_reading_plant_at', 'UQ') IS NOT NULL\n" \
+        "    ALTER TABLE alpha.reading DROP CONSTRAINT" in batches[0]
+    first_index = next(index for index, batch in enumerate(batches) if "CREATE UNIQUE" in batch)
+    assert all("DELETE FROM copies" in batch for batch in batches[1:first_index])
+    assert first_index == 3
+
+
+def test_split_batches():
+    assert split_batches("SELECT 1;\nGO\n\nSELECT 2;\n go \n") == ["SELECT 1;", "SELECT 2;"]
+
+
+def test_migrate_applies_pending_in_order(migrations_dir):
+    conn, cursor = mock_connection([])
+
+    applied = migrate(conn, migrations_dir)
+
+    executed = [call.args[0] for call in cursor.execute.call_args_list]
+    assert applied == [1, 2]
+    assert executed.index("CREATE TABLE b (y INT);") < executed.index("CREATE INDEX ix ON a (x);")
+
+
+def test_migrate_skips_applied(migrations_dir):
+    conn, _ = mock_connection([(1, checksum(migrations_dir / "0001_first.sql"))])
+    assert migrate(conn, migrations_dir) == [2]
+
+
+def test_migrate_rejects_edited_migration(migrations_dir):
+    conn, _ = mock_connection([(1, "0" * 64)])
+    with pytest.raises(ValueError):
+        migrate(conn, migrations_dir)
+
+
+def test_baseline_records_without_running(migrations_dir):
+    conn, cursor = mock_connection([])
+
+    baseline(conn, 1, migrations_dir)
+
+    executed = [call.args[0] for call in cursor.execute.call_args_list]
+    assert not any(sql.startswith("CREATE TABLE a") for sql in executed)
+    assert sum("INSERT INTO alpha.schema_migration" in sql for sql in executed) == 1
+
+
+def test_check_index_usage_reads_plan():
+    conn, cursor = mock_connection([])
+    cursor.fetchall.return_value = [('<Object Index="[ix_reading_at]" />',)]
+
+    results = check_index_usage(conn)
+
+    assert results["ix_reading_at"]["used"]
+    assert not results["ux_reading_plant_at"]["used"]
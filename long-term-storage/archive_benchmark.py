@@ -0,0 +1,147 @@
+"""Benchmarks the parquet archive against the SQLite archive on moto: the same
+simulated readings are archived both ways, then point lookups and range scans
+are run cold against each, counting the S3 requests and bytes they need.
+SQLite's requests include the listings sqlite-s3vfs makes to size the file."""
+
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from time import perf_counter
+from collections.abc import Callable
+
+import moto
+import boto3
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from boto3 import client
+from reading_factory import make_readings
+from archive_layout import PartitionedWriter, new_run_id, s3_partition_opener
+from archive_format import READING_SCHEMA, reading_batch, writer_options
+from archive_catalog import update_catalog, writer_stats
+from query_archive import ArchiveReader, RowGroupCache
+from sqlite_archive import SQLiteArchive, COLUMNS
+
+PAGE_SIZES = (4096, 65536)
+BENCHMARK_START = datetime(2025, 2, 1)
+
+
+class RequestCounter:
+    """Counts the requests an S3 client makes and the object bytes they return."""
+
+    def __init__(self, s3_client: client):
+        self.requests = 0
+        self.bytes = 0
+        s3_client.meta.events.register("after-call.s3", self.count)
+
+    def count(self, parsed: dict, **_) -> None:
+        """Records one response."""
+        self.requests += 1
+        self.bytes += parsed.get("ContentLength", 0)
+
+    def measure(self, query: Callable[[], object]) -> dict:
+        """Returns the rows a query found, with its seconds, requests and bytes."""
+        requests, fetched, start = self.requests, self.bytes, perf_counter()
+        result = query()
+        rows = result if isinstance(result, int) else 0 if result is None \
+            else 1 if isinstance(result, dict) else len(result)
+        return {"rows": rows, "seconds": perf_counter() - start,
+                "requests": self.requests - requests, "bytes": self.bytes - fetched}
+
+
+def simulated_readings(plants: int, hours: int) -> pd.DataFrame:
+    """Returns a reading a minute from each plant for the given hours."""
+    readings = make_readings(range(1, plants + 1), range(hours * 60), BENCHMARK_START)
+    rng = np.random.default_rng(0)
+    return readings.assign(soil_moisture=rng.uniform(10, 40, len(readings)).round(2),
+                           temperature=rng.uniform(5, 25, len(readings)).round(2),
+                           botanist_id=readings["plant_id"] % 3 + 1,
+                           last_watered=readings["at"].dt.floor("12h"))
+
+
+def archive_parquet(s3_client: client, bucket: str, readings: pd.DataFrame) -> int:
+    """Archives readings in the tuned, partitioned parquet layout, as the
+    archive job does, and returns how many there were."""
+    with PartitionedWriter(s3_partition_opener(s3_client, bucket, new_run_id()),
+                           READING_SCHEMA, **writer_options()) as writer:
+        writer.write_batch(reading_batch(readings))
+    update_catalog(s3_client, bucket, writer_stats(writer))
+    return len(readings)
+
+
+def archive_sqlite(s3_client: client, bucket: str, readings: pd.DataFrame,
+                   page_size: int) -> int:
+    """Archives readings in a SQLite archive with the given page size and
+    returns how many there were."""
+    with SQLiteArchive(s3_client, bucket, f"sqlite/readings-{page_size}.sqlite",
+                       page_size) as archive:
+        return archive.append([pa.RecordBatch.from_pandas(readings[COLUMNS],
+                                                          preserve_index=False)])
+
+
+def queries(readings: pd.DataFrame, lookups: int) -> list[tuple[str, int, datetime, datetime]]:
+    """Returns sample queries as (name, plant id or None, start, end): a point
+    lookup, a plant's readings over a day and every plant's readings over an hour."""
+    sample = readings.sample(lookups, random_state=0)
+    return [query for plant_id, at in zip(sample["plant_id"], sample["at"]) for query in (
+        ("point lookup", plant_id, at, at + timedelta(seconds=1)),
+        ("plant day scan", plant_id, at.floor("D"), at.floor("D") + timedelta(days=1)),
+        ("hour scan", None, at.floor("h"), at.floor("h") + timedelta(hours=1)))]
+
+
+def run_query(s3_client: client, bucket: str, backend: str,
+              query: tuple[str, int, datetime, datetime]) -> object:
+    """Runs a query cold on a backend, with a new reader and an empty cache."""
+    name, plant_id, start, end = query
+    plant_ids = None if plant_id is None else [plant_id]
+    if backend == "parquet":
+        with TemporaryDirectory() as directory:
+            return ArchiveReader(s3_client, bucket, RowGroupCache(directory)).readings(
+                start, end, plant_ids=plant_ids)
+    page_size = int(backend.rsplit("-", 1)[1])
+    with SQLiteArchive(s3_client, bucket, f"sqlite/readings-{page_size}.sqlite",
+                       page_size) as archive:
+        if name == "point lookup":
+            return archive.reading(plant_id, start)
+        return archive.readings(start, end, plant_ids)
+
+
+def benchmark(s3_client: client, bucket: str, readings: pd.DataFrame,
+              page_sizes: tuple[int, ...] = PAGE_SIZES, lookups: int = 10) -> pd.DataFrame:
+    """Returns the rows, seconds, S3 requests and bytes of archiving the
+    readings with each backend, then the means of each kind of query against each."""
+    counter = RequestCounter(s3_client)
+    backends = ["parquet"] + [f"sqlite-{page_size}" for page_size in page_sizes]
+    results = [{"backend": "parquet", "query": "archive",
+                **counter.measure(lambda: archive_parquet(s3_client, bucket, readings))}]
+    results.extend({"backend": f"sqlite-{page_size}", "query": "archive",
+                    **counter.measure(lambda page_size=page_size: archive_sqlite(
+                        s3_client, bucket, readings, page_size))}
+                   for page_size in page_sizes)
+    results.extend({"backend": backend, "query": query[0],
+                    **counter.measure(lambda backend=backend, query=query: run_query(
+                        s3_client, bucket, backend, query))}
+                   for query in queries(readings, lookups) for backend in backends)
+    results = pd.DataFrame(results)
+    return results.groupby(["query", "backend"], sort=False).mean().reset_index()
+
+
+def main() -> None:
+    """Prints the benchmark for the sizes given on the command line."""
+    parser = ArgumentParser(description="Compare the parquet and SQLite archives on moto.")
+    parser.add_argument("--plants", type=int, default=50)
+    parser.add_argument("--hours", type=int, default=48)
+    parser.add_argument("--lookups", type=int, default=10)
+    args = parser.parse_args()
+
+    with moto.mock_aws():
+        s3 = boto3.client("s3", region_name="eu-west-2")
+        s3.create_bucket(Bucket="benchmark", CreateBucketConfiguration={
+            "LocationConstraint": "eu-west-2"})
+        report = benchmark(s3, "benchmark", simulated_readings(args.plants, args.hours),
+                           lookups=args.lookups)
+    print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""A catalog of every archived parquet object: its row count, size and the
+min and max of each column, kept as one small parquet file in the bucket so
+query tools can choose which objects to open before reading any data."""
+
+import json
+import logging
+from io import BytesIO
+from collections.abc import Iterable
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from boto3 import client
+from botocore.exceptions import ClientError
+from archive_layout import ARCHIVE_PREFIX, MANIFEST_PREFIX, PartitionedWriter
+from archive_format import READING_SCHEMA, TIME_COLUMNS
+
+CATALOG_KEY = f"{ARCHIVE_PREFIX}/_catalog.parquet"
+CATALOG_RETRIES = 5
+FOOTER_TAIL_BYTES = 8
+STAT_TYPES = {"int": pa.int64(), "float": pa.float64(), "timestamp": pa.timestamp("ms")}
+CATALOG_SCHEMA = pa.schema(
+    [("key", pa.string()), ("rows", pa.int64()), ("bytes", pa.int64())]
+    + [(f"{bound}_{field.name}",
+        STAT_TYPES["timestamp" if field.name in TIME_COLUMNS else
+                   "float" if pa.types.is_floating(field.type) else "int"])
+       for field in READING_SCHEMA for bound in ("min", "max")])
+
+
+def stat_value(column: str, value: object) -> object:
+    """Returns a column statistic as a catalog value, parsing legacy string times."""
+    if column in TIME_COLUMNS and isinstance(value, (str, bytes)):
+        return pd.Timestamp(value.decode() if isinstance(value, bytes) else value)
+    return value
+
+
+def file_stats(key: str, metadata: pq.FileMetaData, size: int) -> dict:
+    """Returns the catalog entry of a parquet object from its footer metadata:
+    the min and max of each reading column across all its row groups."""
+    stats = {"key": key, "rows": metadata.num_rows, "bytes": size}
+    names = metadata.schema.to_arrow_schema().names
+    for column in READING_SCHEMA.names:
+        column_stats = [metadata.row_group(group).column(names.index(column)).statistics
+                        for group in range(metadata.num_row_groups)] if column in names else []
+        column_stats = [stat for stat in column_stats if stat is not None and stat.has_min_max]
+        stats[f"min_{column}"] = min((stat_value(column, stat.min) for stat in column_stats),
+                                     default=None)
+        stats[f"max_{column}"] = max((stat_value(column, stat.max) for stat in column_stats),
+                                     default=None)
+    return stats
+
+
+def writer_stats(writer: PartitionedWriter) -> list[dict]:
+    """Returns the catalog entries of the S3 objects a closed PartitionedWriter wrote."""
+    return [file_stats(file.key, writer.metadata[partition], file.tell())
+            for partition, file in writer.files.items()]
+
+
+def read_footer(s3_client: client, bucket: str, key: str) -> tuple[pq.FileMetaData, int]:
+    """Returns a parquet object's footer metadata and size, fetching only the
+    end of the object with ranged reads."""
+    tail = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{FOOTER_TAIL_BYTES}")
+    size = int(tail["ContentRange"].rsplit("/", 1)[1])
+    footer_length = int.from_bytes(tail["Body"].read()[:4], "little")
+    footer = s3_client.get_object(Bucket=bucket, Key=key,
+                                  Range=f"bytes=-{footer_length + FOOTER_TAIL_BYTES}")
+    return pq.read_metadata(BytesIO(b"PAR1" + footer["Body"].read())), size
+
+
+def read_catalog(s3_client: client, bucket: str) -> tuple[pd.DataFrame, str | None]:
+    """Returns the catalog and its ETag, or an empty catalog and None if there is none."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=CATALOG_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return CATALOG_SCHEMA.empty_table().to_pandas(), None
+    return pq.read_table(BytesIO(response["Body"].read())).to_pandas(), response["ETag"]
+
+
+def write_catalog(s3_client: client, bucket: str, catalog: pd.DataFrame,
+                  etag: str | None) -> None:
+    """Replaces the catalog, failing with PreconditionFailed if it has changed
+    since it was read with the given ETag."""
+    buffer = BytesIO()
+    pq.write_table(pa.Table.from_pandas(catalog.sort_values(["min_at", "key"]),
+                                        schema=CATALOG_SCHEMA, preserve_index=False),
+                   buffer, compression="zstd")
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    s3_client.put_object(Bucket=bucket, Key=CATALOG_KEY, Body=buffer.getvalue(), **condition)
+
+
+def update_catalog(s3_client: client, bucket: str, added: list[dict],
+                   removed: Iterable[str] = ()) -> pd.DataFrame:
+    """Adds the given entries and drops the removed keys, retrying if another
+    job changes the catalog at the same time, and returns the catalog.
+    An entry for a key already in the catalog replaces it if its size differs,
+    since a retried archive run rewrites the objects of the attempt before it."""
+    removed = set(removed)
+    for _ in range(CATALOG_RETRIES):
+        catalog, etag = read_catalog(s3_client, bucket)
+        stored = dict(zip(catalog["key"], zip(catalog["rows"], catalog["bytes"])))
+        new = [entry for entry in added
+               if stored.get(entry["key"]) != (entry["rows"], entry.get("bytes"))]
+        kept = catalog[~catalog["key"].isin(removed | {entry["key"] for entry in new})]
+        if not new and len(kept) == len(catalog):
+            return catalog
+        catalog = pd.concat([kept, pd.DataFrame(new, columns=CATALOG_SCHEMA.names)],
+                            ignore_index=True) if new else kept
+        try:
+            write_catalog(s3_client, bucket, catalog, etag)
+            return catalog
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "PreconditionFailed":
+                raise
+            logging.info("Archive catalog changed while updating it; retrying.")
+    raise RuntimeError(f"Archive catalog kept changing; gave up after {CATALOG_RETRIES} tries.")
+
+
+def rebuild_catalog(s3_client: client, bucket: str) -> pd.DataFrame:
+    """Rebuilds the catalog from the footers of every archived object that no
+    day's manifest lists as replaced, and returns it."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = [item["Key"]
+            for page in paginator.paginate(Bucket=bucket, Prefix=f"{ARCHIVE_PREFIX}/")
+            for item in page.get("Contents", []) if item["Key"] != CATALOG_KEY]
+    replaced = {replaced_key for key in keys if key.startswith(MANIFEST_PREFIX)
+                for replaced_key in json.loads(s3_client.get_object(
+                    Bucket=bucket, Key=key)["Body"].read())["replaced"]}
+    keys = [key for key in keys if key.endswith(".parquet")]
+    entries = [file_stats(key, *read_footer(s3_client, bucket, key))
+               for key in keys if key not in replaced]
+    _, etag = read_catalog(s3_client, bucket)
+    catalog = pd.DataFrame(entries, columns=CATALOG_SCHEMA.names)
+    write_catalog(s3_client, bucket, catalog, etag)
+    return catalog
+
+
+def prune(catalog: pd.DataFrame, start: object = None, end: object = None,
+          plant_ids: list[int] | None = None,
+          ranges: dict[str, tuple[object, object]] | None = None) -> list[str]:
+    """Returns the keys of the objects that can hold readings taken from start
+    up to end by the given plants with each column within its (low, high) range.
+    Any bound left as None does not filter."""
+    keep = pd.Series(True, index=catalog.index)
+    if start is not None:
+        keep &= catalog["max_at"] >= pd.Timestamp(start)
+    if end is not None:
+        keep &= catalog["min_at"] < pd.Timestamp(end)
+    if plant_ids is not None:
+        any_plant = pd.Series(False, index=catalog.index)
+        for plant_id in plant_ids:
+            any_plant |= ((catalog["min_plant_id"] <= plant_id)
+                          & (catalog["max_plant_id"] >= plant_id))
+        keep &= any_plant
+    for column, (low, high) in (ranges or {}).items():
+        if low is not None:
+            keep &= catalog[f"max_{column}"] >= low
+        if high is not None:
+            keep &= catalog[f"min_{column}"] <= high
+    return catalog.loc[keep, "key"].tolist()
+
+
+def find_objects(s3_client: client, bucket: str, **filters) -> list[str]:
+    """Returns the keys of the archived objects that can match the filters
+    taken by prune, reading only the catalog."""
+    catalog, _ = read_catalog(s3_client, bucket)
+    return prune(catalog, **filters)
@@ -0,0 +1,299 @@
+"""Hive-partitioned layout for archived readings in S3:
+readings/year=/month=/day=/hour=/plant_bucket=/part-{run}.parquet.
+Each run writes its own objects, and readers only fetch the partitions
+that a time range and plant filter can match. A run holds a bounded number
+of partitions open at once; a partition it returns to after closing gets
+another object, part-{run}-{n}.parquet.
+Compaction replaces a day's hourly objects with larger files under
+readings/compacted/; a manifest per day records which files hold the day
+and which hourly objects they replaced."""
+
+import json
+import logging
+from io import BytesIO
+from os import environ
+from pathlib import Path
+from datetime import date, datetime, time, timedelta, timezone
+from uuid import uuid4
+from collections import OrderedDict
+from collections.abc import Callable
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from boto3 import client
+from s3_stream import S3MultipartWriter
+
+ARCHIVE_PREFIX = "readings"
+PLANT_BUCKETS = int(environ.get("ARCHIVE_PLANT_BUCKETS", "8"))
+MAX_OPEN_PARTITIONS = int(environ.get("ARCHIVE_MAX_OPEN_PARTITIONS", str(2 * PLANT_BUCKETS)))
+HOUR_FORMAT = "year=%Y/month=%m/day=%d/hour=%H"
+DAY_FORMAT = "year=%Y/month=%m/day=%d"
+MANIFEST_PREFIX = f"{ARCHIVE_PREFIX}/_manifests"
+COMPACTED_PREFIX = f"{ARCHIVE_PREFIX}/compacted"
+
+
+def plant_bucket(plant_id: int) -> int:
+    """Returns the bucket a plant's readings are archived under."""
+    return plant_id % PLANT_BUCKETS
+
+
+def partition_names(at: pd.Series, plant_ids: pd.Series) -> pd.Series:
+    """Returns the partition path of each reading from its time and plant."""
+    return (pd.to_datetime(at).dt.strftime(HOUR_FORMAT) + "/plant_bucket="
+            + (plant_ids.astype(int) % PLANT_BUCKETS).astype(str))
+
+
+def new_run_id() -> str:
+    """Returns a name for an archive run that sorts by time and never repeats."""
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{uuid4().hex[:8]}"
+
+
+def window_run_id(start: datetime | None) -> str:
+    """Returns the name for an archive run of the readings from start, or of
+    every reading if start is None. Every attempt at the same window gets the
+    same name, so a retried run overwrites the objects of a failed one rather
+    than archiving its readings a second time."""
+    return "initial" if start is None else f"from-{start:%Y%m%dT%H%M%S}"
+
+
+def object_key(partition: str, run_id: str, sequence: int = 0) -> str:
+    """Returns the S3 key of one of a run's files within a partition."""
+    suffix = f"-{sequence}" if sequence else ""
+    return f"{ARCHIVE_PREFIX}/{partition}/part-{run_id}{suffix}.parquet"
+
+
+class PartitionedWriter:  # pylint: disable=too-many-instance-attributes
+    """Writes record batches as parquet by partition, opening a partition's
+    file with open_file(partition, sequence) the first time a batch has rows
+    for it. At most max_open files are open at once: opening another first
+    closes the least recently written one, and rows for that partition later
+    go to a new file with the next sequence number. Any options are passed on
+    to each ParquetWriter. Files and, once closed, their parquet footer
+    metadata are kept in .files and .metadata by (partition, sequence)."""
+
+    def __init__(self, open_file: Callable[[str, int], object], schema: pa.Schema,
+                 max_open: int | None = MAX_OPEN_PARTITIONS, **options):
+        self.open_file = open_file
+        self.schema = schema
+        self.max_open = max_open
+        self.options = options
+        self.files = {}
+        self.metadata = {}
+        self.peak_buffered_bytes = 0
+        self._writers = OrderedDict()
+
+    def __enter__(self) -> "PartitionedWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        self.close(abort=exc_type is not None)
+
+    def write_batch(self, batch: pa.RecordBatch) -> None:
+        """Appends each partition's rows of the batch to that partition's file."""
+        frame = batch.to_pandas()
+        for partition, rows in frame.groupby(partition_names(frame["at"], frame["plant_id"])):
+            if partition in self._writers:
+                self._writers.move_to_end(partition)
+            else:
+                self._open(partition)
+            self._writers[partition][1].write_batch(pa.RecordBatch.from_pandas(
+                rows, schema=self.schema, preserve_index=False))
+        self.peak_buffered_bytes = max(self.peak_buffered_bytes, self.buffered_bytes())
+
+    def buffered_bytes(self) -> int:
+        """Returns the bytes the open files hold in memory between them."""
+        return sum(self.files[name].buffered_bytes() for name, _ in self._writers.values()
+                   if hasattr(self.files[name], "buffered_bytes"))
+
+    def _open(self, partition: str) -> None:
+        if self.max_open is not None and len(self._writers) >= self.max_open:
+            self._close_file(*self._writers.popitem(last=False)[1])
+        name = (partition, sum(file_partition == partition for file_partition, _ in self.files))
+        self.files[name] = self.open_file(*name)
+        self._writers[partition] = (name, pq.ParquetWriter(self.files[name], self.schema,
+                                                           **self.options))
+
+    def _close_file(self, name: tuple[str, int], writer: pq.ParquetWriter) -> None:
+        writer.close()
+        self.metadata[name] = writer.writer.metadata
+        if hasattr(self.files[name], "close"):
+            self.files[name].close()
+
+    def close(self, abort: bool = False) -> None:
+        """Finishes every open file, or discards every file where the file supports it."""
+        for name, writer in self._writers.values():
+            writer.close()
+            self.metadata[name] = writer.writer.metadata
+        self._writers.clear()
+        for file in self.files.values():
+            if abort and hasattr(file, "abort"):
+                file.abort()
+            elif hasattr(file, "close"):
+                file.close()
+
+
+def split_by_partition(filepath: str, directory: str) -> dict[str, Path]:
+    """Splits an exported parquet file into a file per partition in directory,
+    a record batch at a time, and returns each partition's file."""
+    parquet_file = pq.ParquetFile(filepath)
+    with PartitionedWriter(lambda *_: Path(directory) / f"{uuid4().hex}.parquet",
+                           parquet_file.schema_arrow, max_open=None) as writer:
+        for batch in parquet_file.iter_batches():
+            writer.write_batch(batch)
+    return {partition: path for (partition, _), path in writer.files.items()}
+
+
+def s3_partition_opener(s3_client: client, bucket: str,
+                        run_id: str) -> Callable[[str, int], S3MultipartWriter]:
+    """Returns a function opening a streaming S3 object for a file of a run's partition."""
+    return lambda partition, sequence: S3MultipartWriter(
+        s3_client, bucket, object_key(partition, run_id, sequence))
+
+
+def log_upload_stats(writer: PartitionedWriter, run_id: str) -> dict[str, float]:
+    """Logs and returns the bytes, throughput and peak buffers of a run's S3
+    objects: the most any one object held in memory, and the most all the
+    open objects held together."""
+    stats = [file.stats() for file in writer.files.values()]
+    summary = {"objects": len(stats),
+               "bytes": sum(stat["bytes"] for stat in stats),
+               "seconds": max((stat["seconds"] for stat in stats), default=0.0),
+               "peak_buffer_bytes": max((stat["peak_buffer_bytes"] for stat in stats), default=0),
+               "peak_total_buffer_bytes": writer.peak_buffered_bytes}
+    summary["bytes_per_second"] = summary["bytes"] / max(summary["seconds"], 1e-9)
+    logging.info("Archived %d partitions for run %s: %s", len(stats), run_id, summary)
+    return summary
+
+
+def upload_partitioned(s3_client: client, filepath: str, bucket: str,
+                       run_id: str | None = None) -> list[str]:
+    """Streams an exported parquet file into S3 in the partitioned layout,
+    a record batch at a time, and returns the keys written."""
+    run_id = run_id or new_run_id()
+    parquet_file = pq.ParquetFile(filepath)
+    with PartitionedWriter(s3_partition_opener(s3_client, bucket, run_id),
+                           parquet_file.schema_arrow) as writer:
+        for batch in parquet_file.iter_batches():
+            writer.write_batch(batch)
+    log_upload_stats(writer, run_id)
+    return [file.key for file in writer.files.values()]
+
+
+def partition_prefixes(start: datetime, end: datetime,
+                       plant_ids: list[int] | None = None) -> list[str]:
+    """Returns the key prefix of every partition that can hold readings taken
+    from start up to end by the given plants, or by any plant if none are given."""
+    buckets = sorted({plant_bucket(plant_id) for plant_id in plant_ids}) \
+        if plant_ids is not None else range(PLANT_BUCKETS)
+    prefixes = []
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour < end:
+        prefixes.extend(f"{ARCHIVE_PREFIX}/{hour:{HOUR_FORMAT}}/plant_bucket={bucket}/"
+                        for bucket in buckets)
+        hour += timedelta(hours=1)
+    return prefixes
+
+
+def day_prefix(day: date) -> str:
+    """Returns the key prefix of every hourly object for a day."""
+    return f"{ARCHIVE_PREFIX}/{day:{DAY_FORMAT}}/"
+
+
+def manifest_key(day: date) -> str:
+    """Returns the S3 key of a day's compaction manifest."""
+    return f"{MANIFEST_PREFIX}/{day:%Y-%m-%d}.json"
+
+
+def read_manifest(s3_client: client, bucket: str, day: date) -> dict:
+    """Returns a day's manifest, or an empty one if the day was never compacted."""
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=manifest_key(day))["Body"].read()
+    except s3_client.exceptions.NoSuchKey:
+        return {"day": day.isoformat(), "files": [], "replaced": []}
+    return json.loads(body)
+
+
+def write_manifest(s3_client: client, bucket: str, manifest: dict) -> None:
+    """Replaces a day's manifest with a single put, so readers see either
+    the whole old manifest or the whole new one."""
+    s3_client.put_object(Bucket=bucket, Key=manifest_key(date.fromisoformat(manifest["day"])),
+                         Body=json.dumps(manifest, indent=1).encode(),
+                         ContentType="application/json")
+
+
+def compacted_days(key: str) -> list[date]:
+    """Returns the days a compacted file was written for, from its key."""
+    name = key.rsplit("/", 1)[1]
+    first_day, days = date.fromisoformat(name[:10]), int(name[11:].split("d-", 1)[0])
+    return [first_day + timedelta(days=offset) for offset in range(days)]
+
+
+def key_days(key: str) -> list[date]:
+    """Returns the days an archived object holds, from its key: the days of a
+    compacted file, the day of an hourly object, or none if the key is neither."""
+    if key.startswith(f"{COMPACTED_PREFIX}/"):
+        return compacted_days(key)
+    parts = dict(part.split("=", 1) for part in key.split("/") if "=" in part)
+    if {"year", "month", "day"} <= parts.keys():
+        return [date(int(parts["year"]), int(parts["month"]), int(parts["day"]))]
+    return []
+
+
+def archive_days(start: datetime, end: datetime) -> list[date]:
+    """Returns every day holding some time from start up to end."""
+    days, day = [], start.date()
+    while datetime.combine(day, time()) < end:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def list_archive_objects(s3_client: client, bucket: str, start: datetime, end: datetime,
+                         plant_ids: list[int] | None = None) -> list[str]:
+    """Returns the keys of the archived files in the partitions the filter can match."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [item["Key"]
+            for prefix in partition_prefixes(start, end, plant_ids)
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+            for item in page.get("Contents", [])]
+
+
+def archive_sources(s3_client: client, bucket: str, start: datetime, end: datetime,
+                    plant_ids: list[int] | None = None) -> dict[str, list[date] | None]:
+    """Returns the keys holding readings from start up to end: hourly objects
+    not yet compacted, mapped to None, and compacted files, mapped to the days
+    whose manifests list them. Only those days' rows of a compacted file count,
+    so a day is never read from both a compacted file and what it replaced."""
+    sources = {}
+    for day in archive_days(start, end):
+        manifest = read_manifest(s3_client, bucket, day)
+        replaced = set(manifest["replaced"])
+        day_start = datetime.combine(day, time())
+        for key in list_archive_objects(s3_client, bucket, max(start, day_start),
+                                        min(end, day_start + timedelta(days=1)), plant_ids):
+            if key not in replaced:
+                sources[key] = None
+        for file in manifest["files"]:
+            sources.setdefault(file["key"], []).append(day)
+    return sources
+
+
+def read_archive(s3_client: client, bucket: str, start: datetime, end: datetime,
+                 plant_ids: list[int] | None = None) -> pd.DataFrame:
+    """Returns the archived readings taken from start up to end, for the given
+    plants or all of them, fetching only the objects in matching partitions."""
+    frames = []
+    for key, days in archive_sources(s3_client, bucket, start, end, plant_ids).items():
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        frame = pq.read_table(BytesIO(body)).to_pandas()
+        at = pd.to_datetime(frame["at"])
+        keep = (at >= start) & (at < end)
+        if days is not None:
+            keep &= at.dt.date.isin(days)
+        if plant_ids is not None:
+            keep &= frame["plant_id"].isin(plant_ids)
+        frames.append(frame[keep])
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,220 @@
+"""Compacts the small hourly archive objects of a day, or of several days, into
+one sorted parquet file. The new file is verified against its inputs before each
+day's manifest is replaced and the inputs are deleted, so a run that fails at
+any point can simply be run again."""
+
+# pylint: disable=unused-argument
+
+import logging
+from io import BytesIO
+from os import environ
+from hashlib import sha256
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from boto3 import client
+from s3_stream import S3MultipartWriter
+from archive_layout import (
+    COMPACTED_PREFIX, day_prefix, read_manifest, write_manifest, new_run_id, compacted_days
+)
+from archive_format import READING_SCHEMA, reading_batch, writer_options
+from archive_catalog import file_stats, read_footer, update_catalog
+
+COMPACT_DAYS = int(environ.get("COMPACT_DAYS", "1"))
+COMPACT_LAG_DAYS = int(environ.get("COMPACT_LAG_DAYS", "2"))
+COMPACT_ROW_GROUP_ROWS = int(environ.get("COMPACT_ROW_GROUP_ROWS", "100000"))
+SORT_COLUMNS = ["plant_id", "at", "reading_id"]
+DELETE_BATCH = 1000
+
+
+def compacted_key(first_day: date, days: int, run_id: str) -> str:
+    """Returns the S3 key of the file compacting days from first_day."""
+    return f"{COMPACTED_PREFIX}/{first_day:%Y-%m-%d}-{days}d-{run_id}.parquet"
+
+
+def fingerprint(readings: pd.DataFrame) -> str:
+    """Returns a checksum of the readings' values that ignores their order."""
+    ordered = readings.sort_values(SORT_COLUMNS, kind="stable")
+    return sha256(pd.util.hash_pandas_object(ordered, index=False).values.tobytes()).hexdigest()
+
+
+def read_object(s3_client: client, bucket: str, key: str) -> bytes:
+    """Returns the bytes of an S3 object."""
+    return s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+
+def day_inputs(s3_client: client, bucket: str, day: date,
+               manifest: dict) -> tuple[list[pd.DataFrame], list[str]]:
+    """Returns a day's readings in the tuned schema and the keys they came from:
+    the day's rows of its compacted files, whose checksums must still match,
+    and any hourly objects archived since the day was last compacted."""
+    frames, keys = [], []
+    for file in manifest["files"]:
+        body = read_object(s3_client, bucket, file["key"])
+        if sha256(body).hexdigest() != file["sha256"]:
+            raise ValueError(f"Checksum of {file['key']} does not match the manifest.")
+        frame = pq.read_table(BytesIO(body)).to_pandas()
+        frames.append(frame[frame["at"].dt.date == day])
+        keys.append(file["key"])
+
+    replaced = set(manifest["replaced"])
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=day_prefix(day)):
+        for item in page.get("Contents", []):
+            if item["Key"] not in replaced:
+                body = read_object(s3_client, bucket, item["Key"])
+                frames.append(reading_batch(pq.read_table(BytesIO(body)).to_pandas()).to_pandas())
+                keys.append(item["Key"])
+    return frames, keys
+
+
+def period_inputs(s3_client: client, bucket: str, period: list[date],
+                  manifests: list[dict]) -> tuple[list[pd.DataFrame], list[str]]:
+    """Returns the readings of every day in the period and the distinct keys they came from."""
+    frames, keys = [], []
+    for day, manifest in zip(period, manifests):
+        day_frames, day_keys = day_inputs(s3_client, bucket, day, manifest)
+        frames.extend(day_frames)
+        keys.extend(key for key in day_keys if key not in keys)
+    return frames, keys
+
+
+def already_compacted(manifests: list[dict], keys: list[str]) -> bool:
+    """Returns True if every day is read from the same single compacted file
+    and nothing has been archived for the days since."""
+    files = {tuple(file["key"] for file in manifest["files"]) for manifest in manifests}
+    return len(files) == 1 and len(keys) == 1 and next(iter(files)) == tuple(keys)
+
+
+def write_compacted(s3_client: client, bucket: str, key: str, readings: pd.DataFrame) -> None:
+    """Streams readings to S3 as a tuned parquet file sorted by plant and time."""
+    table = pa.Table.from_pandas(readings.sort_values(SORT_COLUMNS, kind="stable"),
+                                 schema=READING_SCHEMA, preserve_index=False)
+    with S3MultipartWriter(s3_client, bucket, key) as file:
+        with pq.ParquetWriter(file, READING_SCHEMA, **writer_options()) as writer:
+            writer.write_table(table, row_group_size=COMPACT_ROW_GROUP_ROWS)
+
+
+def verify_compacted(s3_client: client, bucket: str, key: str,
+                     readings: pd.DataFrame) -> dict:
+    """Returns the manifest entry of a compacted file after checking that it
+    holds exactly the readings it was written from."""
+    body = read_object(s3_client, bucket, key)
+    stored = pq.read_table(BytesIO(body)).to_pandas()
+    if len(stored) != len(readings):
+        raise ValueError(f"{key} holds {len(stored)} rows, expected {len(readings)}.")
+    if fingerprint(stored) != fingerprint(readings):
+        raise ValueError(f"{key} does not hold the readings it was compacted from.")
+    return {"key": key, "rows": len(stored), "bytes": len(body),
+            "sha256": sha256(body).hexdigest()}
+
+
+def delete_objects(s3_client: client, bucket: str, keys: list[str]) -> None:
+    """Deletes the keys, a batch of up to a thousand at a time."""
+    for start in range(0, len(keys), DELETE_BATCH):
+        s3_client.delete_objects(Bucket=bucket, Delete={"Objects": [
+            {"Key": key} for key in keys[start:start + DELETE_BATCH]], "Quiet": True})
+
+
+def still_referenced(s3_client: client, bucket: str, key: str) -> bool:
+    """Returns True if the manifest of any day a compacted file covers lists it."""
+    return any(key in {file["key"] for file in read_manifest(s3_client, bucket, day)["files"]}
+               for day in compacted_days(key))
+
+
+def retired_keys(s3_client: client, bucket: str, manifests: list[dict]) -> set[str]:
+    """Returns the keys the manifests say were replaced, less any compacted
+    file that a day it covers still reads from."""
+    replaced = {key for manifest in manifests for key in manifest["replaced"]}
+    return {key for key in replaced if not key.startswith(COMPACTED_PREFIX)
+            or not still_referenced(s3_client, bucket, key)}
+
+
+def leftover_keys(s3_client: client, bucket: str, manifests: list[dict],
+                  retired: set[str]) -> list[str]:
+    """Returns the retired objects that still exist, including those left
+    behind by a run that stopped before deleting them."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    prefixes = [day_prefix(date.fromisoformat(manifest["day"])) for manifest in manifests]
+    leftovers = {item["Key"]
+                 for prefix in prefixes
+                 for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+                 for item in page.get("Contents", [])} & retired
+    leftovers.update(key for key in retired if key.startswith(COMPACTED_PREFIX)
+                     and s3_client.list_objects_v2(Bucket=bucket, Prefix=key).get("KeyCount"))
+    return sorted(leftovers)
+
+
+def refresh_catalog(s3_client: client, bucket: str, manifests: list[dict],
+                    retired: set[str]) -> None:
+    """Adds the days' compacted files to the archive catalog and drops the retired keys."""
+    current = sorted({file["key"] for manifest in manifests for file in manifest["files"]})
+    update_catalog(s3_client, bucket, [file_stats(key, *read_footer(s3_client, bucket, key))
+                                       for key in current], retired)
+
+
+def replace_days(s3_client: client, bucket: str, manifests: list[dict],
+                 readings: pd.DataFrame, keys: list[str]) -> dict:
+    """Writes and verifies the compacted file of the manifests' days, then points
+    each day's manifest at it in place of the keys it was compacted from.
+    Returns the file's manifest entry."""
+    key = compacted_key(date.fromisoformat(manifests[0]["day"]), len(manifests), new_run_id())
+    write_compacted(s3_client, bucket, key, readings)
+    entry = verify_compacted(s3_client, bucket, key, readings)
+    for manifest in manifests:
+        manifest.update(files=[entry],
+                        updated_at=datetime.now(timezone.utc).isoformat(),
+                        replaced=sorted(set(manifest["replaced"]) | set(keys)))
+        write_manifest(s3_client, bucket, manifest)
+    logging.info("Compacted %d objects into %s: %d rows, %d bytes.",
+                 len(keys), key, entry["rows"], entry["bytes"])
+    return entry
+
+
+def compact(s3_client: client, bucket: str, first_day: date,
+            days: int = COMPACT_DAYS) -> dict[str, int]:
+    """Merges the archived readings of days from first_day into one sorted file,
+    replaces each day's manifest once the file is verified, brings the archive
+    catalog up to date, then deletes the objects it replaced.
+    Returns the objects read, rows written and objects deleted.
+    Running it again after a failure, or for days already compacted, is safe."""
+    period = [first_day + timedelta(days=offset) for offset in range(days)]
+    manifests = [read_manifest(s3_client, bucket, day) for day in period]
+    frames, keys = period_inputs(s3_client, bucket, period, manifests)
+
+    result = {"inputs": len(keys), "rows": 0, "deleted": 0}
+    if keys and not already_compacted(manifests, keys):
+        result["rows"] = replace_days(s3_client, bucket, manifests,
+                                      pd.concat(frames, ignore_index=True), keys)["rows"]
+
+    retired = retired_keys(s3_client, bucket, manifests)
+    refresh_catalog(s3_client, bucket, manifests, retired)
+    leftovers = leftover_keys(s3_client, bucket, manifests, retired)
+    delete_objects(s3_client, bucket, leftovers)
+    result["deleted"] = len(leftovers)
+    return result
+
+
+def handler(event=None, context=None) -> dict[str, int]:
+    """Lambda handler compacting the archive for the days in the event, or by
+    default the COMPACT_DAYS ending COMPACT_LAG_DAYS ago, once no more hourly
+    objects will arrive for them."""
+    logging.getLogger().setLevel(logging.INFO)
+    event = event or {}
+    days = int(event.get("days", COMPACT_DAYS))
+    first_day = date.fromisoformat(event["day"]) if "day" in event else \
+        date.today() - timedelta(days=COMPACT_LAG_DAYS + days - 1)
+
+    s3 = client("s3", aws_access_key_id=environ["AWS_ACCESS_KEY"],
+                aws_secret_access_key=environ["AWS_SECRET_ACCESS_KEY"])
+    return compact(s3, environ["BUCKET_NAME"], first_day, days)
+
+
+if __name__ == "__main__":
+
+    load_dotenv()
+
+    print(handler())
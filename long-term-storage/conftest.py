@@ -0,0 +1,14 @@
+"""Shared fixtures for the long-term storage tests."""
+import pytest
+import moto
+import boto3
+
+
+@pytest.fixture
+def s3():
+    """An S3 client on moto with an empty archive bucket."""
+    with moto.mock_aws():
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(Bucket="archive", CreateBucketConfiguration={
+            "LocationConstraint": "eu-west-2"})
+        yield s3_client
@@ -5,15 +5,49 @@ in preparation for loading into the S3 bucket as parquet files."""
 
 import logging
 from os import environ, remove
-from datetime import date
+from datetime import datetime, timedelta
+from time import perf_counter, sleep
+from collections.abc import Callable, Iterator
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pymssql import connect, Connection
 from dotenv import load_dotenv
 from boto3 import client
+from connection_pool import get_pooled_connection, connection_metrics
+from backends import get_dialect, connect_sqlite
+import instrumentation
+from archive_layout import (
+    PartitionedWriter, window_run_id, s3_partition_opener, log_upload_stats
+)
+from archive_format import READING_SCHEMA, reading_batch, writer_options
+from archive_catalog import update_catalog, writer_stats
+from sqlite_archive import SQLiteArchive
+from rollups import RollupAccumulator
 
+PARTITION_FUNCTION = "pf_reading_hour"
+PARTITION_SCHEME = "ps_reading_hour"
+EXPIRED_TABLE = "alpha.reading_expired"
+PARTITIONS_AHEAD_HOURS = int(environ.get("PARTITIONS_AHEAD_HOURS", "48"))
+WATERMARK_JOB = "archive"
+DELETE_CHUNK_ROWS = int(environ.get("DELETE_CHUNK_ROWS", "5000"))
+DELETE_THROTTLE_SECONDS = float(environ.get("DELETE_THROTTLE_SECONDS", "0"))
+EXPORT_CHUNK_ROWS = int(environ.get("EXPORT_CHUNK_ROWS", "10000"))
+ARCHIVE_FORMAT = environ.get("ARCHIVE_FORMAT", "tuned")
+ARCHIVE_SINK = environ.get("ARCHIVE_SINK", "parquet")
+ARCHIVE_SCHEMA = pa.schema([
+    ("reading_id", pa.int64()),
+    ("plant_id", pa.int64()),
+    ("soil_moisture", pa.float64()),
+    ("temperature", pa.float64()),
+    ("at", pa.string()),
+    ("botanist_id", pa.int64()),
+    ("last_watered", pa.string())
+])
 
-def get_connection() -> Connection:
-    """Returns a connection object to connect to the database."""
+
+def open_connection() -> Connection:
+    """Returns a new connection object to connect to the database."""
     conn = connect(
         server=environ["DB_HOST"],
         user=environ["DB_USER"],
@@ -24,20 +58,69 @@ def get_connection() -> Connection:
     return conn
 
 
+def get_connection() -> Connection:
+    """Returns a live connection to the database, reused across warm invocations.
+    Setting DB_BACKEND=sqlite connects to the SQLite file at SQLITE_PATH instead.
+    Every statement run on it is timed by instrumentation."""
+    if environ.get("DB_BACKEND") == "sqlite":
+        return instrumentation.instrument(get_pooled_connection(
+            "archive", lambda: connect_sqlite(environ["SQLITE_PATH"], as_dict=True)))
+    return instrumentation.instrument(get_pooled_connection("archive", open_connection))
+
+
 def configure_logs() -> None:
     """Configures logger."""
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def get_old_data(conn: Connection) -> pd.DataFrame:
+def archive_window(conn: Connection) -> tuple[datetime | None, datetime]:
+    """Returns the window of readings due for archiving: the high-water mark of
+    what has already been archived (None before the first run) and a cutoff
+    24 hours before the database's current time. Computing the cutoff once lets
+    export and delete cover exactly the same rows."""
+    sql = get_dialect(conn)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {sql['now']} AS now;")
+        now = cur.fetchone()["now"]
+        cur.execute(f"""{sql["use_database"]}
+            SELECT archived_until FROM alpha.archive_watermark WHERE job = %s;""",
+                    (WATERMARK_JOB,))
+        row = cur.fetchone()
+    if isinstance(now, str):
+        now = datetime.fromisoformat(now)
+    return (row["archived_until"] if row else None), now - timedelta(hours=24)
+
+
+def window_predicate(window: tuple[datetime | None, datetime]) -> tuple[str, tuple]:
+    """Returns a range condition on at for an archive window, and its parameters,
+    that an index on at can seek on. It has no lower bound: rows below the
+    watermark are only there if they arrived late, after an earlier run passed
+    their time, and must still be archived and deleted."""
+    _, cutoff = window
+    return "at < %s", (cutoff,)
+
+
+def record_watermark(cur: object, archived_until: datetime) -> None:
+    """Moves the archive job's high-water mark, as part of the caller's transaction."""
+    cur.execute("UPDATE alpha.archive_watermark SET archived_until = %s WHERE job = %s;",
+                (archived_until, WATERMARK_JOB))
+    if cur.rowcount == 0:
+        cur.execute("INSERT INTO alpha.archive_watermark (job, archived_until) VALUES (%s, %s);",
+                    (WATERMARK_JOB, archived_until))
+
+
+def get_old_data(conn: Connection,
+                 window: tuple[datetime | None, datetime] | None = None) -> pd.DataFrame:
     """Returns old data from the database as a dataframe."""
-    query = """USE plants;
+    sql = get_dialect(conn)
+    condition, params = window_predicate(window or archive_window(conn))
+    query = f"""{sql["use_database"]}
             SELECT * FROM alpha.reading
-            WHERE DATEDIFF(HOUR, at, CURRENT_TIMESTAMP) > 24"""
+            WHERE {condition}"""
 
     cur = conn.cursor()
-    cur.execute(query)
+    cur.execute(query, params)
     rows = cur.fetchall()
     if rows == []:
         cur.close()
@@ -64,50 +147,320 @@ def format_dataframe(old_data: pd.DataFrame) -> pd.DataFrame:
     return old_data
 
 
-def delete_old_data(conn: Connection) -> None:
-    """Deletes data older than 24 hours from the database."""
-    query = """
-        USE plants;
+def legacy_batch(readings: pd.DataFrame) -> pa.RecordBatch:
+    """Returns readings as a record batch in the legacy string-timestamp schema."""
+    return pa.RecordBatch.from_pandas(format_dataframe(readings),
+                                      schema=ARCHIVE_SCHEMA, preserve_index=False)
+
+
+def stream_batches(conn: Connection, query: str, params: tuple = (),
+                   chunk_rows: int = EXPORT_CHUNK_ROWS,
+                   to_batch: Callable[[pd.DataFrame], pa.RecordBatch] = legacy_batch
+                   ) -> Iterator[pa.RecordBatch]:
+    """Yields a query's reading rows as formatted Arrow record batches, fetching
+    chunk_rows at a time so memory use depends on the chunk size rather than the row count."""
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        while chunk := cur.fetchmany(chunk_rows):
+            yield to_batch(pd.DataFrame(chunk))
+
+
+def export_query(conn: Connection, query: str, filepath: str, params: tuple = (),
+                 chunk_rows: int = EXPORT_CHUNK_ROWS) -> int:
+    """Streams a query's reading rows to a parquet file, a row group per chunk,
+    and returns how many there were."""
+    rows = 0
+    with pq.ParquetWriter(filepath, ARCHIVE_SCHEMA) as writer:
+        for batch in stream_batches(conn, query, params, chunk_rows):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def archive_query_sqlite(conn: Connection, statement: tuple[str, tuple], s3_client: client,
+                         bucket: str, run_id: str) -> int:
+    """Appends the reading rows of a query and its parameters to the SQLite
+    archive in S3 in one transaction, updates the rollups for the run and
+    returns how many there were, including any a failed run already archived."""
+    rows, rollups = 0, RollupAccumulator(s3_client, bucket, run_id)
+
+    def counted(batches: Iterator[pa.RecordBatch]) -> Iterator[pa.RecordBatch]:
+        nonlocal rows
+        for batch in batches:
+            rows += batch.num_rows
+            yield batch
+
+    with SQLiteArchive(s3_client, bucket) as archive:
+        inserted = archive.append(counted(rollups.track(stream_batches(conn, *statement))))
+    logging.info("Appended %d of %d readings to the SQLite archive.", inserted, rows)
+    rollups.save()
+    return rows
+
+
+def archive_query(conn: Connection, statement: tuple[str, tuple], s3_client: client,
+                  bucket: str, run_id: str) -> int:
+    """Streams the reading rows of a query and its parameters straight into the
+    partitioned S3 archive as the given run, without a local file, adds the
+    objects to the archive catalog, rolls the readings up into the hourly and
+    daily rollups and returns how many there were.
+    Rows should come in time order, so each hour's partitions are finished
+    before the next hour's are opened and the writer's open files stay few.
+    With ARCHIVE_FORMAT=tuned the files use the tuned schema and ARCHIVE_CODEC;
+    with ARCHIVE_SINK=sqlite the rows go to the SQLite archive instead."""
+    if ARCHIVE_SINK == "sqlite":
+        return archive_query_sqlite(conn, statement, s3_client, bucket, run_id)
+    query, params = statement
+    rows, rollups = 0, RollupAccumulator(s3_client, bucket, run_id)
+    if ARCHIVE_FORMAT == "tuned":
+        schema, options, to_batch = READING_SCHEMA, writer_options(), reading_batch
+    else:
+        schema, options, to_batch = ARCHIVE_SCHEMA, {}, legacy_batch
+    with PartitionedWriter(s3_partition_opener(s3_client, bucket, run_id),
+                           schema, **options) as writer:
+        for batch in rollups.track(stream_batches(conn, query, params, to_batch=to_batch)):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    log_upload_stats(writer, run_id)
+    update_catalog(s3_client, bucket, writer_stats(writer))
+    rollups.save()
+    return rows
+
+
+def archive_old_data(conn: Connection, s3_client: client, bucket: str,
+                     window: tuple[datetime | None, datetime] | None = None) -> int:
+    """Streams the data in the archive window to the S3 archive and returns the
+    row count. The run is named after the window's high-water mark, which only
+    moves once the window is deleted, so retrying a failed run replaces its objects."""
+    sql = get_dialect(conn)
+    window = window or archive_window(conn)
+    condition, params = window_predicate(window)
+    rows = archive_query(conn, (f"""{sql["use_database"]}
+            SELECT * FROM alpha.reading
+            WHERE {condition}
+            ORDER BY at""", params), s3_client, bucket, window_run_id(window[0]))
+    if rows == 0:
+        logging.error("No present data older than 24 hours in the database.")
+        raise ValueError(
+            "No present data older than 24 hours in the database.")
+    return rows
+
+
+def export_old_data(conn: Connection, filepath: str,
+                    window: tuple[datetime | None, datetime] | None = None) -> int:
+    """Streams the data in the archive window to a parquet file and returns the row count."""
+    sql = get_dialect(conn)
+    condition, params = window_predicate(window or archive_window(conn))
+    rows = export_query(conn, f"""{sql["use_database"]}
+            SELECT * FROM alpha.reading
+            WHERE {condition}""", filepath, params)
+    if rows == 0:
+        remove(filepath)
+        logging.error("No present data older than 24 hours in the database.")
+        raise ValueError(
+            "No present data older than 24 hours in the database.")
+    return rows
+
+
+def delete_old_data(conn: Connection,
+                    window: tuple[datetime | None, datetime] | None = None) -> None:
+    """Deletes the data in the archive window from the database and moves the
+    high-water mark up to the window's cutoff in the same transaction."""
+    sql = get_dialect(conn)
+    window = window or archive_window(conn)
+    condition, params = window_predicate(window)
+    query = f"""
+        {sql["use_database"]}
         DELETE FROM alpha.reading
-        WHERE DATEDIFF(HOUR, at, CURRENT_TIMESTAMP) > 24;
+        WHERE {condition};
         """
 
     with conn.cursor() as cur:
-        cur.execute(query)
+        cur.execute(query, params)
+        record_watermark(cur, window[1])
         conn.commit()
     logging.info("Expired data deleted from plant database.")
 
 
-def upload_to_bucket(s3_client: client, filepath: str, bucket=str) -> None:
-    """Uploads parquet file to S3 bucket."""
-    name = f"plant_data_{date.today()}.parquet"
-    s3_client.upload_file(filepath, bucket, name)
-    logging.info("Plant data uploaded to S3 bucket.")
+def lock_wait_seconds(conn: Connection) -> float:
+    """Returns the time this session has spent waiting on locks, where the backend reports it."""
+    sql = get_dialect(conn)
+    if not sql["lock_wait_ms"]:
+        return 0.0
+    with conn.cursor() as cur:
+        cur.execute(sql["lock_wait_ms"])
+        return cur.fetchone()["lock_wait_ms"] / 1000
+
+
+def delete_in_chunks(conn: Connection, window: tuple[datetime | None, datetime],
+                     chunk_rows: int = DELETE_CHUNK_ROWS,
+                     throttle_seconds: float = DELETE_THROTTLE_SECONDS) -> dict[str, float]:
+    """
+    Deletes the data in the archive window oldest first, chunk_rows at a time with
+    a commit after each chunk, so locks are held briefly and never escalate.
+    Sleeps throttle_seconds between chunks to leave room for ingestion, then moves
+    the high-water mark. Returns the rows deleted, chunks, seconds, rows/sec and
+    seconds spent waiting on locks.
+    """
+    condition, params = window_predicate(window)
+    query = get_dialect(conn)["delete_chunk"].format(limit=int(chunk_rows), condition=condition)
+    start, lock_wait_start = perf_counter(), lock_wait_seconds(conn)
+    deleted, chunks = 0, 0
+
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            chunk_deleted = cur.rowcount
+        conn.commit()
+        deleted, chunks = deleted + chunk_deleted, chunks + 1
+        logging.info("Deleted chunk %d: %d rows so far (%.0f rows/sec).", chunks, deleted,
+                     deleted / max(perf_counter() - start, 1e-9))
+        if chunk_deleted < chunk_rows:
+            break
+        if throttle_seconds:
+            sleep(throttle_seconds)
+
+    with conn.cursor() as cur:
+        record_watermark(cur, window[1])
+    conn.commit()
+
+    seconds = perf_counter() - start
+    stats = {"rows": deleted, "chunks": chunks, "seconds": seconds,
+             "rows_per_second": deleted / max(seconds, 1e-9),
+             "lock_wait_seconds": lock_wait_seconds(conn) - lock_wait_start}
+    logging.info("Expired data deleted from plant database in chunks: %s", stats)
+    return stats
+
+
+def expired_boundaries(conn: Connection) -> list[datetime]:
+    """Returns, oldest first, the partition boundaries of alpha.reading that are
+    over 24 hours old; every reading below one of them has expired."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT CAST(prv.value AS DATETIME) AS boundary
+            FROM sys.partition_range_values AS prv
+            JOIN sys.partition_functions AS pf ON pf.function_id = prv.function_id
+            WHERE pf.name = %s
+            AND CAST(prv.value AS DATETIME) <= DATEADD(HOUR, -24, CURRENT_TIMESTAMP)
+            ORDER BY prv.boundary_id;
+            """, (PARTITION_FUNCTION,))
+        return [row["boundary"] for row in cur.fetchall()]
+
+
+def switch_out_oldest_partition(conn: Connection, boundary: datetime) -> None:
+    """Moves the oldest partition of alpha.reading, everything below boundary,
+    into the empty expired table and removes the boundary. Both are metadata
+    changes, so their cost does not depend on how many rows the partition holds."""
+    with conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE alpha.reading SWITCH PARTITION 1 TO {EXPIRED_TABLE};")
+        cur.execute(f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() MERGE RANGE (%s);",
+                    (boundary,))
+    conn.commit()
+
+
+def first_expired_at(conn: Connection) -> datetime | None:
+    """Returns the earliest reading time in the expired table, or None if it is empty."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT MIN(at) AS first_at FROM {EXPIRED_TABLE};")
+        return cur.fetchone()["first_at"]
+
+
+def truncate_expired(conn: Connection) -> None:
+    """Empties the expired table once its readings are archived."""
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE TABLE {EXPIRED_TABLE};")
+    conn.commit()
+
+
+def extend_partitions(conn: Connection, hours_ahead: int = PARTITIONS_AHEAD_HOURS) -> int:
+    """Adds hourly boundaries until they reach hours_ahead into the future and
+    returns how many were added. Splitting the empty partition at the end of the
+    range keeps new readings out of a single unbounded partition."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT MAX(CAST(prv.value AS DATETIME)) AS last_boundary,
+                DATEADD(HOUR, %s, CURRENT_TIMESTAMP) AS extend_until
+            FROM sys.partition_range_values AS prv
+            JOIN sys.partition_functions AS pf ON pf.function_id = prv.function_id
+            WHERE pf.name = %s;
+            """, (hours_ahead, PARTITION_FUNCTION))
+        row = cur.fetchone()
+        boundary, added = row["last_boundary"] + timedelta(hours=1), 0
+        while boundary <= row["extend_until"]:
+            cur.execute(f"ALTER PARTITION SCHEME {PARTITION_SCHEME} NEXT USED [PRIMARY];")
+            cur.execute(f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() SPLIT RANGE (%s);",
+                        (boundary,))
+            boundary, added = boundary + timedelta(hours=1), added + 1
+    conn.commit()
+    return added
+
+
+def upload_expired(conn: Connection, s3_client: client, bucket: str, first_at: datetime) -> int:
+    """Streams the switched-out readings, the earliest at first_at, into the S3
+    archive and returns how many there were. The run is named after first_at,
+    so archiving the same expired table again replaces its objects."""
+    return archive_query(conn, (f"SELECT * FROM {EXPIRED_TABLE} ORDER BY at;", ()),
+                         s3_client, bucket, window_run_id(first_at))
+
+
+def archive_expired(conn: Connection, s3_client: client, bucket: str) -> int:
+    """Uploads then truncates whatever is in the expired table, returning its row count."""
+    first_at = first_expired_at(conn)
+    if first_at is None:
+        return 0
+    rows = upload_expired(conn, s3_client, bucket, first_at)
+    truncate_expired(conn)
+    return rows
+
+
+def archive_partitions(conn: Connection, s3_client: client, bucket: str) -> int:
+    """Archives expired readings a partition at a time and returns how many there were.
+    Readings left in the expired table by an interrupted run are archived first."""
+    archived = archive_expired(conn, s3_client, bucket)
+    boundaries = expired_boundaries(conn)
+    for boundary in boundaries:
+        switch_out_oldest_partition(conn, boundary)
+        archived += archive_expired(conn, s3_client, bucket)
+    if boundaries:
+        with conn.cursor() as cur:
+            record_watermark(cur, boundaries[-1])
+        conn.commit()
+
+    added = extend_partitions(conn)
+    logging.info("Archived %d expired readings by partition; added %d boundaries.",
+                 archived, added)
+    return archived
 
 
 def handler(event=None, context=None) -> None:
     """Lambda handler to connect to the database, 
-    get data older than 24 hours and save to parquet."""
+    get data older than 24 hours and save to parquet.
+    With EXPIRY_MODE=switch, expired hours are switched out of the partitioned
+    reading table instead of deleted; with EXPIRY_MODE=chunked they are deleted
+    in committed chunks."""
 
     configure_logs()
+    instrumentation.reset()
 
     conn = get_connection()
-    data = get_old_data(conn)
-    logging.info("Expired data retrieved from database.")
-    formatted_data = format_dataframe(data)
-    formatted_data.to_parquet("/tmp/df.parquet")
-
     s3 = client("s3", aws_access_key_id=environ["AWS_ACCESS_KEY"],
                 aws_secret_access_key=environ["AWS_SECRET_ACCESS_KEY"])
-    upload_to_bucket(s3, "/tmp/df.parquet", environ["BUCKET_NAME"])
 
-    remove("/tmp/df.parquet")
+    if environ.get("EXPIRY_MODE") == "switch":
+        archive_partitions(conn, s3, environ["BUCKET_NAME"])
+    else:
+        window = archive_window(conn)
+        archive_old_data(conn, s3, environ["BUCKET_NAME"], window)
+        logging.info("Expired data archived from database.")
 
-    delete_old_data(conn)
+        if environ.get("EXPIRY_MODE") == "chunked":
+            delete_in_chunks(conn, window)
+        else:
+            delete_old_data(conn, window)
 
+    logging.info("Connection metrics: %s", connection_metrics())
+    for line in instrumentation.summary_lines():
+        logging.info(line)
     logging.info("Finished!")
-
-    conn.close()
     return "Finished"
 
 
@@ -0,0 +1,418 @@
+"""Queries archived readings in S3 in place. The catalog picks the objects a
+query can match, then pyarrow.dataset reads only the row groups and columns
+it needs through ranged reads. Fetched footers and row groups are kept in a
+local disk cache, least recently used first out, so repeated queries do not
+download the same data again. Where a compacted file shares a day with other
+objects, that day's manifest decides which of them hold it."""
+
+import io
+import os
+from os import environ
+from pathlib import Path
+from hashlib import sha256
+from argparse import ArgumentParser
+from datetime import date, datetime, time, timedelta
+from functools import reduce
+from operator import or_
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from boto3 import client
+from dotenv import load_dotenv
+from archive_layout import COMPACTED_PREFIX, archive_days, key_days, read_manifest
+from archive_format import READING_SCHEMA
+from archive_catalog import read_catalog, prune
+
+CACHE_DIR = environ.get("ARCHIVE_CACHE_DIR", str(Path.home() / ".cache" / "pigasus-archive"))
+CACHE_BYTES = int(environ.get("ARCHIVE_CACHE_BYTES", str(1024 ** 3)))
+FOOTER_TAIL_BYTES = 8
+METRICS = ["soil_moisture", "temperature"]
+FREQUENCIES = {"hourly": "h", "daily": "D"}
+LEGACY_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class RowGroupCache:
+    """Blocks of archived objects kept as files in a local directory, evicting
+    the least recently used once they take more than max_bytes. Archived
+    objects never change, so a block is only ever fetched once."""
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, name: str) -> Path:
+        """Returns the file a block is cached in."""
+        return self.directory / f"{sha256(name.encode()).hexdigest()}.block"
+
+    def get(self, name: str) -> bytes | None:
+        """Returns a cached block, marking it as recently used, or None."""
+        path = self.path(name)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def put(self, name: str, data: bytes) -> None:
+        """Caches a block, then evicts the least recently used blocks over the limit."""
+        path = self.path(name)
+        partial = path.with_suffix(".partial")
+        partial.write_bytes(data)
+        partial.replace(path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used blocks until the cache fits max_bytes."""
+        blocks = sorted(((entry.stat().st_mtime_ns, entry.stat().st_size, entry)
+                         for entry in self.directory.glob("*.block")), key=lambda block: block[0])
+        total = sum(size for _, size, _ in blocks)
+        for _, size, entry in blocks:
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+
+class S3RangeFile(io.RawIOBase):  # pylint: disable=too-many-instance-attributes
+    """A seekable, read-only view of a parquet object in S3 that fetches the
+    footer and each row group as one cached block with a ranged read."""
+
+    def __init__(self, s3_client: client, bucket: str, key: str, size: int,
+                 cache: RowGroupCache):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.cache = cache
+        self.position = 0
+        self._current = (0, 0, b"")
+        footer = self.cache.get(f"{bucket}/{key}/footer")
+        if footer is None:
+            tail = self.fetch(size - FOOTER_TAIL_BYTES, size)
+            footer = self.fetch(size - int.from_bytes(tail[:4], "little") - FOOTER_TAIL_BYTES, size)
+            self.cache.put(f"{bucket}/{key}/footer", footer)
+        self.metadata = pq.read_metadata(io.BytesIO(b"PAR1" + footer))
+        self.blocks = row_group_spans(self.metadata)
+        self.blocks.append((size - len(footer), size, "footer"))
+
+    def fetch(self, start: int, end: int) -> bytes:
+        """Returns the bytes from start up to end with a ranged read."""
+        return self.s3_client.get_object(Bucket=self.bucket, Key=self.key,
+                                         Range=f"bytes={start}-{end - 1}")["Body"].read()
+
+    def block(self, name: str, start: int, end: int) -> bytes:
+        """Returns a named block of the object from the cache, fetching it on a miss."""
+        cache_name = f"{self.bucket}/{self.key}/{name}"
+        data = self.cache.get(cache_name)
+        if data is None:
+            data = self.fetch(start, end)
+            self.cache.put(cache_name, data)
+        self._current = (start, end, data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = base + offset
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        end = self.size if size is None or size < 0 else min(self.size, self.position + size)
+        chunks = []
+        while self.position < end:
+            start, stop, data = self._current
+            if not start <= self.position < stop:
+                start, stop, data = self.locate(self.position, end)
+            chunk = data[self.position - start:min(stop, end) - start]
+            chunks.append(chunk)
+            self.position += len(chunk)
+        return b"".join(chunks)
+
+    def locate(self, position: int, end: int) -> tuple[int, int, bytes]:
+        """Returns the block holding position, or the uncached bytes up to the next block."""
+        for start, stop, name in self.blocks:
+            if start <= position < stop:
+                return start, stop, self.block(name, start, stop)
+        following = min((start for start, _, _ in self.blocks if start > position), default=end)
+        stop = min(following, end)
+        return position, stop, self.fetch(position, stop)
+
+
+def row_group_spans(metadata: pq.FileMetaData) -> list[tuple[int, int, str]]:
+    """Returns the byte range of every row group's column chunks, with a block name."""
+    spans = []
+    for group in range(metadata.num_row_groups):
+        columns = [metadata.row_group(group).column(index)
+                   for index in range(metadata.num_columns)]
+        starts = [column.dictionary_page_offset if column.has_dictionary_page
+                  else column.data_page_offset for column in columns]
+        ends = [start + column.total_compressed_size for start, column in zip(starts, columns)]
+        spans.append((min(starts), max(ends), f"row_group={group}"))
+    return spans
+
+
+def read_only(*_) -> None:
+    """Refuses any change to the archive filesystem."""
+    raise PermissionError("The archive filesystem is read-only.")
+
+
+class ArchiveFileSystem(pafs.FileSystemHandler):
+    """A read-only pyarrow filesystem over archived objects of known sizes,
+    opening each as an S3RangeFile, plus files held in memory."""
+
+    # pylint: disable=missing-function-docstring
+
+    def __init__(self, s3_client: client, bucket: str, sizes: dict[str, int],
+                 cache: RowGroupCache):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.sizes = sizes
+        self.cache = cache
+        self.files = {}
+
+    def footer(self, key: str) -> pq.FileMetaData:
+        """Returns an object's footer metadata, from the cache where possible."""
+        return S3RangeFile(self.s3_client, self.bucket, key, self.sizes[key], self.cache).metadata
+
+    def add_file(self, path: str, data: bytes) -> None:
+        """Makes data readable at path."""
+        self.files[path] = data
+        self.sizes[path] = len(data)
+
+    def get_type_name(self) -> str:
+        return "pigasus-archive"
+
+    def normalize_path(self, path: str) -> str:
+        return path
+
+    def equals(self, other: pafs.FileSystemHandler) -> bool:
+        return self is other
+
+    def get_file_info(self, paths: list[str]) -> list[pafs.FileInfo]:
+        return [pafs.FileInfo(path, pafs.FileType.File, size=self.sizes[path])
+                if path in self.sizes else pafs.FileInfo(path, pafs.FileType.NotFound)
+                for path in paths]
+
+    def open_input_file(self, path: str) -> pa.NativeFile:
+        if path in self.files:
+            return pa.BufferReader(self.files[path])
+        return pa.PythonFile(S3RangeFile(self.s3_client, self.bucket, path,
+                                         self.sizes[path], self.cache), mode="r")
+
+    def open_input_stream(self, path: str) -> pa.NativeFile:
+        return self.open_input_file(path)
+
+    def get_file_info_selector(self, selector):
+        raise pa.ArrowNotImplementedError("The archive filesystem cannot list objects.")
+
+    create_dir = delete_dir = delete_dir_contents = delete_root_dir_contents = delete_file = \
+        move = copy_file = open_output_stream = open_append_stream = read_only
+
+
+def reading_filter(start: datetime, end: datetime, plant_ids: list[int] | None,
+                   botanist_ids: list[int] | None, legacy: bool = False) -> ds.Expression:
+    """Returns the dataset filter for readings from start up to end by the given
+    plants and botanists. Legacy files store times as strings that sort by time."""
+    bounds = (start.strftime(LEGACY_TIME_FORMAT), end.strftime(LEGACY_TIME_FORMAT)) if legacy \
+        else (pa.scalar(start, pa.timestamp("ms")), pa.scalar(end, pa.timestamp("ms")))
+    condition = (ds.field("at") >= bounds[0]) & (ds.field("at") < bounds[1])
+    if plant_ids is not None:
+        condition &= ds.field("plant_id").isin(plant_ids)
+    if botanist_ids is not None:
+        condition &= ds.field("botanist_id").isin(botanist_ids)
+    return condition
+
+
+def day_sources(s3_client: client, bucket: str, keys: list[str], start: datetime,
+                end: datetime) -> dict[tuple[date, ...] | None, list[str]]:
+    """Returns the keys to read grouped by the only days to read them for, or
+    under None where all their rows count. Where a compacted file shares a day
+    of the query with another object, the day's manifest decides: only the
+    compacted files it lists hold the day, and hourly objects it replaced are
+    left out. So a day compacted again over a different period, or whose
+    replaced objects are still in the catalog, is never read twice."""
+    query_days = set(archive_days(start, end))
+    covered = {key: [day for day in key_days(key) if day in query_days] for key in keys}
+    shared = {day for key, days in covered.items() if key.startswith(COMPACTED_PREFIX)
+              for day in days if sum(day in other for other in covered.values()) > 1}
+    manifests = {day: read_manifest(s3_client, bucket, day) for day in sorted(shared)}
+    sources = {}
+    for key, days in covered.items():
+        kept = [day for day in days if day not in manifests or (
+            key in {file["key"] for file in manifests[day]["files"]}
+            if key.startswith(COMPACTED_PREFIX) else key not in manifests[day]["replaced"])]
+        if kept or not days:
+            sources.setdefault(None if kept == days else tuple(kept), []).append(key)
+    return sources
+
+
+def day_ranges(start: datetime, end: datetime,
+               days: tuple[date, ...] | None) -> list[tuple[datetime, datetime]]:
+    """Returns the time ranges of the query from start up to end within the
+    days, or the whole query if days is None."""
+    if days is None:
+        return [(start, end)]
+    return [(max(start, datetime.combine(day, time())),
+             min(end, datetime.combine(day, time()) + timedelta(days=1))) for day in days]
+
+
+def ranges_filter(ranges: list[tuple[datetime, datetime]], plant_ids: list[int] | None,
+                  botanist_ids: list[int] | None, legacy: bool = False) -> ds.Expression:
+    """Returns the dataset filter for readings in any of the time ranges by the
+    given plants and botanists."""
+    return reduce(or_, (reading_filter(start, end, plant_ids, botanist_ids, legacy)
+                        for start, end in ranges))
+
+
+def group_by_schema(handler: ArchiveFileSystem,
+                    keys: list[str]) -> list[dict[str, pq.FileMetaData]]:
+    """Returns the footers of the objects, grouped by their parquet schema."""
+    groups = []
+    for key in keys:
+        footer = handler.footer(key)
+        group = next((group for group in groups
+                      if next(iter(group.values())).schema.equals(footer.schema)), None)
+        if group is None:
+            groups.append(group := {})
+        group[key] = footer
+    return groups
+
+
+def read_dataset(filesystem: pafs.PyFileSystem, footers: dict[str, pq.FileMetaData],
+                 columns: list[str], condition: ds.Expression) -> pa.Table:
+    """Returns the filtered columns of objects sharing a schema as one table in
+    the tuned schema's types. Their footers are combined into an in-memory
+    _metadata file, so the dataset prunes row groups without reading any footer again."""
+    combined = None
+    for key, footer in footers.items():
+        footer.set_file_path(key)
+        if combined is None:
+            combined = footer
+        else:
+            combined.append_row_groups(footer)
+    buffer = io.BytesIO()
+    combined.write_metadata_file(buffer)
+    path = f"_metadata_{len(filesystem.handler.files)}"
+    filesystem.handler.add_file(path, buffer.getvalue())
+
+    table = ds.parquet_dataset(path, filesystem=filesystem).to_table(
+        columns=columns, filter=condition)
+    return table.cast(pa.schema([READING_SCHEMA.field(name) for name in columns]))
+
+
+class ArchiveReader:
+    """Queries the archive in one bucket, caching fetched blocks on local disk."""
+
+    def __init__(self, s3_client: client, bucket: str, cache: RowGroupCache | None = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.cache = cache or RowGroupCache()
+        self.catalog, _ = read_catalog(s3_client, bucket)
+
+    def refresh(self) -> None:
+        """Re-reads the catalog to see objects archived since the reader was made."""
+        self.catalog, _ = read_catalog(self.s3_client, self.bucket)
+
+    def filesystem(self) -> pafs.PyFileSystem:
+        """Returns a pyarrow filesystem over the objects in the catalog."""
+        sizes = dict(zip(self.catalog["key"], self.catalog["bytes"]))
+        return pafs.PyFileSystem(ArchiveFileSystem(self.s3_client, self.bucket,
+                                                   sizes, self.cache))
+
+    def sources(self, start: datetime, end: datetime, plant_ids: list[int] | None,
+                botanist_ids: list[int] | None) -> dict[tuple[date, ...] | None, list[str]]:
+        """Returns the objects whose catalog statistics can match the query,
+        grouped by the only days to read them for, as day_sources does."""
+        ranges = {"botanist_id": (min(botanist_ids), max(botanist_ids))} if botanist_ids else None
+        keys = prune(self.catalog, start, end, plant_ids, ranges)
+        return day_sources(self.s3_client, self.bucket, keys, start, end)
+
+    def readings(self, start: datetime, end: datetime, *,  # pylint: disable=too-many-arguments
+                 columns: list[str] | None = None, plant_ids: list[int] | None = None,
+                 botanist_ids: list[int] | None = None) -> pd.DataFrame:
+        """Returns the chosen columns of the readings taken from start up to end
+        by the given plants and botanists, or all of them, sorted by plant and time.
+        Only objects whose catalog statistics can match are opened, and only the
+        row groups and columns the filter and projection need are fetched."""
+        filesystem = self.filesystem()
+        columns = columns or READING_SCHEMA.names
+        tables = []
+        for days, day_keys in self.sources(start, end, plant_ids, botanist_ids).items():
+            for footers in group_by_schema(filesystem.handler, day_keys):
+                legacy = not pa.types.is_timestamp(
+                    next(iter(footers.values())).schema.to_arrow_schema().field("at").type)
+                tables.append(read_dataset(filesystem, footers, columns, ranges_filter(
+                    day_ranges(start, end, days), plant_ids, botanist_ids, legacy)))
+        if not tables:
+            return READING_SCHEMA.empty_table().select(columns).to_pandas()
+        readings = pa.concat_tables(tables).to_pandas()
+        order = [column for column in ("plant_id", "at") if column in columns]
+        return readings.sort_values(order, ignore_index=True) if order else readings
+
+    def summary(self, start: datetime, end: datetime, frequency: str = "hourly",
+                plant_ids: list[int] | None = None) -> pd.DataFrame:
+        """Returns each plant's mean, min and max of every measurement per hour
+        or per day, reading only the columns the summary needs."""
+        readings = self.readings(start, end, columns=["plant_id", "at", *METRICS],
+                                 plant_ids=plant_ids)
+        return summarise(readings, frequency)
+
+    def hourly_summary(self, start: datetime, end: datetime,
+                       plant_ids: list[int] | None = None) -> pd.DataFrame:
+        """Returns each plant's hourly mean, min and max of every measurement."""
+        return self.summary(start, end, "hourly", plant_ids)
+
+    def daily_summary(self, start: datetime, end: datetime,
+                      plant_ids: list[int] | None = None) -> pd.DataFrame:
+        """Returns each plant's daily mean, min and max of every measurement."""
+        return self.summary(start, end, "daily", plant_ids)
+
+
+def summarise(readings: pd.DataFrame, frequency: str) -> pd.DataFrame:
+    """Returns each plant's mean, min and max of every measurement per period,
+    with a column per measurement and statistic, such as temperature_mean."""
+    periods = pd.to_datetime(readings["at"]).dt.floor(FREQUENCIES[frequency]).rename("period")
+    summary = readings.groupby(["plant_id", periods])[METRICS].agg(["mean", "min", "max"])
+    summary.columns = [f"{metric}_{statistic}" for metric, statistic in summary.columns]
+    return summary.reset_index()
+
+
+def main() -> None:
+    """Prints a per-plant summary of archived readings for the command line's filter."""
+    parser = ArgumentParser(description="Summarise archived readings in S3.")
+    parser.add_argument("start", type=datetime.fromisoformat)
+    parser.add_argument("end", type=datetime.fromisoformat)
+    parser.add_argument("--plant", type=int, action="append", dest="plant_ids")
+    parser.add_argument("--frequency", choices=FREQUENCIES, default="daily")
+    args = parser.parse_args()
+
+    reader = ArchiveReader(client("s3", aws_access_key_id=environ["AWS_ACCESS_KEY"],
+                                  aws_secret_access_key=environ["AWS_SECRET_ACCESS_KEY"]),
+                           environ["BUCKET_NAME"])
+    print(reader.summary(args.start, args.end, args.frequency, args.plant_ids).to_string())
+    print(f"Cache: {reader.cache.hits} hits, {reader.cache.misses} misses.")
+
+
+if __name__ == "__main__":
+
+    load_dotenv()
+
+    main()
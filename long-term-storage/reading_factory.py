@@ -0,0 +1,31 @@
+"""Builds frames of readings in the shape the archive job exports, for the
+tests and benchmarks that need archive data without a database."""
+
+from datetime import datetime
+from collections.abc import Iterable
+
+import pandas as pd
+
+
+def make_readings(plant_ids: Iterable[int], minutes: Iterable[int], start: datetime,
+                  first_id: int = 0) -> pd.DataFrame:
+    """Returns a reading from each plant at each of the minutes after start,
+    numbered from first_id in time then plant order. Soil moisture is 20 plus
+    the plant id, temperature rises from 10 by a degree an hour, and every plant
+    is looked after by botanist 1 and was last watered at 9:00 on the start day."""
+    grid = pd.MultiIndex.from_product([list(minutes), list(plant_ids)],
+                                      names=["minute", "plant_id"]).to_frame(index=False)
+    return pd.DataFrame({
+        "reading_id": first_id + grid.index,
+        "plant_id": grid["plant_id"],
+        "soil_moisture": 20.0 + grid["plant_id"],
+        "temperature": 10.0 + grid["minute"] / 60,
+        "at": start + pd.to_timedelta(grid["minute"], unit="min"),
+        "botanist_id": 1,
+        "last_watered": start.replace(hour=9, minute=0, second=0, microsecond=0)})
+
+
+def legacy_times(readings: pd.DataFrame) -> pd.DataFrame:
+    """Returns readings with their times as strings, as the legacy export wrote them."""
+    return readings.assign(at=readings["at"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+                           last_watered=readings["last_watered"].dt.strftime("%Y-%m-%d %H:%M:%S"))
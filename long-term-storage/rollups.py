@@ -0,0 +1,180 @@
+"""Per-plant hourly and daily rollups of archived readings: the count, mean,
+min and max of each measurement and the latest watering, kept as small
+parquet files under rollups/ so long-range charts never scan raw readings.
+The archive job builds them from the readings it is already streaming, and
+each file records the archive runs it includes with the latest time and
+highest reading ID each added, so a retried run never counts a reading twice
+while it and later runs still add readings that arrived late, whatever their time."""
+
+import json
+import logging
+from io import BytesIO
+from datetime import datetime
+from collections.abc import Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from boto3 import client
+from archive_layout import archive_days
+
+ROLLUP_PREFIX = "rollups"
+METRICS = ["soil_moisture", "temperature"]
+STATISTICS = ["mean", "min", "max"]
+ROLLUP_FILES = {"hourly": ("h", "%Y-%m"), "daily": ("D", "%Y")}
+ROLLUP_RUNS = b"rollup_runs"
+ROLLUP_RUNS_KEPT = 500
+ROLLUP_SCHEMA = pa.schema(
+    [("plant_id", pa.int16()), ("period", pa.timestamp("ms")), ("readings", pa.int32())]
+    + [(f"{metric}_{statistic}", pa.float64()) for metric in METRICS for statistic in STATISTICS]
+    + [("last_watered", pa.timestamp("ms"))])
+
+
+def rollup_key(frequency: str, at: datetime) -> str:
+    """Returns the S3 key of the rollup file holding the period of a time:
+    a file a month for hourly rollups and a file a year for daily ones."""
+    return f"{ROLLUP_PREFIX}/{frequency}/{at:{ROLLUP_FILES[frequency][1]}}.parquet"
+
+
+def batch_readings(batch: pa.RecordBatch) -> pd.DataFrame:
+    """Returns the columns rollups need from a batch of readings in either
+    archive schema, with times parsed and measurements as floats."""
+    frame = batch.to_pandas()
+    return pd.DataFrame({
+        "reading_id": frame["reading_id"].astype("int64"),
+        "plant_id": frame["plant_id"],
+        "at": pd.to_datetime(frame["at"]).astype("datetime64[ms]"),
+        **{metric: frame[metric].astype(float) for metric in METRICS},
+        "last_watered": pd.to_datetime(frame["last_watered"]).astype("datetime64[ms]")})
+
+
+def aggregate(readings: pd.DataFrame, frequency: str) -> pd.DataFrame:
+    """Returns each plant's rollup of the readings per hour or day."""
+    periods = readings["at"].dt.floor(ROLLUP_FILES[frequency][0]).rename("period")
+    return readings.groupby(["plant_id", periods]).agg(
+        readings=("at", "size"),
+        **{f"{metric}_{statistic}": (metric, statistic)
+           for metric in METRICS for statistic in STATISTICS},
+        last_watered=("last_watered", "max")).reset_index()
+
+
+def merge(rollups: pd.DataFrame) -> pd.DataFrame:
+    """Returns rollups with the rows of each plant and period combined into
+    one, weighting each mean by its reading count."""
+    totals = rollups.assign(**{f"{metric}_total": rollups[f"{metric}_mean"] * rollups["readings"]
+                               for metric in METRICS})
+    merged = totals.groupby(["plant_id", "period"]).agg(
+        readings=("readings", "sum"),
+        **{f"{metric}_{statistic}": (f"{metric}_{statistic}", statistic)
+           for metric in METRICS for statistic in ("min", "max")},
+        **{f"{metric}_total": (f"{metric}_total", "sum") for metric in METRICS},
+        last_watered=("last_watered", "max")).reset_index()
+    for metric in METRICS:
+        merged[f"{metric}_mean"] = merged.pop(f"{metric}_total") / merged["readings"]
+    return merged[ROLLUP_SCHEMA.names]
+
+
+def read_rollup(s3_client: client, bucket: str,
+                key: str) -> tuple[pd.DataFrame, dict[str, tuple[pd.Timestamp, int]]]:
+    """Returns a rollup file and the archive runs it includes, each with the
+    time of the latest reading and the highest reading ID it added, or no
+    rollups and no runs if there is no such file."""
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except s3_client.exceptions.NoSuchKey:
+        return ROLLUP_SCHEMA.empty_table().to_pandas(), {}
+    table = pq.read_table(BytesIO(body))
+    runs = json.loads(table.schema.metadata[ROLLUP_RUNS])
+    return table.to_pandas(), {run_id: (pd.Timestamp(at), reading_id)
+                               for run_id, (at, reading_id) in runs.items()}
+
+
+def write_rollup(s3_client: client, bucket: str, key: str, rollups: pd.DataFrame,
+                 runs: dict[str, tuple[pd.Timestamp, int]]) -> None:
+    """Replaces a rollup file, sorted by plant and period, with a single put
+    that also records the runs it includes. Only the ROLLUP_RUNS_KEPT runs
+    with the latest readings are kept; a run older than those is never retried."""
+    latest = sorted(runs.items(), key=lambda run: run[1])[-ROLLUP_RUNS_KEPT:]
+    schema = ROLLUP_SCHEMA.with_metadata({ROLLUP_RUNS: json.dumps(
+        {run_id: [at.isoformat(), int(reading_id)] for run_id, (at, reading_id) in latest})})
+    buffer = BytesIO()
+    pq.write_table(pa.Table.from_pandas(rollups.sort_values(["plant_id", "period"]),
+                                        schema=schema, preserve_index=False),
+                   buffer, compression="zstd")
+    s3_client.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+
+
+class RollupAccumulator:
+    """Rolls up the readings of an archive run as they stream past, then
+    merges them into the stored rollup files. If a file already includes the
+    run, an earlier attempt at it got that far: a reading no later than the
+    latest one the attempt added, with an ID no higher than any it added, was
+    there for the attempt and is left out. Reading IDs rise in insert order, so
+    a reading that arrived late since the attempt has a higher ID and is added."""
+
+    def __init__(self, s3_client: client, bucket: str, run_id: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.run_id = run_id
+        self.stored = {}
+        self.partials = {}
+
+    def track(self, batches: Iterator[pa.RecordBatch]) -> Iterator[pa.RecordBatch]:
+        """Yields the batches unchanged, rolling up each one on the way."""
+        for batch in batches:
+            self.add(batch)
+            yield batch
+
+    def add(self, batch: pa.RecordBatch) -> None:
+        """Rolls up a batch's readings into every file they belong in."""
+        readings = batch_readings(batch)
+        for frequency, (_, file_format) in ROLLUP_FILES.items():
+            keys = readings["at"].dt.strftime(f"{ROLLUP_PREFIX}/{frequency}/{file_format}.parquet")
+            for key, rows in readings.groupby(keys):
+                _, runs = self.load(key)
+                if self.run_id in runs:
+                    latest_at, latest_id = runs[self.run_id]
+                    rows = rows[(rows["at"] > latest_at) | (rows["reading_id"] > latest_id)]
+                if not rows.empty:
+                    self.partials.setdefault(key, []).append(
+                        (aggregate(rows, frequency), (rows["at"].max(), rows["reading_id"].max())))
+
+    def load(self, key: str) -> tuple[pd.DataFrame, dict[str, tuple[pd.Timestamp, int]]]:
+        """Returns a stored rollup file and the runs it includes, reading it once."""
+        if key not in self.stored:
+            self.stored[key] = read_rollup(self.s3_client, self.bucket, key)
+        return self.stored[key]
+
+    def save(self) -> dict[str, int]:
+        """Merges the run's rollups into their files and returns each updated
+        file's row count. Each file is replaced with a single put."""
+        saved = {}
+        for key, partials in self.partials.items():
+            stored, runs = self.load(key)
+            rollups = merge(pd.concat([stored] + [rollup for rollup, _ in partials],
+                                      ignore_index=True))
+            marks = [mark for _, mark in partials] + [runs.get(self.run_id, (pd.Timestamp.min, -1))]
+            runs = {**runs, self.run_id: (max(at for at, _ in marks),
+                                          max(reading_id for _, reading_id in marks))}
+            write_rollup(self.s3_client, self.bucket, key, rollups, runs)
+            self.stored[key], saved[key] = (rollups, runs), len(rollups)
+        self.partials = {}
+        logging.info("Updated %d rollup files.", len(saved))
+        return saved
+
+
+def read_rollups(s3_client: client, bucket: str, frequency: str,
+                 period: tuple[datetime, datetime],
+                 plant_ids: list[int] | None = None) -> pd.DataFrame:
+    """Returns the hourly or daily rollups of the periods from the start up to
+    the end of period, for the given plants or all of them, sorted by plant and period."""
+    start, end = period
+    keys = sorted({rollup_key(frequency, day) for day in archive_days(start, end)})
+    if not keys:
+        return ROLLUP_SCHEMA.empty_table().to_pandas()
+    rollups = pd.concat([read_rollup(s3_client, bucket, key)[0] for key in keys],
+                        ignore_index=True)
+    keep = (rollups["period"] >= pd.Timestamp(start)) & (rollups["period"] < pd.Timestamp(end))
+    if plant_ids is not None:
+        keep &= rollups["plant_id"].isin(plant_ids)
+    return rollups[keep].sort_values(["plant_id", "period"], ignore_index=True)
@@ -0,0 +1,153 @@
+"""A writable file that streams into an S3 object through a bounded in-memory
+buffer, uploading full parts concurrently with a multipart upload, so archive
+files never need to be written to local storage first."""
+
+from os import environ
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from boto3 import client
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+PART_SIZE = int(environ.get("S3_PART_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_CONCURRENCY = int(environ.get("S3_UPLOAD_CONCURRENCY", "4"))
+
+
+class S3MultipartWriter:  # pylint: disable=too-many-instance-attributes
+    """A file-like object for writing one S3 object.
+    Written bytes are buffered until a part is full, then uploaded in the
+    background; at most max_concurrency parts are in flight, so memory use is
+    bounded by roughly (max_concurrency + 1) * part_size. Objects smaller than
+    one part are uploaded with a single put on close."""
+
+    def __init__(self, s3_client: client, bucket: str, key: str,
+                 part_size: int = PART_SIZE, max_concurrency: int = UPLOAD_CONCURRENCY):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"S3 parts must be at least {MIN_PART_SIZE} bytes.")
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.closed = False
+        self._completed = False
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._executor = None
+        self._in_flight: list[tuple[int, Future]] = []
+        self._parts: list[dict] = []
+        self._position = 0
+        self._started = perf_counter()
+        self._seconds = 0.0
+        self._peak_buffer = 0
+
+    def __enter__(self) -> "S3MultipartWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writable(self) -> bool:
+        """Returns True; this file only supports writing."""
+        return True
+
+    def tell(self) -> int:
+        """Returns the number of bytes written so far."""
+        return self._position
+
+    def flush(self) -> None:
+        """Does nothing; parts are uploaded as soon as they are full."""
+
+    def write(self, data: bytes) -> int:
+        """Buffers data, uploading any parts it fills, and returns its length."""
+        if self.closed:
+            raise ValueError("Cannot write to a closed S3 object.")
+        self._buffer += data
+        self._position += len(data)
+        self._track_buffer()
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._upload_part(part)
+        return len(data)
+
+    def buffered_bytes(self) -> int:
+        """Returns the bytes held in memory: the buffer and the parts in flight."""
+        return len(self._buffer) + sum(size for size, _ in self._in_flight)
+
+    def _track_buffer(self) -> None:
+        self._peak_buffer = max(self._peak_buffer, self.buffered_bytes())
+
+    def _upload_part(self, part: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key)["UploadId"]
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        while len(self._in_flight) >= self.max_concurrency:
+            self._finish_oldest_part()
+        part_number = len(self._parts) + len(self._in_flight) + 1
+        self._in_flight.append((len(part), self._executor.submit(
+            self.s3_client.upload_part, Bucket=self.bucket, Key=self.key,
+            UploadId=self._upload_id, PartNumber=part_number, Body=part)))
+        self._track_buffer()
+
+    def _finish_oldest_part(self) -> None:
+        _, future = self._in_flight.pop(0)
+        self._parts.append({"PartNumber": len(self._parts) + 1,
+                            "ETag": future.result()["ETag"]})
+
+    def close(self) -> None:
+        """Uploads whatever is buffered and completes the object."""
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self.s3_client.put_object(Bucket=self.bucket, Key=self.key,
+                                          Body=bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._upload_part(bytes(self._buffer))
+                while self._in_flight:
+                    self._finish_oldest_part()
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts})
+        except Exception:
+            self.abort()
+            raise
+        self._completed = True
+        self._finish()
+
+    def abort(self) -> None:
+        """Discards the object, including any parts already uploaded, or deletes
+        it if it was already completed."""
+        if self.closed:
+            if self._completed:
+                self.s3_client.delete_object(Bucket=self.bucket, Key=self.key)
+                self._completed = False
+            return
+        for _, future in self._in_flight:
+            future.cancel()
+        self._in_flight = []
+        if self._upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        self._finish()
+
+    def _finish(self) -> None:
+        self.closed = True
+        self._buffer = bytearray()
+        self._seconds = perf_counter() - self._started
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict[str, float]:
+        """Returns the bytes written, parts uploaded, seconds taken, bytes/sec
+        and the most bytes held in memory at once."""
+        seconds = self._seconds if self.closed else perf_counter() - self._started
+        return {"bytes": self._position, "parts": len(self._parts), "seconds": seconds,
+                "bytes_per_second": self._position / max(seconds, 1e-9),
+                "peak_buffer_bytes": self._peak_buffer}
@@ -0,0 +1,119 @@
+"""An alternative archive sink: one SQLite database kept in S3 through
+sqlite-s3vfs, which stores the file as fixed-size block objects, so a query
+fetches only the pages it needs. Readings are indexed by plant and time, and
+each archive run appends its readings in a single transaction."""
+
+from os import environ
+from collections.abc import Iterable
+
+import apsw
+import boto3
+import pandas as pd
+import pyarrow as pa
+from boto3 import client
+from sqlite_s3vfs import S3VFS
+
+SQLITE_ARCHIVE_KEY = environ.get("SQLITE_ARCHIVE_KEY", "sqlite/readings.sqlite")
+SQLITE_PAGE_SIZE = int(environ.get("SQLITE_PAGE_SIZE", "65536"))
+SQLITE_CACHE_KIB = int(environ.get("SQLITE_CACHE_KIB", "65536"))
+COLUMNS = ["reading_id", "plant_id", "soil_moisture", "temperature", "at",
+           "botanist_id", "last_watered"]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reading (
+    reading_id INTEGER PRIMARY KEY,
+    plant_id INT NOT NULL,
+    soil_moisture REAL NOT NULL,
+    temperature REAL NOT NULL,
+    at TEXT NOT NULL,
+    botanist_id INT NOT NULL,
+    last_watered TEXT NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_reading_plant_at ON reading (plant_id, at);
+
+CREATE INDEX IF NOT EXISTS ix_reading_at ON reading (at);
+"""
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def bucket_resource(s3_client: client, bucket: str) -> "boto3.resources.base.ServiceResource":
+    """Returns a boto3 Bucket resource that makes its requests with s3_client."""
+    s3 = boto3.resource("s3", region_name=s3_client.meta.region_name)
+    s3.meta.client = s3_client
+    return s3.Bucket(bucket)
+
+
+def batch_rows(batch: pa.RecordBatch) -> list[tuple]:
+    """Returns a record batch of readings as rows of SQLite values, with times as text."""
+    frame = batch.to_pandas()[COLUMNS]
+    for column in ("at", "last_watered"):
+        if pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].dt.strftime(TIME_FORMAT)
+    return list(zip(*(frame[column].tolist() for column in COLUMNS)))
+
+
+class SQLiteArchive:
+    """A SQLite database of readings stored in S3 under key.
+    Each page is one S3 object of page_size bytes, so a larger page means fewer
+    requests for a range scan and more bytes for a point lookup; the page size
+    only takes effect when the database is created.
+    The VFS does not lock, so only one job may write to the database at a time."""
+
+    def __init__(self, s3_client: client, bucket: str, key: str = SQLITE_ARCHIVE_KEY,
+                 page_size: int = SQLITE_PAGE_SIZE):
+        self.key = key
+        self.vfs = S3VFS(bucket=bucket_resource(s3_client, bucket), block_size=page_size)
+        self.connection = apsw.Connection(key, vfs=self.vfs.name)
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA page_size = {int(page_size)};")
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KIB};")
+        cursor.execute(SCHEMA)
+
+    def __enter__(self) -> "SQLiteArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the database and removes its VFS."""
+        self.connection.close()
+        self.vfs.unregister()
+
+    def append(self, batches: Iterable[pa.RecordBatch]) -> int:
+        """Inserts every batch's readings in one transaction and returns how many
+        were inserted. Dirty pages stay in the page cache until the commit, so each
+        page is uploaded once per run rather than once per row.
+        Readings already archived are skipped, so a failed run can be repeated."""
+        changes = self.connection.total_changes()
+        with self.connection:
+            cursor = self.connection.cursor()
+            for batch in batches:
+                cursor.executemany(f"INSERT OR IGNORE INTO reading ({', '.join(COLUMNS)}) "
+                                   f"VALUES ({', '.join('?' * len(COLUMNS))});",
+                                   batch_rows(batch))
+        return self.connection.total_changes() - changes
+
+    def reading(self, plant_id: int, at: object) -> dict | None:
+        """Returns a plant's reading taken at the given time, or None."""
+        row = self.connection.cursor().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM reading WHERE plant_id = ? AND at = ?;",
+            (plant_id, pd.Timestamp(at).strftime(TIME_FORMAT))).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def readings(self, start: object, end: object,
+                 plant_ids: list[int] | None = None) -> pd.DataFrame:
+        """Returns the readings taken from start up to end, of the given plants
+        if any, sorted by plant and time."""
+        condition, params = "at >= ? AND at < ?", [pd.Timestamp(start).strftime(TIME_FORMAT),
+                                                  pd.Timestamp(end).strftime(TIME_FORMAT)]
+        if plant_ids is not None:
+            condition += f" AND plant_id IN ({', '.join('?' * len(plant_ids))})"
+            params.extend(plant_ids)
+        rows = self.connection.cursor().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM reading WHERE {condition} "
+            "ORDER BY plant_id, at;", params).fetchall()
+        readings = pd.DataFrame(rows, columns=COLUMNS)
+        for column in ("at", "last_watered"):
+            readings[column] = pd.to_datetime(readings[column], format=TIME_FORMAT)
+        return readings
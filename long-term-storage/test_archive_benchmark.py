@@ -0,0 +1,20 @@
+"""Tests for the parquet and SQLite archive benchmark."""
+from archive_benchmark import simulated_readings, benchmark
+
+
+def test_simulated_readings():
+    readings = simulated_readings(plants=3, hours=2)
+
+    assert len(readings) == 360
+    assert readings["reading_id"].is_unique
+    assert sorted(readings["plant_id"].unique()) == [1, 2, 3]
+
+
+def test_backends_find_the_same_readings(s3):
+    report = benchmark(s3, "archive", simulated_readings(plants=3, hours=2),
+                       page_sizes=(4096,), lookups=2)
+
+    assert set(report["query"]) == {"archive", "point lookup", "plant day scan", "hour scan"}
+    assert set(report["backend"]) == {"parquet", "sqlite-4096"}
+    assert all(group["rows"].nunique() == 1 for _, group in report.groupby("query"))
+    assert (report["requests"] > 0).all()
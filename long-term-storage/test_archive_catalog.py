@@ -0,0 +1,150 @@
+"""Tests for the archive catalog."""
+from io import BytesIO
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from reading_factory import make_readings
+from archive_format import reading_batch, encode, writer_options
+from archive_catalog import (CATALOG_KEY, CATALOG_SCHEMA, file_stats, read_footer, read_catalog, write_catalog,
+                             update_catalog, rebuild_catalog, prune, find_objects)
+from compact import compact
+
+START = datetime(2025, 2, 6, 10)
+
+
+def readings(plant_ids: list[int], start: datetime = START, hours: int = 2) -> pd.DataFrame:
+    return make_readings(plant_ids, range(0, 60 * hours, 15), start)
+
+
+def tuned_file(frame: pd.DataFrame) -> bytes:
+    return encode(pa.Table.from_batches([reading_batch(frame)]), **writer_options())
+
+
+@pytest.fixture
+def stored(s3):
+    """Two objects: plants 1-4 over two hours and plants 10-12 three hours later."""
+    entries = []
+    for key, frame in [("readings/a.parquet", readings([1, 2, 3, 4])),
+                       ("readings/b.parquet", readings([10, 11, 12], START + timedelta(hours=5)))]:
+        s3.put_object(Bucket="archive", Key=key, Body=tuned_file(frame))
+        entries.append(file_stats(key, *read_footer(s3, "archive", key)))
+    update_catalog(s3, "archive", entries)
+    return s3
+
+
+def test_file_stats():
+    body = tuned_file(readings([3, 7]))
+    stats = file_stats("key", pq.read_metadata(BytesIO(body)), len(body))
+
+    assert stats["rows"] == 16
+    assert stats["bytes"] == len(body)
+    assert (stats["min_plant_id"], stats["max_plant_id"]) == (3, 7)
+    assert (stats["min_at"], stats["max_at"]) == (START, START + timedelta(minutes=105))
+    assert (stats["min_soil_moisture"], stats["max_soil_moisture"]) == (23.0, 27.0)
+
+
+def test_file_stats_legacy_string_times():
+    frame = readings([1]).assign(at=lambda frame: frame["at"].dt.strftime("%Y-%m-%d %H:%M:%S"))
+    buffer = BytesIO()
+    frame.to_parquet(buffer)
+    stats = file_stats("key", pq.read_metadata(BytesIO(buffer.getvalue())), 0)
+    assert stats["min_at"] == pd.Timestamp(START)
+
+
+def test_read_footer_only_reads_the_end(s3):
+    body = tuned_file(readings(list(range(1, 50)), hours=24))
+    s3.put_object(Bucket="archive", Key="readings/big.parquet", Body=body)
+
+    with patch.object(s3, "get_object", wraps=s3.get_object) as get_object:
+        metadata, size = read_footer(s3, "archive", "readings/big.parquet")
+
+    assert size == len(body)
+    assert metadata.num_rows == 49 * 96
+    assert all("Range" in call.kwargs for call in get_object.call_args_list)
+
+
+def test_update_catalog_adds_and_removes(stored):
+    catalog, _ = read_catalog(stored, "archive")
+    assert sorted(catalog["key"]) == ["readings/a.parquet", "readings/b.parquet"]
+
+    catalog = update_catalog(stored, "archive", [], ["readings/a.parquet"])
+    assert catalog["key"].tolist() == ["readings/b.parquet"]
+    assert read_catalog(stored, "archive")[0]["key"].tolist() == ["readings/b.parquet"]
+
+
+def test_update_catalog_unchanged_skips_write(stored):
+    catalog, _ = read_catalog(stored, "archive")
+    with patch("archive_catalog.write_catalog") as mock_write:
+        update_catalog(stored, "archive", catalog.to_dict("records"), ["readings/missing"])
+    mock_write.assert_not_called()
+
+
+def test_update_catalog_retries_concurrent_change(stored):
+    stale = read_catalog(stored, "archive")
+    update_catalog(stored, "archive", [], ["readings/b.parquet"])
+
+    with patch("archive_catalog.read_catalog",
+               side_effect=[stale, read_catalog(stored, "archive")]):
+        catalog = update_catalog(stored, "archive", [{"key": "readings/c.parquet", "rows": 1}])
+
+    assert sorted(catalog["key"]) == ["readings/a.parquet", "readings/c.parquet"]
+
+
+def test_write_catalog_rejects_stale_etag(stored):
+    catalog, etag = read_catalog(stored, "archive")
+    update_catalog(stored, "archive", [], ["readings/b.parquet"])
+    with pytest.raises(stored.exceptions.ClientError):
+        write_catalog(stored, "archive", catalog, etag)
+
+
+@pytest.mark.parametrize("filters, keys", [
+    ({}, ["readings/a.parquet", "readings/b.parquet"]),
+    ({"start": START, "end": START + timedelta(hours=1)}, ["readings/a.parquet"]),
+    ({"start": START + timedelta(hours=3)}, ["readings/b.parquet"]),
+    ({"plant_ids": [11]}, ["readings/b.parquet"]),
+    ({"plant_ids": [5, 6]}, []),
+    ({"ranges": {"soil_moisture": (30, None)}}, ["readings/b.parquet"]),
+    ({"ranges": {"temperature": (None, 10.5)}}, ["readings/a.parquet", "readings/b.parquet"]),
+])
+def test_find_objects_prunes(stored, filters, keys):
+    assert sorted(find_objects(stored, "archive", **filters)) == keys
+
+
+def test_prune_empty_catalog():
+    assert prune(CATALOG_SCHEMA.empty_table().to_pandas(),
+                 START, START + timedelta(hours=1), [1]) == []
+
+
+def test_compaction_updates_catalog(s3):
+    for hour in range(3):
+        key = f"readings/year=2025/month=02/day=06/hour={10 + hour}/plant_bucket=1/part-run.parquet"
+        s3.put_object(Bucket="archive", Key=key,
+                      Body=tuned_file(readings([1], START + timedelta(hours=hour), 1)))
+        update_catalog(s3, "archive", [file_stats(key, *read_footer(s3, "archive", key))])
+
+    compact(s3, "archive", date(2025, 2, 6))
+
+    catalog, _ = read_catalog(s3, "archive")
+    assert len(catalog) == 1
+    assert catalog["key"][0].startswith("readings/compacted/")
+    assert catalog["rows"][0] == 12
+
+
+def test_rebuild_catalog_skips_replaced(s3):
+    for hour in range(2):
+        key = f"readings/year=2025/month=02/day=06/hour={10 + hour}/plant_bucket=1/part-run.parquet"
+        s3.put_object(Bucket="archive", Key=key,
+                      Body=tuned_file(readings([1], START + timedelta(hours=hour), 1)))
+    with patch("compact.delete_objects", side_effect=RuntimeError("throttled")):
+        with pytest.raises(RuntimeError):
+            compact(s3, "archive", date(2025, 2, 6))
+    s3.delete_object(Bucket="archive", Key=CATALOG_KEY)
+
+    catalog = rebuild_catalog(s3, "archive")
+
+    assert len(catalog) == 1
+    assert catalog["key"][0].startswith("readings/compacted/")
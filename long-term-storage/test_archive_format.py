@@ -0,0 +1,86 @@
+"""Tests for the tuned archive encoding."""
+from io import BytesIO
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from reading_factory import make_readings
+from archive_format import (READING_SCHEMA, reading_batch, writer_options, encode,
+                            compare_formats, format_report)
+
+START = datetime(2025, 2, 6, 10)
+
+
+@pytest.fixture
+def readings():
+    """Readings for three plants over an hour, in the order they arrive."""
+    return make_readings((3, 1, 2), range(60), START).assign(
+        soil_moisture=Decimal("30.5"), temperature=Decimal("12.25"))
+
+
+def test_reading_batch_schema(readings):
+    assert reading_batch(readings).schema == READING_SCHEMA
+
+
+def test_reading_batch_sorted_by_plant_and_time(readings):
+    frame = reading_batch(readings).to_pandas()
+    assert frame["plant_id"].tolist() == [1] * 60 + [2] * 60 + [3] * 60
+    assert frame[frame["plant_id"] == 1]["at"].is_monotonic_increasing
+
+
+def test_reading_batch_parses_string_times(readings):
+    readings["at"] = readings["at"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    assert reading_batch(readings).to_pandas()["at"].min() == START
+
+
+def test_reading_batch_missing_columns(readings):
+    with pytest.raises(KeyError):
+        reading_batch(readings.drop(columns="temperature"))
+
+
+def test_reading_batch_rejects_ids_too_large(readings):
+    readings.loc[0, "plant_id"] = 100_000
+    with pytest.raises(pa.ArrowInvalid):
+        reading_batch(readings)
+
+
+def test_writer_options_unknown_codec():
+    with pytest.raises(ValueError):
+        writer_options("gzip")
+
+
+@pytest.mark.parametrize("codec", ["zstd", "snappy"])
+def test_tuned_file_metadata(readings, codec):
+    table = pa.Table.from_batches([reading_batch(readings)])
+    metadata = pq.ParquetFile(BytesIO(encode(table, **writer_options(codec)))).metadata
+
+    row_group = metadata.row_group(0)
+    assert row_group.column(1).compression == codec.upper()
+    assert "RLE_DICTIONARY" in row_group.column(1).encodings
+    assert [(column.column_index, column.descending) for column in row_group.sorting_columns] \
+        == [(1, False), (4, False)]
+
+
+def test_compare_formats(readings, tmp_path):
+    legacy = readings.assign(
+        at=readings["at"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+        last_watered=readings["last_watered"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+        soil_moisture=readings["soil_moisture"].astype(float),
+        temperature=readings["temperature"].astype(float))
+    legacy.to_parquet(tmp_path / "legacy.parquet")
+
+    report = format_report(tmp_path / "legacy.parquet")
+
+    assert report[["format", "codec"]].values.tolist() == [
+        ["legacy", "snappy"], ["tuned", "zstd"], ["tuned", "snappy"]]
+    assert (report["bytes"].iloc[1:] < report["bytes"].iloc[0]).all()
+    assert report["size_ratio"].iloc[0] == 1
+    assert (report["read_seconds"] > 0).all()
+
+
+def test_compare_formats_single_codec(readings):
+    report = compare_formats(pa.Table.from_batches([reading_batch(readings)]), ("zstd",), 1)
+    assert report["codec"].tolist() == ["snappy", "zstd"]
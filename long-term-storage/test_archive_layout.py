@@ -0,0 +1,107 @@
+"""Tests for the partitioned archive layout."""
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+
+from reading_factory import make_readings, legacy_times
+from archive_format import READING_SCHEMA, reading_batch
+from archive_layout import (
+    plant_bucket, partition_names, new_run_id, object_key, split_by_partition,
+    upload_partitioned, partition_prefixes, list_archive_objects, read_archive, PLANT_BUCKETS,
+    PartitionedWriter, s3_partition_opener, log_upload_stats
+)
+
+START = datetime(2025, 2, 6, 10)
+
+
+@pytest.fixture
+def export_file(tmp_path):
+    """An exported archive file with readings for 16 plants over three hours."""
+    frame = legacy_times(make_readings(range(1, 17), range(0, 180, 30), START))
+    filepath = tmp_path / "export.parquet"
+    frame.to_parquet(filepath)
+    return filepath
+
+
+def test_partition_names():
+    names = partition_names(pd.Series(["2025-02-06 13:45:00"]), pd.Series([PLANT_BUCKETS + 3]))
+    assert names.tolist() == ["year=2025/month=02/day=06/hour=13/plant_bucket=3"]
+
+
+def test_run_ids_do_not_repeat():
+    assert new_run_id() != new_run_id()
+
+
+def test_object_key():
+    assert object_key("year=2025/month=02/day=06/hour=13/plant_bucket=3", "run") == \
+        "readings/year=2025/month=02/day=06/hour=13/plant_bucket=3/part-run.parquet"
+    assert object_key("year=2025/month=02/day=06/hour=13/plant_bucket=3", "run", 2) == \
+        "readings/year=2025/month=02/day=06/hour=13/plant_bucket=3/part-run-2.parquet"
+
+
+def test_writer_closes_least_recently_written_partition(s3):
+    hours = [make_readings([1, 2], [minute], START) for minute in (0, 60, 0)]
+    with PartitionedWriter(s3_partition_opener(s3, "archive", "run"), READING_SCHEMA,
+                           max_open=2) as writer:
+        for frame in hours:
+            writer.write_batch(reading_batch(frame))
+            assert writer.buffered_bytes() > 0
+
+    keys = [file.key for file in writer.files.values()]
+    assert len(keys) == 6
+    assert "readings/year=2025/month=02/day=06/hour=10/plant_bucket=1/part-run-1.parquet" in keys
+    assert sum(len(read_archive(s3, "archive", START, START + timedelta(hours=2), [plant_id]))
+               for plant_id in (1, 2)) == 6
+
+
+def test_upload_stats_report_total_buffered_bytes(s3):
+    with PartitionedWriter(s3_partition_opener(s3, "archive", "run"), READING_SCHEMA,
+                           max_open=None) as writer:
+        writer.write_batch(reading_batch(make_readings(range(1, 17), [0], START)))
+        buffered = writer.buffered_bytes()
+
+    stats = log_upload_stats(writer, "run")
+    assert stats["peak_total_buffer_bytes"] == buffered > stats["peak_buffer_bytes"]
+
+
+def test_split_by_partition(export_file, tmp_path):
+    files = split_by_partition(export_file, tmp_path)
+
+    assert len(files) == 3 * PLANT_BUCKETS
+    assert sum(pd.read_parquet(path).shape[0] for path in files.values()) == 96
+    first_hour_bucket_1 = pd.read_parquet(files["year=2025/month=02/day=06/hour=10/plant_bucket=1"])
+    assert sorted(first_hour_bucket_1["plant_id"].unique()) == [1, 1 + PLANT_BUCKETS]
+
+
+def test_runs_do_not_clobber(export_file, s3):
+    first = upload_partitioned(s3, export_file, "archive", "run-1")
+    second = upload_partitioned(s3, export_file, "archive", "run-2")
+
+    stored = [item["Key"] for item in s3.list_objects_v2(Bucket="archive")["Contents"]]
+    assert len(stored) == len(first) + len(second) == 2 * 3 * PLANT_BUCKETS
+
+
+def test_partition_prefixes_prune_hours_and_buckets():
+    prefixes = partition_prefixes(START + timedelta(minutes=30), START + timedelta(hours=2), [1])
+    assert prefixes == [
+        "readings/year=2025/month=02/day=06/hour=10/plant_bucket=1/",
+        "readings/year=2025/month=02/day=06/hour=11/plant_bucket=1/"]
+
+
+def test_list_archive_objects_only_matching_partitions(export_file, s3):
+    upload_partitioned(s3, export_file, "archive", "run-1")
+    keys = list_archive_objects(s3, "archive", START, START + timedelta(hours=1), [2, 3])
+    assert len(keys) == 2
+
+
+def test_read_archive_filters_rows(export_file, s3):
+    upload_partitioned(s3, export_file, "archive", "run-1")
+    readings = read_archive(s3, "archive", START + timedelta(minutes=30),
+                            START + timedelta(hours=1), [1])
+
+    assert readings["plant_id"].tolist() == [1]
+    assert readings["at"].tolist() == ["2025-02-06 10:30:00"]
+
+
+def test_read_archive_nothing_archived(s3):
+    assert read_archive(s3, "archive", START, START + timedelta(hours=1)).empty
@@ -0,0 +1,148 @@
+"""Tests for archive compaction."""
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+import pandas as pd
+import pytest
+
+from reading_factory import make_readings, legacy_times
+from archive_layout import (upload_partitioned, read_archive, read_manifest, write_manifest,
+                            PLANT_BUCKETS)
+from compact import (compact, compacted_key, compacted_days, fingerprint, write_compacted,
+                     handler)
+
+DAY = date(2025, 2, 6)
+
+
+def export(tmp_path, start: datetime, first_id: int = 0) -> str:
+    """Writes an export of 16 plants' readings every 30 minutes for three hours."""
+    frame = legacy_times(make_readings(range(1, 17), range(0, 180, 30), start, first_id))
+    filepath = tmp_path / f"export-{first_id}.parquet"
+    frame.to_parquet(filepath)
+    return filepath
+
+
+@pytest.fixture
+def archived(s3, tmp_path):
+    """A day with 96 readings in 3 hours of hourly objects."""
+    upload_partitioned(s3, export(tmp_path, datetime(2025, 2, 6, 10)), "archive", "run-1")
+    return s3
+
+
+def stored_keys(s3_client) -> list[str]:
+    return [item["Key"] for item in s3_client.list_objects_v2(Bucket="archive")["Contents"]
+            if "/_" not in item["Key"]]
+
+
+def whole_day(s3_client) -> pd.DataFrame:
+    return read_archive(s3_client, "archive", datetime(2025, 2, 6), datetime(2025, 2, 7))
+
+
+def test_compacted_days():
+    assert compacted_days(compacted_key(DAY, 2, "run")) == [DAY, date(2025, 2, 7)]
+
+
+def test_fingerprint_ignores_order():
+    frame = pd.DataFrame({"plant_id": [1, 2], "at": [1, 2], "reading_id": [1, 2]})
+    assert fingerprint(frame) == fingerprint(frame.iloc[::-1])
+    assert fingerprint(frame) != fingerprint(frame.assign(reading_id=[1, 3]))
+
+
+def test_compact_day(archived):
+    result = compact(archived, "archive", DAY)
+
+    assert result == {"inputs": 3 * PLANT_BUCKETS, "rows": 96, "deleted": 3 * PLANT_BUCKETS}
+    keys = stored_keys(archived)
+    assert len(keys) == 1 and keys[0].startswith("readings/compacted/2025-02-06-1d-")
+    manifest = read_manifest(archived, "archive", DAY)
+    assert manifest["files"][0]["rows"] == 96
+    assert len(manifest["replaced"]) == 3 * PLANT_BUCKETS
+    readings = whole_day(archived)
+    assert len(readings) == 96
+    assert readings["plant_id"].is_monotonic_increasing
+
+
+def test_compact_again_changes_nothing(archived):
+    compact(archived, "archive", DAY)
+    keys = stored_keys(archived)
+
+    assert compact(archived, "archive", DAY) == {"inputs": 1, "rows": 0, "deleted": 0}
+    assert stored_keys(archived) == keys
+
+
+def test_compact_after_late_objects(archived, tmp_path):
+    compact(archived, "archive", DAY)
+    upload_partitioned(archived, export(tmp_path, datetime(2025, 2, 6, 14), 1000),
+                       "archive", "run-2")
+    assert len(whole_day(archived)) == 192
+
+    result = compact(archived, "archive", DAY)
+
+    assert result["rows"] == 192
+    assert result["deleted"] == 1 + 3 * PLANT_BUCKETS
+    assert len(stored_keys(archived)) == 1
+    assert len(whole_day(archived)) == 192
+
+
+def test_rerun_after_failed_delete(archived):
+    with patch("compact.delete_objects", side_effect=RuntimeError("throttled")):
+        with pytest.raises(RuntimeError):
+            compact(archived, "archive", DAY)
+    assert len(stored_keys(archived)) == 1 + 3 * PLANT_BUCKETS
+    assert len(whole_day(archived)) == 96
+
+    assert compact(archived, "archive", DAY)["deleted"] == 3 * PLANT_BUCKETS
+    assert len(stored_keys(archived)) == 1
+
+
+def test_unverified_file_keeps_inputs(archived):
+    def drop_a_row(s3_client, bucket, key, readings):
+        write_compacted(s3_client, bucket, key, readings.iloc[1:])
+
+    with patch("compact.write_compacted", side_effect=drop_a_row):
+        with pytest.raises(ValueError):
+            compact(archived, "archive", DAY)
+
+    assert read_manifest(archived, "archive", DAY)["files"] == []
+    assert len(whole_day(archived)) == 96
+
+
+def test_corrupt_compacted_file(archived):
+    compact(archived, "archive", DAY)
+    manifest = read_manifest(archived, "archive", DAY)
+    manifest["files"][0]["sha256"] = "0" * 64
+    write_manifest(archived, "archive", manifest)
+
+    with pytest.raises(ValueError):
+        compact(archived, "archive", DAY)
+
+
+def test_week_file_kept_while_referenced(archived, tmp_path):
+    upload_partitioned(archived, export(tmp_path, datetime(2025, 2, 7, 10), 1000),
+                       "archive", "run-2")
+    compact(archived, "archive", DAY, days=2)
+    week_file = read_manifest(archived, "archive", DAY)["files"][0]["key"]
+
+    upload_partitioned(archived, export(tmp_path, datetime(2025, 2, 6, 14), 2000),
+                       "archive", "run-3")
+    compact(archived, "archive", DAY)
+
+    assert week_file in stored_keys(archived)
+    assert read_manifest(archived, "archive", date(2025, 2, 7))["files"][0]["key"] == week_file
+    assert len(read_archive(archived, "archive", datetime(2025, 2, 6), datetime(2025, 2, 8))) \
+        == 3 * 96
+
+
+def test_handler_event_period():
+    with patch("compact.client"), patch("compact.compact") as mock_compact, \
+            patch.dict("os.environ", {"AWS_ACCESS_KEY": "key", "AWS_SECRET_ACCESS_KEY": "secret",
+                                      "BUCKET_NAME": "archive"}):
+        handler({"day": "2025-02-06", "days": 7})
+    assert mock_compact.call_args.args[2:] == (DAY, 7)
+
+
+def test_handler_defaults_to_lagged_day():
+    with patch("compact.client"), patch("compact.compact") as mock_compact, \
+            patch.dict("os.environ", {"AWS_ACCESS_KEY": "key", "AWS_SECRET_ACCESS_KEY": "secret",
+                                      "BUCKET_NAME": "archive"}):
+        handler()
+    assert mock_compact.call_args.args[2:] == (date.today() - timedelta(days=2), 1)
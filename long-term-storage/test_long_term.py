@@ -1,13 +1,23 @@
 """Tests for long term storage script."""
 
 import os
-from datetime import datetime, date
-from long_term import get_old_data, format_dataframe, upload_to_bucket, get_connection, handler
-from unittest.mock import patch, MagicMock
+import logging
+from io import BytesIO
+from datetime import datetime, timedelta
+from long_term import (get_old_data, format_dataframe, get_connection, handler,
+                       expired_boundaries, switch_out_oldest_partition, extend_partitions,
+                       upload_expired, archive_partitions, export_query, export_old_data,
+                       ARCHIVE_SCHEMA, archive_window, window_predicate, delete_old_data,
+                       delete_in_chunks, archive_old_data)
+from backends import connect_sqlite
+from archive_format import READING_SCHEMA
+from archive_catalog import CATALOG_KEY, find_objects
+from sqlite_archive import SQLiteArchive
+from rollups import read_rollups
+from unittest.mock import patch, MagicMock, PropertyMock
 import pytest
 import pandas as pd
-import moto
-import boto3
+import pyarrow.parquet as pq
 
 
 @pytest.fixture
@@ -22,18 +32,6 @@ def old_data():
     ]
 
 
-@pytest.fixture
-def empty_bucket():
-    moto_fake = moto.mock_s3()
-    try:
-        moto_fake.start()
-        conn = boto3.resource('s3')
-        conn.create_bucket(Bucket="OS_BUCKET")
-        yield conn
-    finally:
-        moto_fake.stop()
-
-
 @patch("long_term.get_connection")
 def test_get_old_data(mock_connection, old_data):
     """Test to ensure pymssql connection is called."""
@@ -76,27 +74,6 @@ def test_format_dataframe_expected_output(old_data):
         format_dataframe(new_old_df)
 
 
-@patch("datetime.date")
-@moto.mock_aws
-def test_upload_bucket(mock_date, tmp_path):
-    """Tests that files are uploaded to the bucket."""
-    temp_file = tmp_path/"data.parquet"
-    temp_file.write_text("fake_data", encoding="utf-8")
-
-    mock_date.return_value = date(2025, 2, 6)
-
-    conn = boto3.resource("s3", region_name="eu-west-2")
-    conn.create_bucket(Bucket="plant", CreateBucketConfiguration={
-                       'LocationConstraint': "eu-west-2"})
-    s3 = boto3.client("s3", aws_access_key_id="fake key",
-                      aws_secret_access_key="fake secret key", region_name="eu-west-2")
-    upload_to_bucket(s3, temp_file, "plant")
-
-    uploaded_objects = [o["Key"]
-                        for o in s3.list_objects(Bucket="plant")["Contents"]]
-    assert "plant_data_2025-02-06.parquet" in uploaded_objects
-
-
 @patch.dict(os.environ, {"DB_HOST": "host", "DB_USER": "user", "DB_PASSWORD": "password", "DB_NAME": "namee"})
 @patch("long_term.connect")
 def test_get_connection(mock_conn):
@@ -122,22 +99,290 @@ def test_get_old_data_raises_error(mock_connection, old_data):
 
 @patch.dict(os.environ, {"DB_HOST": "host", "DB_USER": "user", "DB_PASSWORD": "password", "DB_NAME": "namee", "AWS_ACCESS_KEY": "key", "AWS_SECRET_ACCESS_KEY": "key2", "BUCKET_NAME": "bucket"})
 @patch("long_term.get_connection")
-@patch("long_term.get_old_data")
-@patch("long_term.format_dataframe")
+@patch("long_term.archive_window")
+@patch("long_term.archive_old_data")
 @patch("long_term.client")
-@patch("long_term.upload_to_bucket")
-@patch("long_term.remove")
 @patch("long_term.delete_old_data")
-def test_handler_finish(mock_delete, mock_remove, mock_upload_to_bucket, mock_client, mock_format, mock_get_old, mock_get_connection, old_data):
-    """Tests that handler reaches finish."""
+def test_handler_finish(mock_delete, mock_client, mock_archive, mock_window, mock_get_connection):
+    """Tests that handler archives then deletes the archive window and reaches finish."""
     mock_conn = MagicMock()
     mock_get_connection.return_value = mock_conn
-    mock_get_old.return_value = old_data
-    mock_formatted_data = MagicMock()
-    mock_format.return_value = mock_formatted_data
-    mock_formatted_data.to_parquet = MagicMock()
-
+    window = (None, datetime(2025, 2, 6))
+    mock_window.return_value = window
     mock_s3_client = MagicMock()
     mock_client.return_value = mock_s3_client
 
     assert handler() == "Finished"
+    mock_archive.assert_called_once_with(mock_conn, mock_s3_client, "bucket", window)
+    mock_delete.assert_called_once_with(mock_conn, window)
+
+
+@pytest.fixture
+def partition_conn():
+    """A connection whose cursor is the same mock with or without a with block."""
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.__enter__.return_value = mock_cursor
+    return mock_conn
+
+
+def executed(mock_conn):
+    return [" ".join(c.args[0].split()) for c in mock_conn.cursor.return_value.execute.call_args_list]
+
+
+def test_expired_boundaries(partition_conn):
+    partition_conn.cursor.return_value.fetchall.return_value = [
+        {"boundary": datetime(2025, 2, 2, 15)}, {"boundary": datetime(2025, 2, 2, 16)}]
+    assert expired_boundaries(partition_conn) == [datetime(2025, 2, 2, 15), datetime(2025, 2, 2, 16)]
+
+
+def test_switch_out_oldest_partition(partition_conn):
+    switch_out_oldest_partition(partition_conn, datetime(2025, 2, 2, 15))
+    assert executed(partition_conn) == [
+        "ALTER TABLE alpha.reading SWITCH PARTITION 1 TO alpha.reading_expired;",
+        "ALTER PARTITION FUNCTION pf_reading_hour() MERGE RANGE (%s);"]
+    partition_conn.commit.assert_called_once()
+
+
+def test_extend_partitions_splits_each_missing_hour(partition_conn):
+    partition_conn.cursor.return_value.fetchone.return_value = {
+        "last_boundary": datetime(2025, 2, 6, 10), "extend_until": datetime(2025, 2, 6, 13, 30)}
+    assert extend_partitions(partition_conn) == 3
+    splits = [c.args[1] for c in partition_conn.cursor.return_value.execute.call_args_list
+              if "SPLIT RANGE" in c.args[0]]
+    assert splits == [(datetime(2025, 2, 6, 11),), (datetime(2025, 2, 6, 12),),
+                      (datetime(2025, 2, 6, 13),)]
+
+
+def test_extend_partitions_already_ahead(partition_conn):
+    partition_conn.cursor.return_value.fetchone.return_value = {
+        "last_boundary": datetime(2025, 2, 8, 10), "extend_until": datetime(2025, 2, 8, 9)}
+    assert extend_partitions(partition_conn) == 0
+
+
+@patch("long_term.extend_partitions")
+@patch("long_term.switch_out_oldest_partition")
+@patch("long_term.expired_boundaries")
+@patch("long_term.upload_expired")
+@patch("long_term.truncate_expired")
+@patch("long_term.first_expired_at")
+def test_archive_partitions(mock_first_at, mock_truncate, mock_upload, mock_boundaries,
+                            mock_switch, mock_extend, partition_conn):
+    """Leftover expired readings are archived first, then each expired partition in turn."""
+    mock_first_at.side_effect = [datetime(2025, 2, 2, 14), None, datetime(2025, 2, 3, 7)]
+    mock_upload.side_effect = [1, 2]
+    mock_boundaries.return_value = [datetime(2025, 2, 2, 15), datetime(2025, 2, 3, 8)]
+    mock_extend.return_value = 0
+
+    assert archive_partitions(partition_conn, MagicMock(), "bucket") == 3
+    assert mock_switch.call_count == 2
+    assert mock_upload.call_count == 2
+    assert mock_truncate.call_count == 2
+
+
+@pytest.fixture
+def archive_db(tmp_path):
+    """A SQLite stand-in holding 250 readings from two days ago."""
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"), as_dict=True)
+    at = datetime.now().replace(microsecond=0) - timedelta(days=2)
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO alpha.reading (plant_id, soil_moisture, temperature, at, botanist_id, last_watered) "
+            "VALUES (%s, %s, %s, %s, %s, %s);",
+            seq_of_parameters=[(i, 30.5, 12.25, at + timedelta(seconds=i), 1, at) for i in range(250)])
+    conn.commit()
+    return conn
+
+
+def test_upload_expired_partitioned(partition_conn, old_data, s3):
+    partition_conn.cursor.return_value.fetchmany.side_effect = [old_data, []]
+
+    assert upload_expired(partition_conn, s3, "archive", datetime(2025, 2, 2, 15, 10)) == 2
+    uploaded_objects = [o["Key"] for o in s3.list_objects(Bucket="archive",
+                                                          Prefix="readings/")["Contents"]
+                        if o["Key"] != CATALOG_KEY]
+    assert sorted(uploaded_objects) == [
+        "readings/year=2025/month=02/day=02/hour=15/plant_bucket=1/part-from-20250202T151000.parquet",
+        "readings/year=2025/month=02/day=03/hour=07/plant_bucket=2/part-from-20250202T151000.parquet"]
+
+
+def test_export_query_writes_a_row_group_per_chunk(archive_db, tmp_path):
+    filepath = tmp_path / "export.parquet"
+    rows = export_query(archive_db, "SELECT * FROM alpha.reading;", filepath, chunk_rows=100)
+
+    parquet_file = pq.ParquetFile(filepath)
+    assert rows == parquet_file.metadata.num_rows == 250
+    assert parquet_file.metadata.num_row_groups == 3
+    assert parquet_file.metadata.row_group(0).num_rows == 100
+    assert parquet_file.schema_arrow == ARCHIVE_SCHEMA
+
+
+def test_export_query_matches_format_dataframe(archive_db, tmp_path):
+    filepath = tmp_path / "export.parquet"
+    export_query(archive_db, "SELECT * FROM alpha.reading;", filepath, chunk_rows=100)
+
+    expected = format_dataframe(get_old_data(archive_db))
+    pd.testing.assert_frame_equal(pd.read_parquet(filepath), expected, check_dtype=False)
+
+
+def test_export_old_data_raises_when_empty(tmp_path):
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"), as_dict=True)
+    filepath = tmp_path / "export.parquet"
+    with pytest.raises(ValueError):
+        export_old_data(conn, filepath)
+    assert not filepath.exists()
+
+
+@patch.dict(os.environ, {"AWS_ACCESS_KEY": "key", "AWS_SECRET_ACCESS_KEY": "key2", "BUCKET_NAME": "bucket", "EXPIRY_MODE": "switch"})
+@patch("long_term.get_connection")
+@patch("long_term.client")
+@patch("long_term.archive_partitions")
+@patch("long_term.delete_old_data")
+def test_handler_switch_mode(mock_delete, mock_archive, mock_client, mock_get_connection):
+    """Tests that switch mode archives by partition instead of deleting rows."""
+    assert handler() == "Finished"
+    mock_archive.assert_called_once()
+    mock_delete.assert_not_called()
+
+
+def test_window_predicate_first_run():
+    assert window_predicate((None, datetime(2025, 2, 5, 12))) == (
+        "at < %s", (datetime(2025, 2, 5, 12),))
+
+
+def test_window_predicate_has_no_lower_bound():
+    window = (datetime(2025, 2, 5, 11), datetime(2025, 2, 5, 12))
+    assert window_predicate(window) == ("at < %s", (datetime(2025, 2, 5, 12),))
+
+
+def test_export_and_delete_cover_the_same_rows(archive_db, tmp_path):
+    with archive_db.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO alpha.reading (plant_id, soil_moisture, temperature, at, botanist_id, last_watered) "
+            "VALUES (%s, %s, %s, %s, %s, %s);", (1, 30.5, 12.25, datetime.now(), 1, datetime.now()))
+    archive_db.commit()
+
+    window = archive_window(archive_db)
+    assert window[0] is None
+    exported = export_old_data(archive_db, tmp_path / "export.parquet", window)
+    delete_old_data(archive_db, window)
+
+    with archive_db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS remaining FROM alpha.reading;")
+        assert cursor.fetchone()["remaining"] == 1
+    assert exported == 250
+    assert archive_window(archive_db)[0] == window[1].replace(microsecond=0)
+
+
+def test_next_window_starts_at_watermark(archive_db, tmp_path):
+    window = archive_window(archive_db)
+    export_old_data(archive_db, tmp_path / "export.parquet", window)
+    delete_old_data(archive_db, window)
+
+    next_window = archive_window(archive_db)
+    assert next_window[0] == window[1].replace(microsecond=0)
+    with pytest.raises(ValueError):
+        export_old_data(archive_db, tmp_path / "next.parquet", next_window)
+
+
+def test_late_rows_below_watermark_are_archived_and_deleted(archive_db, tmp_path):
+    window = archive_window(archive_db)
+    export_old_data(archive_db, tmp_path / "export.parquet", window)
+    delete_old_data(archive_db, window)
+    with archive_db.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO alpha.reading (plant_id, soil_moisture, temperature, at, botanist_id, last_watered) "
+            "VALUES (%s, %s, %s, %s, %s, %s);",
+            (1, 30.5, 12.25, window[1] - timedelta(hours=2), 1, window[1] - timedelta(hours=3)))
+    archive_db.commit()
+
+    next_window = archive_window(archive_db)
+    assert export_old_data(archive_db, tmp_path / "late.parquet", next_window) == 1
+    delete_old_data(archive_db, next_window)
+
+    with archive_db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS remaining FROM alpha.reading;")
+        assert cursor.fetchone()["remaining"] == 0
+
+
+def test_delete_in_chunks(archive_db):
+    window = archive_window(archive_db)
+    stats = delete_in_chunks(archive_db, window, chunk_rows=100)
+
+    assert stats["rows"] == 250
+    assert stats["chunks"] == 3
+    assert stats["lock_wait_seconds"] == 0
+    with archive_db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS remaining FROM alpha.reading;")
+        assert cursor.fetchone()["remaining"] == 0
+    assert archive_window(archive_db)[0] == window[1].replace(microsecond=0)
+
+
+def test_delete_in_chunks_commits_each_chunk_and_throttles(partition_conn):
+    type(partition_conn.cursor.return_value).rowcount = PropertyMock(side_effect=[10, 10, 4, 1])
+    partition_conn.cursor.return_value.fetchone.side_effect = [
+        {"lock_wait_ms": 100}, {"lock_wait_ms": 350}]
+
+    with patch("long_term.sleep") as mock_sleep:
+        stats = delete_in_chunks(partition_conn, (None, datetime(2025, 2, 5, 12)),
+                                 chunk_rows=10, throttle_seconds=0.5)
+
+    assert stats["rows"] == 24
+    assert stats["chunks"] == 3
+    assert stats["lock_wait_seconds"] == pytest.approx(0.25)
+    assert mock_sleep.call_count == 2
+    assert partition_conn.commit.call_count == 4
+    assert "TOP (10)" in executed(partition_conn)[1]
+
+
+def archived_keys(s3) -> list[str]:
+    """The keys of the archived reading objects in the archive bucket."""
+    return [o["Key"] for o in s3.list_objects_v2(Bucket="archive", Prefix="readings/")["Contents"]
+            if o["Key"] != CATALOG_KEY]
+
+
+def test_archive_old_data_streams_to_s3(archive_db, s3):
+    assert archive_old_data(archive_db, s3, "archive") == 250
+    keys = archived_keys(s3)
+    assert all(key.startswith("readings/year=") for key in keys)
+    tables = [pq.read_table(BytesIO(s3.get_object(Bucket="archive", Key=key)["Body"].read()))
+              for key in keys]
+    assert sum(table.num_rows for table in tables) == 250
+    assert all(table.schema.equals(READING_SCHEMA) for table in tables)
+    assert sorted(find_objects(s3, "archive")) == sorted(keys)
+    daily = read_rollups(s3, "archive", "daily", (datetime.now() - timedelta(days=3),
+                                                  datetime.now()))
+    assert daily["readings"].sum() == 250
+
+
+def test_retried_archive_run_replaces_its_objects(archive_db, s3):
+    archive_old_data(archive_db, s3, "archive", archive_window(archive_db))
+    first_keys = archived_keys(s3)
+
+    assert archive_old_data(archive_db, s3, "archive", archive_window(archive_db)) == 250
+    assert sorted(archived_keys(s3)) == sorted(first_keys)
+    assert all(key.endswith("/part-initial.parquet") for key in first_keys)
+    assert sorted(find_objects(s3, "archive")) == sorted(first_keys)
+    daily = read_rollups(s3, "archive", "daily", (datetime.now() - timedelta(days=3),
+                                                  datetime.now()))
+    assert daily["readings"].sum() == 250
+
+
+@patch("long_term.ARCHIVE_SINK", "sqlite")
+def test_archive_old_data_to_sqlite(archive_db, s3):
+    assert archive_old_data(archive_db, s3, "archive") == 250
+    assert not s3.list_objects_v2(Bucket="archive", Prefix="readings/")["KeyCount"]
+    with SQLiteArchive(s3, "archive") as archive:
+        readings = archive.readings(datetime.now() - timedelta(days=3), datetime.now())
+    assert len(readings) == 250
+    assert readings["temperature"].eq(12.25).all()
+
+
+@patch("long_term.ARCHIVE_SINK", "sqlite")
+def test_retried_archive_run_to_sqlite_counts_archived_readings(archive_db, s3, caplog):
+    archive_old_data(archive_db, s3, "archive")
+
+    with caplog.at_level(logging.INFO):
+        assert archive_old_data(archive_db, s3, "archive") == 250
+    assert "Appended 0 of 250 readings to the SQLite archive." in caplog.messages
@@ -0,0 +1,178 @@
+"""Tests for querying the archive in place."""
+import time
+from io import BytesIO
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pandas as pd
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import pytest
+
+from reading_factory import make_readings, legacy_times
+from archive_format import reading_batch, writer_options
+from archive_catalog import file_stats, read_footer, update_catalog
+from compact import compact
+from query_archive import RowGroupCache, ArchiveReader, row_group_spans, summarise
+
+START = datetime(2025, 2, 6, 10)
+
+
+def readings(plant_ids: list[int], start: datetime, first_id: int = 0) -> pd.DataFrame:
+    """Readings every ten minutes for three hours; plant 2 is looked after by botanist 2."""
+    frame = make_readings(plant_ids, range(0, 180, 10), start, first_id)
+    return frame.assign(botanist_id=frame["plant_id"].eq(2) + 1)
+
+
+def archive(s3_client, key: str, frame: pd.DataFrame, legacy: bool = False) -> None:
+    """Archives readings in row groups of 10 rows and adds them to the catalog."""
+    buffer = BytesIO()
+    if legacy:
+        pq.write_table(pa.Table.from_pandas(legacy_times(frame), preserve_index=False), buffer,
+                       row_group_size=10)
+    else:
+        table = pa.Table.from_batches([reading_batch(frame)])
+        with pq.ParquetWriter(buffer, table.schema, **writer_options()) as writer:
+            writer.write_table(table, row_group_size=10)
+    s3_client.put_object(Bucket="archive", Key=key, Body=buffer.getvalue())
+    update_catalog(s3_client, "archive", [file_stats(key, *read_footer(s3_client, "archive", key))])
+
+
+@pytest.fixture
+def s3(s3):
+    """The archive bucket with two plants' tuned readings and two plants' legacy
+    readings on one day, and the first two plants' tuned readings the next."""
+    archive(s3, "readings/a.parquet", readings([1, 2], START))
+    archive(s3, "readings/b.parquet", readings([3, 4], START), legacy=True)
+    archive(s3, "readings/c.parquet", readings([1, 2], START + timedelta(days=1), 500))
+    return s3
+
+
+@pytest.fixture
+def reader(s3, tmp_path):
+    return ArchiveReader(s3, "archive", RowGroupCache(tmp_path / "cache"))
+
+
+def test_readings_time_and_plant(reader):
+    result = reader.readings(START + timedelta(minutes=30), START + timedelta(hours=1),
+                             plant_ids=[2, 3])
+
+    assert result["plant_id"].tolist() == [2, 2, 2, 3, 3, 3]
+    assert result["at"].min() == START + timedelta(minutes=30)
+    assert result["at"].max() == START + timedelta(minutes=50)
+
+
+def test_readings_legacy_objects_use_tuned_types(reader):
+    result = reader.readings(START, START + timedelta(hours=3), plant_ids=[4])
+
+    assert len(result) == 18
+    assert str(result["at"].dtype) == "datetime64[ms]"
+    assert str(result["temperature"].dtype) == "float32"
+
+
+def test_readings_botanist(reader):
+    result = reader.readings(START, START + timedelta(days=2), botanist_ids=[2])
+    assert set(result["plant_id"]) == {2}
+    assert len(result) == 36
+
+
+def test_readings_projection(reader):
+    result = reader.readings(START, START + timedelta(hours=1), columns=["plant_id", "temperature"])
+    assert result.columns.tolist() == ["plant_id", "temperature"]
+    assert len(result) == 4 * 6
+
+
+def test_readings_nothing_matches(reader):
+    assert reader.readings(START - timedelta(days=5), START - timedelta(days=4)).empty
+
+
+def test_filesystem_is_read_only(reader):
+    filesystem = reader.filesystem()
+    with pytest.raises(PermissionError):
+        filesystem.delete_file("readings/a.parquet")
+    with pytest.raises(pa.ArrowNotImplementedError):
+        filesystem.get_file_info(pafs.FileSelector("readings"))
+
+
+def test_day_compacted_again_is_read_once(s3, tmp_path):
+    day = "readings/year=2025/month=02/day={:02d}/hour=10/plant_bucket=5/part-{}.parquet"
+    archive(s3, day.format(6, "run-1"), readings([5, 6], START, 1000))
+    archive(s3, day.format(7, "run-1"), readings([5, 6], START + timedelta(days=1), 2000))
+    compact(s3, "archive", START.date(), days=2)
+    archive(s3, day.format(6, "run-2"), readings([7], START, 3000))
+    compact(s3, "archive", START.date())
+
+    result = ArchiveReader(s3, "archive", RowGroupCache(tmp_path / "cache")).readings(
+        START - timedelta(hours=10), START + timedelta(days=2), plant_ids=[5, 6, 7])
+
+    assert result["reading_id"].is_unique
+    assert len(result) == 2 * 36 + 18
+
+
+def test_catalog_prunes_objects(s3, reader):
+    with patch.object(s3, "get_object", wraps=s3.get_object) as get_object:
+        reader.readings(START + timedelta(days=1), START + timedelta(days=2))
+    assert {call.kwargs["Key"] for call in get_object.call_args_list} == {"readings/c.parquet"}
+
+
+def test_only_matching_row_groups_fetched(s3, reader):
+    with patch.object(s3, "get_object", wraps=s3.get_object) as get_object:
+        reader.readings(START, START + timedelta(minutes=20), plant_ids=[1])
+    ranges = [call.kwargs["Range"].removeprefix("bytes=").split("-")
+              for call in get_object.call_args_list
+              if call.kwargs["Key"] == "readings/a.parquet" and call.kwargs.get("Range")]
+    spans = row_group_spans(pq.read_metadata(BytesIO(
+        s3.get_object(Bucket="archive", Key="readings/a.parquet")["Body"].read())))
+    data = [(int(start), int(end) + 1) for start, end in ranges
+            if start and int(start) < spans[-1][1]]
+
+    # Plant 1's first readings are in the first two row groups; plant 2 fills the rest.
+    assert data == [spans[0][:2], spans[1][:2]]
+
+
+def test_repeated_query_served_from_cache(s3, reader):
+    first = reader.readings(START, START + timedelta(days=2), plant_ids=[1, 3])
+    with patch.object(s3, "get_object", wraps=s3.get_object) as get_object:
+        second = reader.readings(START, START + timedelta(days=2), plant_ids=[1, 3])
+
+    get_object.assert_not_called()
+    assert reader.cache.hits > 0
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = RowGroupCache(tmp_path, max_bytes=25)
+    cache.put("a", b"a" * 10)
+    time.sleep(0.01)
+    cache.put("b", b"b" * 10)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", b"c" * 10)
+
+    assert cache.get("a") == b"a" * 10
+    assert cache.get("b") is None
+    assert cache.get("c") == b"c" * 10
+
+
+def test_summarise():
+    frame = pd.DataFrame({"plant_id": [1, 1, 1, 2],
+                          "at": pd.to_datetime(["2025-02-06 10:00", "2025-02-06 10:30",
+                                                "2025-02-06 11:00", "2025-02-06 10:15"]),
+                          "soil_moisture": [10.0, 20.0, 30.0, 5.0],
+                          "temperature": [1.0, 3.0, 5.0, 7.0]})
+
+    hourly = summarise(frame, "hourly")
+    daily = summarise(frame, "daily")
+
+    assert hourly[["plant_id", "soil_moisture_mean", "soil_moisture_min",
+                   "soil_moisture_max"]].values.tolist() == [
+        [1, 15.0, 10.0, 20.0], [1, 30.0, 30.0, 30.0], [2, 5.0, 5.0, 5.0]]
+    assert daily["temperature_mean"].tolist() == [3.0, 7.0]
+
+
+def test_daily_summary(reader):
+    summary = reader.daily_summary(START, START + timedelta(days=2), plant_ids=[1])
+    assert summary["period"].tolist() == [pd.Timestamp("2025-02-06"), pd.Timestamp("2025-02-07")]
+    assert summary["temperature_min"].tolist() == [10.0, 10.0]
+    assert summary["temperature_max"].tolist() == pytest.approx([10 + 170 / 60] * 2)
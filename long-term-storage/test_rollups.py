@@ -0,0 +1,133 @@
+"""Tests for the hourly and daily rollups of archived readings."""
+from datetime import datetime, timedelta
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from reading_factory import make_readings
+from archive_format import reading_batch
+from rollups import (aggregate, merge, batch_readings, rollup_key, read_rollup, read_rollups,
+                     RollupAccumulator)
+
+START = datetime(2025, 1, 31, 22)
+
+
+def readings(minutes: range, plant_ids: list[int] = (1, 2)) -> pd.DataFrame:
+    """Readings every ten minutes; each plant is watered on the hour."""
+    frame = make_readings(plant_ids, minutes, START, minutes.start * len(plant_ids))
+    return frame.assign(last_watered=frame["at"].dt.floor("h"))
+
+
+def archive_run(s3_client, run_id: str, *frames: pd.DataFrame) -> dict[str, int]:
+    """Streams batches through an accumulator, as an archive run does, and saves the rollups."""
+    rollups = RollupAccumulator(s3_client, "archive", run_id)
+    for _ in rollups.track(reading_batch(frame) for frame in frames):
+        pass
+    return rollups.save()
+
+
+def test_rollup_key():
+    assert rollup_key("hourly", START) == "rollups/hourly/2025-01.parquet"
+    assert rollup_key("daily", START) == "rollups/daily/2025.parquet"
+
+
+def test_aggregate_hourly():
+    rollup = aggregate(batch_readings(reading_batch(readings(range(0, 60, 10), [1]))), "hourly")
+
+    assert len(rollup) == 1
+    row = rollup.iloc[0]
+    assert row["period"] == START
+    assert row["readings"] == 6
+    assert row["temperature_mean"] == pytest.approx(10 + 25 / 60)
+    assert (row["temperature_min"], row["temperature_max"]) == pytest.approx((10, 10 + 50 / 60))
+    assert row["last_watered"] == START
+
+
+def test_merge_weights_means_by_count():
+    frame = batch_readings(reading_batch(readings(range(0, 60, 10), [1])))
+    merged = merge(pd.concat([aggregate(frame[:2], "hourly"), aggregate(frame[2:], "hourly")]))
+
+    expected = aggregate(frame, "hourly")
+    pd.testing.assert_frame_equal(merged, expected[merged.columns], check_dtype=False)
+
+
+def test_batch_readings_accepts_legacy_batches():
+    frame = readings(range(0, 20, 10)).assign(
+        at=lambda df: df["at"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+        last_watered=lambda df: df["last_watered"].dt.strftime("%Y-%m-%d %H:%M:%S"))
+
+    result = batch_readings(pa.RecordBatch.from_pandas(frame, preserve_index=False))
+
+    assert str(result["at"].dtype) == "datetime64[ms]"
+    assert result["at"].iloc[0] == START
+
+
+def test_run_writes_hourly_files_per_month_and_daily_per_year(s3):
+    saved = archive_run(s3, "run-1", readings(range(0, 240, 10)))
+
+    assert saved == {"rollups/hourly/2025-01.parquet": 4, "rollups/hourly/2025-02.parquet": 4,
+                     "rollups/daily/2025.parquet": 4}
+    daily = read_rollups(s3, "archive", "daily", (datetime(2025, 1, 1), datetime(2025, 3, 1)))
+    assert daily["readings"].tolist() == [12, 12, 12, 12]
+    assert daily["period"].tolist() == [datetime(2025, 1, 31), datetime(2025, 2, 1)] * 2
+
+
+def test_incremental_runs_match_one_run(s3):
+    archive_run(s3, "run-1", readings(range(0, 70, 10)))
+    archive_run(s3, "run-2", readings(range(70, 150, 10)), readings(range(150, 240, 10)))
+
+    frame = batch_readings(reading_batch(readings(range(0, 240, 10))))
+    hourly = read_rollups(s3, "archive", "hourly", (START, START + timedelta(hours=4)))
+    expected = aggregate(frame, "hourly")
+    pd.testing.assert_frame_equal(hourly, expected[hourly.columns], check_dtype=False)
+
+
+def test_repeated_run_counts_nothing_twice(s3):
+    archive_run(s3, "run-1", readings(range(0, 120, 10)))
+    first, runs = read_rollup(s3, "archive", "rollups/daily/2025.parquet")
+
+    assert archive_run(s3, "run-1", readings(range(0, 120, 10))) == {}
+    second, _ = read_rollup(s3, "archive", "rollups/daily/2025.parquet")
+    pd.testing.assert_frame_equal(first, second)
+    assert runs == {"run-1": (START + timedelta(minutes=110), 23)}
+
+
+def test_retried_run_adds_only_its_new_readings(s3):
+    archive_run(s3, "run-1", readings(range(0, 60, 10)))
+    archive_run(s3, "run-1", readings(range(0, 120, 10)))
+
+    daily = read_rollups(s3, "archive", "daily", (START.replace(hour=0), START + timedelta(days=1)))
+    assert daily["readings"].tolist() == [12, 12]
+
+
+def test_retried_run_adds_readings_that_arrived_late(s3):
+    archive_run(s3, "run-1", readings(range(0, 120, 10)))
+    late = readings(range(5, 15, 10), [1]).assign(reading_id=100)
+    archive_run(s3, "run-1", readings(range(0, 120, 10)), late)
+
+    hourly = read_rollups(s3, "archive", "hourly", (START, START + timedelta(hours=1)))
+    assert hourly["readings"].tolist() == [7, 6]
+    _, runs = read_rollup(s3, "archive", "rollups/hourly/2025-01.parquet")
+    assert runs == {"run-1": (START + timedelta(minutes=110), 100)}
+
+
+def test_later_run_adds_late_readings(s3):
+    archive_run(s3, "run-1", readings(range(0, 120, 10)))
+    archive_run(s3, "run-2", readings(range(5, 25, 10), [1]))
+
+    hourly = read_rollups(s3, "archive", "hourly", (START, START + timedelta(hours=1)))
+    assert hourly["readings"].tolist() == [8, 6]
+
+
+def test_read_rollups_filters_plants_and_periods(s3):
+    archive_run(s3, "run-1", readings(range(0, 240, 10), [1, 2, 3]))
+
+    hourly = read_rollups(s3, "archive", "hourly", (START + timedelta(hours=1),
+                                                    START + timedelta(hours=3)), plant_ids=[3])
+
+    assert hourly["plant_id"].tolist() == [3, 3]
+    assert hourly["period"].tolist() == [START + timedelta(hours=1), START + timedelta(hours=2)]
+
+
+def test_read_rollups_without_files(s3):
+    assert read_rollups(s3, "archive", "daily", (START, START + timedelta(days=1))).empty
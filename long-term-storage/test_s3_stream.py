@@ -0,0 +1,75 @@
+"""Tests for streaming S3 uploads."""
+from io import BytesIO
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from s3_stream import S3MultipartWriter, MIN_PART_SIZE
+
+MIB = 1024 * 1024
+
+
+def stored(s3_client, key: str) -> bytes:
+    return s3_client.get_object(Bucket="archive", Key=key)["Body"].read()
+
+
+def test_small_object_single_put(s3):
+    with S3MultipartWriter(s3, "archive", "small") as writer:
+        writer.write(b"plant data")
+
+    assert stored(s3, "small") == b"plant data"
+    assert writer.stats()["parts"] == 0
+
+
+def test_large_object_uploaded_in_parts(s3):
+    data = bytes(range(256)) * (12 * MIB // 256)
+    with S3MultipartWriter(s3, "archive", "large", part_size=MIN_PART_SIZE,
+                           max_concurrency=2) as writer:
+        for start in range(0, len(data), MIB):
+            writer.write(data[start:start + MIB])
+
+    stats = writer.stats()
+    assert stored(s3, "large") == data
+    assert stats["parts"] == 3
+    assert stats["bytes"] == len(data)
+    assert stats["bytes_per_second"] > 0
+    assert MIN_PART_SIZE <= stats["peak_buffer_bytes"] <= 3 * MIN_PART_SIZE
+
+
+def test_error_aborts_upload(s3):
+    with pytest.raises(RuntimeError):
+        with S3MultipartWriter(s3, "archive", "failed", part_size=MIN_PART_SIZE) as writer:
+            writer.write(b"x" * (MIN_PART_SIZE + 1))
+            raise RuntimeError("export failed")
+
+    assert "Contents" not in s3.list_objects_v2(Bucket="archive")
+
+
+def test_abort_after_close_deletes_object(s3):
+    with S3MultipartWriter(s3, "archive", "finished") as writer:
+        writer.write(b"plant data")
+    writer.abort()
+
+    assert "Contents" not in s3.list_objects_v2(Bucket="archive")
+    assert "Uploads" not in s3.list_multipart_uploads(Bucket="archive")
+
+
+def test_part_size_below_s3_minimum():
+    with pytest.raises(ValueError):
+        S3MultipartWriter(None, "archive", "key", part_size=MIB)
+
+
+def test_write_after_close(s3):
+    writer = S3MultipartWriter(s3, "archive", "closed")
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write(b"late")
+
+
+def test_parquet_writer_streams_into_s3(s3):
+    table = pa.table({"plant_id": list(range(100_000)), "temperature": [12.5] * 100_000})
+    with S3MultipartWriter(s3, "archive", "readings.parquet") as writer:
+        with pq.ParquetWriter(writer, table.schema) as parquet_writer:
+            parquet_writer.write_table(table, row_group_size=10_000)
+
+    assert pq.read_table(BytesIO(stored(s3, "readings.parquet"))).equals(table)
@@ -0,0 +1,90 @@
+"""Tests for the SQLite archive in S3."""
+from datetime import datetime, timedelta
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from reading_factory import make_readings
+from sqlite_archive import SQLiteArchive, COLUMNS
+
+START = datetime(2025, 2, 6, 10)
+
+
+def batch(plant_ids: list[int], minutes: range, first_id: int = 0) -> pa.RecordBatch:
+    """A batch of readings every minute from each plant."""
+    return pa.RecordBatch.from_pandas(make_readings(plant_ids, minutes, START, first_id)[COLUMNS],
+                                      preserve_index=False)
+
+
+def test_append_then_query_range(s3):
+    with SQLiteArchive(s3, "archive", page_size=4096) as archive:
+        assert archive.append([batch([1, 2], range(0, 30)), batch([1, 2], range(30, 60), 60)]) == 120
+
+    with SQLiteArchive(s3, "archive", page_size=4096) as archive:
+        result = archive.readings(START + timedelta(minutes=10), START + timedelta(minutes=40),
+                                  plant_ids=[2])
+
+    assert len(result) == 30
+    assert (result["plant_id"] == 2).all()
+    assert result["at"].is_monotonic_increasing
+    assert result["at"].iloc[0] == START + timedelta(minutes=10)
+    assert result["soil_moisture"].iloc[0] == 22.0
+
+
+def test_readings_of_every_plant(s3):
+    with SQLiteArchive(s3, "archive", page_size=4096) as archive:
+        archive.append([batch([1, 2, 3], range(10))])
+        result = archive.readings(START, START + timedelta(minutes=5))
+
+    assert result["plant_id"].tolist() == [1] * 5 + [2] * 5 + [3] * 5
+
+
+def test_point_lookup(s3):
+    with SQLiteArchive(s3, "archive", page_size=4096) as archive:
+        archive.append([batch([1, 2], range(10))])
+
+        assert archive.reading(2, START + timedelta(minutes=3)) == {
+            "reading_id": 7, "plant_id": 2, "soil_moisture": 22.0, "temperature": 10.05,
+            "at": "2025-02-06 10:03:00", "botanist_id": 1, "last_watered": "2025-02-06 09:00:00"}
+        assert archive.reading(3, START) is None
+
+
+def test_append_again_skips_archived_readings(s3):
+    with SQLiteArchive(s3, "archive", page_size=4096) as archive:
+        assert archive.append([batch([1], range(10))]) == 10
+        assert archive.append([batch([1], range(5, 15), 5)]) == 5
+
+        assert len(archive.readings(START, START + timedelta(hours=1))) == 15
+
+
+def test_failed_append_leaves_nothing_behind(s3):
+    def batches():
+        yield batch([1], range(10))
+        raise ValueError("Database went away.")
+
+    with SQLiteArchive(s3, "archive", page_size=4096) as archive:
+        with pytest.raises(ValueError):
+            archive.append(batches())
+
+        assert archive.readings(START, START + timedelta(hours=1)).empty
+
+
+def test_pages_are_stored_as_blocks(s3):
+    with SQLiteArchive(s3, "archive", page_size=8192) as archive:
+        archive.append([batch([1, 2], range(200))])
+        page_size = archive.connection.cursor().execute("PRAGMA page_size;").fetchone()[0]
+
+    sizes = [item["Size"] for item in s3.list_objects_v2(
+        Bucket="archive", Prefix="sqlite/readings.sqlite/")["Contents"]]
+    assert page_size == 8192
+    assert len(sizes) > 1
+    assert set(sizes) == {8192}
+
+
+def test_plant_range_uses_plant_time_index(s3):
+    with SQLiteArchive(s3, "archive", page_size=4096) as archive:
+        plan = archive.connection.cursor().execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM reading WHERE plant_id = 1 "
+            "AND at >= '2025-02-06' AND at < '2025-02-07';").fetchall()
+
+    assert "ux_reading_plant_at" in str(plan)
@@ -0,0 +1,17 @@
+"""Shared fixtures for the pipeline tests."""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent / "upload"))
+
+import dimension_cache  # pylint: disable=wrong-import-position, import-error
+
+
+@pytest.fixture(autouse=True)
+def empty_dimension_cache():
+    """Starts every test with an empty dimension cache."""
+    dimension_cache.clear()
+    yield
+    dimension_cache.clear()
@@ -2,8 +2,13 @@
 data should be a list in dictionaries ready for transformation at the next stage"""
 
 import logging
+from threading import Event
+from collections.abc import Iterator
 from requests import get, exceptions
 
+BASE_URL = "https://data-eng-plants-api.herokuapp.com/"
+BATCH_SIZE = 10
+
 
 logger = logging.getLogger(__name__)  # Create logger for this module
 logging.basicConfig(level=logging.INFO,
@@ -20,21 +25,34 @@ def get_max_plant_id(base_url: str) -> int:
     raise ValueError("Failed to fetch status information. Status code: %s" %
                      response.status_code)
 
-def extract_plant_batch() -> list[dict]:
-    """Returns list of dictionaries for all successful plant get requests."""
-    base_url = "https://data-eng-plants-api.herokuapp.com/"
-    plant_data_list = []
-    max_plant_id = get_max_plant_id(base_url)
+def extract_plant_batches(batch_size: int = BATCH_SIZE,
+                          stop: Event | None = None) -> Iterator[list[dict]]:
+    """Yields the successful plant get requests in batches of up to batch_size,
+    so later stages can start on a batch while the next is fetched.
+    Once stop is set no more plants are requested."""
+    max_plant_id = get_max_plant_id(BASE_URL)
     logger.info("Data for %d plants is available...", max_plant_id)
     max_plant_id += max_plant_id // 10  # Adds 10% leeway to account for missing plants
 
+    batch = []
     for plant_id in range(1, max_plant_id + 1):
+        if stop is not None and stop.is_set():
+            logger.info("Stopped before plant ID %d.", plant_id)
+            return
         try:
-            plant_data = get_plant_data(base_url, plant_id)
-            plant_data_list.append(plant_data)
+            batch.append(get_plant_data(BASE_URL, plant_id))
         except ValueError as e:
             logger.error("Error fetching data for plant ID %d: %s", plant_id, e)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
+
+def extract_plant_batch() -> list[dict]:
+    """Returns list of dictionaries for all successful plant get requests."""
+    plant_data_list = [plant for batch in extract_plant_batches() for plant in batch]
     logger.info("Retrieved data for %d plants.", len(plant_data_list))
     return plant_data_list
 
@@ -0,0 +1,47 @@
+"""Generates plant records in the shape returned by the plants API,
+so the pipeline can be run and benchmarked without calling it."""
+
+from random import Random
+from datetime import datetime
+
+BOTANISTS = [
+    {"name": "Carl Linnaeus", "email": "carl.linnaeus@lnhm.co.uk",
+     "phone": "(146)994-1635x35992"},
+    {"name": "Gertrude Jekyll", "email": "gertrude.jekyll@lnhm.co.uk",
+     "phone": "001-481-273-3691x127"},
+    {"name": "Eliza Andrews", "email": "eliza.andrews@lnhm.co.uk",
+     "phone": "(846)669-6651x75948"}
+]
+ORIGINS = [
+    ["-19.32556", "-41.25528", "Resplendor", "BR", "America/Sao_Paulo"],
+    ["33.95015", "-118.03917", "South Whittier", "US", "America/Los_Angeles"],
+    ["7.65649", "4.92235", "Efon-Alaaye", "NG", "Africa/Lagos"],
+    ["43.86682", "-79.2663", "Markham", "CA", "America/Toronto"]
+]
+
+
+def simulate_plant(plant_id: int, recorded_at: datetime, rng: Random) -> dict:
+    """Returns one plant reading; a plant's name, origin and botanist are fixed by its id."""
+    return {
+        "plant_id": plant_id,
+        "name": f"Simulated Plant {plant_id}",
+        "scientific_name": [f"Plantus simulatus {plant_id}"],
+        "origin_location": ORIGINS[plant_id % len(ORIGINS)],
+        "botanist": BOTANISTS[plant_id % len(BOTANISTS)],
+        "images": {"license": 45, "license_name": "Attribution-ShareAlike 3.0",
+                   "license_url": "https://creativecommons.org/licenses/by-sa/3.0/deed.en",
+                   "original_url": f"https://perenual.com/storage/image/{plant_id}.jpg"},
+        "last_watered": recorded_at.replace(hour=9, minute=0, second=0)
+        .strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "recording_taken": recorded_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "soil_moisture": rng.uniform(15, 40),
+        "temperature": rng.uniform(10, 20)
+    }
+
+
+def simulate_plant_batch(plant_count: int, recorded_at: datetime,
+                         seed: int | None = None) -> list[dict]:
+    """Returns a minute's batch of readings for plants 1 to plant_count."""
+    rng = Random(seed)
+    return [simulate_plant(plant_id, recorded_at, rng)
+            for plant_id in range(1, plant_count + 1)]
@@ -3,6 +3,7 @@ Tests for both functions in the extract module.
 Mocking API calls and user functions to keep tests isolated.
 """
 
+from threading import Event
 from unittest.mock import patch, Mock
 import pytest
 import extract
@@ -211,3 +212,36 @@ def test_get_max_plant_id_missing_key(mock_get, base_url):
 
     with pytest.raises(ValueError):
         extract.get_max_plant_id(base_url)
+
+
+@patch('extract.get_max_plant_id', return_value=20)
+@patch('extract.get_plant_data')
+def test_extract_plant_batches_sizes(mock_get_plant_data, mock_max_plant_id):
+    """
+    Test that extract_plant_batches() yields full batches then the remainder.
+    """
+    def dummy_get_plant_data(_base_url, plant_id):
+        return {"plant_id": plant_id, "name": f"Plant {plant_id}"}
+    mock_get_plant_data.side_effect = dummy_get_plant_data
+
+    batches = list(extract.extract_plant_batches(batch_size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 2]
+    assert batches[2][-1]["plant_id"] == 22
+
+
+@patch('extract.get_max_plant_id', return_value=20)
+@patch('extract.get_plant_data')
+def test_extract_plant_batches_stops_between_plants(mock_get_plant_data, mock_max_plant_id):
+    """
+    Test that extract_plant_batches() requests no more plants once stop is set.
+    """
+    stop = Event()
+
+    def dummy_get_plant_data(_base_url, plant_id):
+        if plant_id == 3:
+            stop.set()
+        return {"plant_id": plant_id}
+    mock_get_plant_data.side_effect = dummy_get_plant_data
+
+    assert not list(extract.extract_plant_batches(batch_size=10, stop=stop))
+    assert mock_get_plant_data.call_count == 3
@@ -0,0 +1,21 @@
+"""Tests for the plant API simulator."""
+from datetime import datetime
+
+from simulate import simulate_plant_batch
+
+
+def test_simulate_plant_batch_size():
+    batch = simulate_plant_batch(5, datetime(2025, 2, 6, 12, 0))
+    assert [plant["plant_id"] for plant in batch] == [1, 2, 3, 4, 5]
+
+
+def test_simulate_plant_batch_matches_api_shape():
+    plant = simulate_plant_batch(1, datetime(2025, 2, 6, 12, 0))[0]
+    assert plant["recording_taken"] == "2025-02-06 12:00:00"
+    assert set(plant["botanist"]) == {"name", "email", "phone"}
+    assert len(plant["origin_location"]) == 5
+
+
+def test_simulate_plant_batch_seeded():
+    at = datetime(2025, 2, 6, 12, 0)
+    assert simulate_plant_batch(3, at, seed=1) == simulate_plant_batch(3, at, seed=1)
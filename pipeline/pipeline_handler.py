@@ -0,0 +1,215 @@
+"""Runs extract, transform and upload in one invocation as threaded stages joined
+by bounded queues, so batch k is uploaded while batch k+1 is extracted.
+Each transformed batch is spooled before upload, which drains the spool, so
+batches a failed upload leaves behind are sent by a later drain.
+The whole run stops at a deadline that fits inside the one-minute schedule."""
+
+# pylint: disable=wrong-import-position, import-error, no-name-in-module, unused-argument
+
+import sys
+import logging
+from os import environ
+from pathlib import Path
+from queue import Queue, Empty, Full
+from threading import Thread, Event, Timer
+from time import perf_counter
+from dataclasses import dataclass, field
+from collections.abc import Callable, Iterable
+
+import pandas as pd
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "pipeline" / "extract"), str(ROOT / "pipeline" / "transform"),
+                str(ROOT / "pipeline" / "upload"), str(ROOT / "database")]
+
+from extract import extract_plant_batches
+from transform import transform_and_clean_data
+from rolling_stats import AnomalyFlagger, STATE_PATH
+from upload import get_connection
+from connection_pool import connection_metrics
+from spool import spool_batch, drain_spool, pending_count, SPOOL_PATH
+from backends import DATABASE_ERRORS
+import instrumentation
+import dimension_cache
+
+DEADLINE_SECONDS = float(environ.get("PIPELINE_DEADLINE_SECONDS", "50"))
+SAFETY_MARGIN_SECONDS = 5
+QUEUE_SIZE = 2
+POLL_SECONDS = 0.1
+STAGES = ("extract", "transform", "upload")
+
+
+def hand_over(queue: Queue, item: object, stop: Event) -> bool:
+    """Puts item on the queue, waiting for space unless the run is stopped."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=POLL_SECONDS)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def receive(queue: Queue, stop: Event) -> object:
+    """Returns the next item from the queue, or None once the run is stopped."""
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=POLL_SECONDS)
+        except Empty:
+            continue
+    return None
+
+
+def spool_transformed(data: pd.DataFrame, spool_path: str) -> pd.DataFrame:
+    """Writes a transformed batch to the spool before it is handed to upload."""
+    spool_batch(data, spool_path)
+    return data
+
+
+def upload_batch(connect: Callable[[], object], spool_path: str,
+                 deadline: float | None = None) -> int:
+    """Drains the spool, including batches left by earlier invocations, on a
+    connection from connect, and returns the readings inserted. Each drain asks
+    for its own connection, so one discarded after a failed drain is replaced.
+    Reading batches stop being sent once the deadline, a perf_counter() time,
+    has passed. A database error or the deadline is logged rather than raised,
+    leaving the batches spooled for the next drain."""
+    try:
+        return drain_spool(connect(), spool_path, deadline=deadline)["rows"]
+    except DATABASE_ERRORS as error:
+        logging.warning("Upload failed, %d batches stay spooled: %s",
+                        pending_count(spool_path), error)
+    except TimeoutError as error:
+        logging.warning("%s %d batches stay spooled.", error, pending_count(spool_path))
+    return 0
+
+
+@dataclass
+class Stage:
+    """A stage of the run: the work applied to each batch, the batch source or
+    queue it reads from and the queue, if any, it passes results to."""
+    name: str
+    work: Callable
+    inbox: Iterable | Queue
+    outbox: Queue | None = None
+
+
+@dataclass
+class Run:
+    """The state every stage of a run shares: per-stage results, the perf_counter()
+    time the run must end by, the event that stops it and any stage errors."""
+    results: dict[str, float]
+    deadline: float
+    stop: Event = field(default_factory=Event)
+    errors: list[Exception] = field(default_factory=list)
+
+
+def run_stage(stage: Stage, run: Run) -> None:
+    """Applies the stage's work to each batch from its inbox, timing it and
+    passing the result on. The inbox is the batch source for the first stage
+    and a queue after that; None marks the end of the batches. An error stops every stage."""
+    batches = iter(stage.inbox) if not isinstance(stage.inbox, Queue) else None
+    try:
+        while not run.stop.is_set():
+            if batches:
+                start = perf_counter()
+                batch = next(batches, None)
+            else:
+                batch = receive(stage.inbox, run.stop)
+                start = perf_counter()
+            if batch is None:
+                break
+            result = stage.work(batch)
+            run.results[f"{stage.name}_seconds"] += perf_counter() - start
+            run.results[f"{stage.name}_rows"] += result if isinstance(result, int) else len(result)
+            if stage.outbox is not None:
+                hand_over(stage.outbox, result, run.stop)
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        run.errors.append(error)
+        run.stop.set()
+    finally:
+        if stage.outbox is not None:
+            hand_over(stage.outbox, None, run.stop)
+
+
+def run_pipeline(batches: Iterable[list[dict]] | Callable[[Event], Iterable[list[dict]]],
+                 connect: Callable[[], object], deadline_seconds: float = DEADLINE_SECONDS,
+                 state_path: str = STATE_PATH, spool_path: str = SPOOL_PATH) -> dict[str, float]:
+    """Returns rows handled and busy seconds per stage after running the batches
+    through extract, transform and upload concurrently. batches may be a function
+    given the run's stop event, so the source can stop between requests.
+    Each upload drains the spool on a connection from connect.
+    Stages stop taking new batches once deadline_seconds have passed, and upload
+    stops between reading batches. Extract and transform run on daemon threads
+    that are only waited for until the deadline, so a request or batch still in
+    progress cannot hold the run past it; only an upload statement already
+    running can.
+    Cleaned readings are checked against each plant's rolling statistics, whose
+    state is loaded from state_path at the start and saved back at the end,
+    and spooled at spool_path until upload drains them."""
+    start = perf_counter()
+    run = Run({f"{stage}_{measure}": 0 for stage in STAGES for measure in ("rows", "seconds")},
+              start + deadline_seconds)
+    flagger = AnomalyFlagger(state_path)
+    extracted, transformed = Queue(maxsize=QUEUE_SIZE), Queue(maxsize=QUEUE_SIZE)
+    stages = [
+        Stage("extract", lambda batch: batch,
+              batches(run.stop) if callable(batches) else batches, extracted),
+        Stage("transform", lambda batch: spool_transformed(
+            transform_and_clean_data(batch, flagger), spool_path), extracted, transformed),
+        Stage("upload", lambda _data: upload_batch(connect, spool_path, run.deadline), transformed)
+    ]
+    timer = Timer(deadline_seconds, run.stop.set)
+
+    timer.start()
+    threads = [Thread(target=run_stage, args=(stage, run), daemon=True)
+               for stage in stages[:-1]]
+    for thread in threads:
+        thread.start()
+    run_stage(stages[-1], run)
+    run.results["deadline_hit"] = run.stop.is_set() and not run.errors
+    run.stop.set()
+    timer.cancel()
+    for thread in threads:
+        thread.join(timeout=max(0.0, run.deadline - perf_counter()))
+    flagger.save()
+
+    if run.errors:
+        raise run.errors[0]
+    run.results["seconds"] = perf_counter() - start
+    run.results["anomalies"] = flagger.flagged
+    return run.results
+
+
+def handler(event=None, context=None) -> dict[str, float]:
+    """Lambda handler running one minute's extract, transform and upload,
+    finishing before the invocation's remaining time runs out, then logging
+    the invocation's database statement summary."""
+    instrumentation.reset()
+    deadline_seconds = DEADLINE_SECONDS
+    if context is not None:
+        deadline_seconds = min(deadline_seconds, context.get_remaining_time_in_millis() / 1000
+                               - SAFETY_MARGIN_SECONDS)
+
+    results = run_pipeline(lambda stop: extract_plant_batches(stop=stop), get_connection,
+                           deadline_seconds)
+    for stage in STAGES:
+        logging.info("%s: %d rows in %.2fs", stage, results[f"{stage}_rows"],
+                     results[f"{stage}_seconds"])
+    if results["anomalies"]:
+        logging.warning("Flagged %d anomalous readings.", results["anomalies"])
+    logging.info("Pipeline finished in %.2fs%s.", results["seconds"],
+                 ", stopped at the deadline" if results["deadline_hit"] else "")
+    logging.info("Connection metrics: %s", connection_metrics())
+    logging.info("Dimension cache hit rate: %.1f%%.", dimension_cache.hit_rate() * 100)
+    for line in instrumentation.summary_lines():
+        logging.info(line)
+    return results
+
+
+if __name__ == "__main__":
+
+    load_dotenv()
+
+    print(handler())
@@ -0,0 +1,43 @@
+"""End-to-end tests running the pipeline against the SQLite stand-in."""
+from datetime import datetime
+
+from local_run import run_local_pipeline
+from backends import connect_sqlite
+from simulate import simulate_plant_batch
+from transform import transform_and_clean_data
+from upload import upload_new_plants_bulk, update_botanists, upload_readings
+
+
+def count(conn, table: str) -> int:
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {table};")
+        return cursor.fetchone()[0]
+
+
+def test_run_local_pipeline(tmp_path):
+    db_path = str(tmp_path / "plants.sqlite")
+
+    results = run_local_pipeline(db_path, 10, 8, str(tmp_path))
+
+    conn = connect_sqlite(db_path)
+    assert results["upload_rows"] == 80
+    assert 0 < results["archive_rows"] < 80
+    assert count(conn, "alpha.reading") == 80 - results["archive_rows"]
+    assert count(conn, "alpha.plant") == 8
+    assert count(conn, "alpha.botanist") == 3
+    assert (tmp_path / "plant_data_local.parquet").exists()
+
+
+def test_upload_rerun_is_idempotent(tmp_path):
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    data = transform_and_clean_data(simulate_plant_batch(5, datetime(2025, 2, 6, 12, 0), 1))
+
+    upload_new_plants_bulk(conn, data)
+    update_botanists(conn, data)
+    first = upload_readings(conn, data)
+    second = upload_readings(conn, data)
+
+    assert first["rows"] == 5
+    assert second["rows"] == 0
+    assert second["skipped"] == 5
+    assert count(conn, "alpha.reading") == 5
@@ -0,0 +1,222 @@
+"""Tests for the overlapped pipeline handler."""
+from datetime import datetime, timedelta
+import logging
+from time import sleep, perf_counter
+import sqlite3
+from unittest.mock import patch, MagicMock
+import pytest
+
+import pipeline_handler
+import dimension_cache
+from pipeline_handler import run_pipeline, handler
+from backends import connect_sqlite
+from simulate import simulate_plant_batch
+from spool import pending_count, spool_batch
+from transform import transform_and_clean_data
+
+
+def simulated_batches(minutes: int, plant_count: int, delay: float = 0):
+    start = datetime(2025, 2, 6, 12, 0)
+    for minute in range(minutes):
+        sleep(delay)
+        yield simulate_plant_batch(plant_count, start + timedelta(minutes=minute), minute)
+
+
+def handler_results() -> dict:
+    return {"seconds": 1, "deadline_hit": False, "anomalies": 0,
+            **{f"{stage}_{measure}": 0 for stage in pipeline_handler.STAGES
+               for measure in ("rows", "seconds")}}
+
+
+def run_files(tmp_path) -> tuple[str, str]:
+    return str(tmp_path / "stats.npz"), str(tmp_path / "spool.sqlite")
+
+
+def test_run_pipeline_uploads_every_batch(tmp_path):
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    results = run_pipeline(simulated_batches(4, 6), lambda: conn, 30, *run_files(tmp_path))
+
+    assert results["extract_rows"] == results["transform_rows"] == 24
+    assert results["upload_rows"] == 24
+    assert not results["deadline_hit"]
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM alpha.reading;")
+        assert cursor.fetchone()[0] == 24
+
+
+def test_run_pipeline_fetches_connection_per_drain(tmp_path):
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    connect = MagicMock(return_value=conn)
+    results = run_pipeline(simulated_batches(3, 2), connect, 30, *run_files(tmp_path))
+
+    assert results["upload_rows"] == 6
+    assert connect.call_count == 3
+
+
+def test_run_pipeline_flags_outliers(tmp_path):
+    def batches_with_outlier():
+        yield from simulated_batches(15, 2)
+        outlier = simulate_plant_batch(2, datetime(2025, 2, 6, 12, 15), 15)
+        outlier[0]["soil_moisture"] = 95.0
+        yield outlier
+
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    results = run_pipeline(batches_with_outlier(), lambda: conn, 30, *run_files(tmp_path))
+
+    assert results["anomalies"] == 1
+    assert (tmp_path / "stats.npz").exists()
+
+
+def test_run_pipeline_keeps_batches_spooled_through_outage(tmp_path):
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    with patch("spool.upload_readings", side_effect=sqlite3.OperationalError("database is locked")):
+        failed = run_pipeline(simulated_batches(3, 2), lambda: conn, 30, *run_files(tmp_path))
+
+    assert failed["upload_rows"] == 0
+    assert pending_count(run_files(tmp_path)[1]) == 3
+
+    def next_minute():
+        yield simulate_plant_batch(2, datetime(2025, 2, 6, 12, 3), 3)
+
+    recovered = run_pipeline(next_minute(), lambda: conn, 30, *run_files(tmp_path))
+    assert recovered["upload_rows"] == 8
+    assert pending_count(run_files(tmp_path)[1]) == 0
+
+
+def test_run_pipeline_overlaps_stages(tmp_path):
+    def slow_upload(_connect, _spool_path, _deadline):
+        sleep(0.1)
+        return 2
+
+    with patch.object(pipeline_handler, "upload_batch", slow_upload):
+        results = run_pipeline(simulated_batches(5, 2, delay=0.1), MagicMock(), 30,
+                               *run_files(tmp_path))
+
+    assert results["upload_rows"] == 10
+    assert results["seconds"] < results["extract_seconds"] + results["upload_seconds"]
+
+
+def test_run_pipeline_stops_at_deadline(tmp_path):
+    def endless_batches():
+        while True:
+            sleep(0.05)
+            yield simulate_plant_batch(2, datetime(2025, 2, 6, 12, 0))
+
+    with patch.object(pipeline_handler, "upload_batch", lambda _connect, _spool_path, _deadline: 2):
+        results = run_pipeline(endless_batches(), MagicMock(), 0.3, *run_files(tmp_path))
+
+    assert results["deadline_hit"]
+    assert results["seconds"] < 1
+
+
+def test_run_pipeline_does_not_wait_past_deadline_for_extract(tmp_path):
+    def slow_batches():
+        sleep(3)
+        yield simulate_plant_batch(2, datetime(2025, 2, 6, 12, 0))
+
+    results = run_pipeline(slow_batches(), MagicMock(), 0.5, *run_files(tmp_path))
+
+    assert results["deadline_hit"]
+    assert results["seconds"] < 1.5
+
+
+def test_run_pipeline_gives_batch_source_the_stop_event(tmp_path):
+    stops = []
+
+    def batches(stop):
+        stops.append(stop)
+        yield from simulated_batches(1, 2)
+
+    with patch.object(pipeline_handler, "upload_batch", lambda _connect, _spool_path, _deadline: 2):
+        run_pipeline(batches, MagicMock(), 30, *run_files(tmp_path))
+
+    assert len(stops) == 1 and stops[0].is_set()
+
+
+def test_run_pipeline_gives_upload_the_remaining_time(tmp_path):
+    deadlines = []
+
+    def timed_upload(_connect, _spool_path, deadline):
+        deadlines.append(deadline - perf_counter())
+        return 2
+
+    with patch.object(pipeline_handler, "upload_batch", timed_upload):
+        run_pipeline(simulated_batches(2, 2), MagicMock(), 30, *run_files(tmp_path))
+
+    assert all(0 < remaining <= 30 for remaining in deadlines)
+
+
+def test_upload_batch_leaves_batches_spooled_at_deadline(tmp_path):
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    spool_path = run_files(tmp_path)[1]
+    spool_batch(transform_and_clean_data(simulate_plant_batch(2, datetime(2025, 2, 6, 12))),
+                spool_path)
+
+    assert pipeline_handler.upload_batch(lambda: conn, spool_path, perf_counter()) == 0
+    assert pending_count(spool_path) == 1
+
+
+def test_run_pipeline_raises_stage_error(tmp_path):
+    def failing_upload(_connect, _spool_path, _deadline):
+        raise ValueError("upload failed")
+
+    with patch.object(pipeline_handler, "upload_batch", failing_upload):
+        with pytest.raises(ValueError, match="upload failed"):
+            run_pipeline(simulated_batches(3, 2), MagicMock(), 30, *run_files(tmp_path))
+
+
+@patch("pipeline_handler.get_connection")
+@patch("pipeline_handler.extract_plant_batches")
+@patch("pipeline_handler.run_pipeline")
+def test_handler_deadline_fits_remaining_time(mock_run, mock_extract, mock_get_connection):
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 30000
+    mock_run.return_value = handler_results()
+
+    handler(context=context)
+    assert mock_run.call_args.args[2] == 30 - pipeline_handler.SAFETY_MARGIN_SECONDS
+
+
+@patch("pipeline_handler.get_connection")
+@patch("pipeline_handler.run_pipeline")
+def test_handler_logs_statement_summary_per_invocation(mock_run, mock_get_connection, caplog):
+    def run(*_args):
+        pipeline_handler.instrumentation.record("SELECT 1;", 0.5, 1, 1)
+        return handler_results()
+    mock_run.side_effect = run
+
+    with caplog.at_level(logging.INFO):
+        handler()
+        handler()
+
+    summaries = [message for message in caplog.messages if "round-trips across" in message]
+    assert summaries == ["1 round-trips across 1 statement templates."] * 2
+
+
+@patch("pipeline_handler.get_connection")
+@patch("pipeline_handler.run_pipeline")
+def test_handler_logs_dimension_cache_hit_rate(mock_run, mock_get_connection, caplog):
+    mock_run.return_value = handler_results()
+    dimension_cache.lookup("plant", [1])
+    dimension_cache.store("plant", {1: 1})
+    dimension_cache.lookup("plant", [1, 2])
+
+    with caplog.at_level(logging.INFO):
+        handler()
+
+    assert "Dimension cache hit rate: 33.3%." in caplog.messages
+
+
+@patch("pipeline_handler.connection_metrics")
+@patch("pipeline_handler.get_connection")
+@patch("pipeline_handler.run_pipeline")
+def test_handler_logs_connection_metrics_after_run_summary(mock_run, mock_get_connection,
+                                                          mock_metrics, caplog):
+    mock_run.return_value = handler_results()
+    mock_metrics.return_value = {"connects": 1, "reuses": 4}
+
+    with caplog.at_level(logging.INFO):
+        handler()
+
+    finished = caplog.messages.index("Pipeline finished in 1.00s.")
+    assert caplog.messages[finished + 1] == "Connection metrics: {'connects': 1, 'reuses': 4}"
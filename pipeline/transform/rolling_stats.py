@@ -0,0 +1,151 @@
+"""Streaming per-plant rolling statistics used to flag sudden jumps in readings.
+State is held in fixed-size numpy arrays indexed by plant_id, so each reading
+is an O(1) update and a batch costs time linear in its length.
+The state file defaults to /tmp, which on Lambda only lasts while the same
+container stays warm; after a cold start each plant's history starts again."""
+import os
+from os import environ
+import numpy as np
+import pandas as pd
+
+METRICS = ("soil_moisture", "temperature")
+WINDOW_SIZE = 60
+EWMA_ALPHA = 0.1
+Z_THRESHOLD = 3.0
+MIN_SAMPLES = 10
+STATE_PATH = environ.get("ROLLING_STATS_PATH", "/tmp/rolling_stats.npz")
+
+
+def new_state(capacity: int = 64) -> dict[str, np.ndarray]:
+    """Returns empty rolling state with room for plant_ids below capacity."""
+    metrics = len(METRICS)
+    return {
+        "count": np.zeros((capacity, metrics), dtype=np.int64),
+        "mean": np.zeros((capacity, metrics), dtype=np.float64),
+        "m2": np.zeros((capacity, metrics), dtype=np.float64),
+        "ewma": np.zeros((capacity, metrics), dtype=np.float64),
+        "window": np.full((capacity, metrics, WINDOW_SIZE), np.nan, dtype=np.float32),
+        "head": np.zeros((capacity, metrics), dtype=np.int16)
+    }
+
+
+def load_state(path: str = STATE_PATH) -> dict[str, np.ndarray]:
+    """Returns the rolling state saved at path, or a fresh state if there is none."""
+    if not os.path.exists(path):
+        return new_state()
+    with np.load(path) as saved:
+        return {key: saved[key] for key in saved.files}
+
+
+def save_state(state: dict[str, np.ndarray], path: str = STATE_PATH) -> None:
+    """Writes the rolling state to path, replacing any previous file atomically."""
+    temp_path = f"{path}.tmp.npz"
+    np.savez(temp_path, **state)
+    os.replace(temp_path, path)
+
+
+def ensure_capacity(state: dict[str, np.ndarray], plant_id: int) -> dict[str, np.ndarray]:
+    """Returns the state grown, by doubling, until plant_id fits."""
+    capacity = state["count"].shape[0]
+    if plant_id < capacity:
+        return state
+
+    new_capacity = max(capacity * 2, plant_id + 1)
+    grown = new_state(new_capacity)
+    for key, values in state.items():
+        grown[key][:capacity] = values
+    return grown
+
+
+def is_anomaly(state: dict[str, np.ndarray], plant_id: int, metric: int, value: float) -> bool:
+    """Returns whether value jumps away from the plant's recent history.
+    A jump must be Z_THRESHOLD standard deviations from the EWMA and outside
+    the rolling window's min/max."""
+    count = state["count"][plant_id, metric]
+    if count < MIN_SAMPLES:
+        return False
+
+    std = np.sqrt(state["m2"][plant_id, metric] / (count - 1))
+    if abs(value - state["ewma"][plant_id, metric]) <= Z_THRESHOLD * std:
+        return False
+
+    window = state["window"][plant_id, metric]
+    return bool(value < np.nanmin(window) or value > np.nanmax(window))
+
+
+def update_metric(state: dict[str, np.ndarray], plant_id: int, metric: int, value: float) -> None:
+    """Folds one value into the plant's EWMA, Welford variance and rolling window."""
+    count = state["count"][plant_id, metric] + 1
+    state["count"][plant_id, metric] = count
+
+    delta = value - state["mean"][plant_id, metric]
+    state["mean"][plant_id, metric] += delta / count
+    state["m2"][plant_id, metric] += delta * (value - state["mean"][plant_id, metric])
+
+    if count == 1:
+        state["ewma"][plant_id, metric] = value
+    else:
+        state["ewma"][plant_id, metric] += EWMA_ALPHA * \
+            (value - state["ewma"][plant_id, metric])
+
+    head = state["head"][plant_id, metric]
+    state["window"][plant_id, metric, head] = value
+    state["head"][plant_id, metric] = (head + 1) % WINDOW_SIZE
+
+
+def add_anomaly_flags(df: pd.DataFrame,
+                      state: dict[str, np.ndarray]) -> tuple[pd.DataFrame, dict[str, np.ndarray]]:
+    """Returns the batch with a boolean {metric}_anomaly column per metric,
+    and the state updated with every reading in the batch."""
+    plant_ids = df["plant_id"].to_numpy() if "plant_id" in df.columns else [None] * len(df)
+    values = np.column_stack([
+        pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype=np.float64)
+        if metric in df.columns else np.full(len(df), np.nan)
+        for metric in METRICS
+    ])
+    flags = np.zeros(values.shape, dtype=bool)
+
+    for row, plant_id in enumerate(plant_ids):
+        if pd.isna(plant_id):
+            continue
+        plant_id = int(plant_id)
+        state = ensure_capacity(state, plant_id)
+        for metric in range(len(METRICS)):
+            value = values[row, metric]
+            if np.isnan(value):
+                continue
+            flags[row, metric] = is_anomaly(state, plant_id, metric, value)
+            update_metric(state, plant_id, metric, value)
+
+    for metric, name in enumerate(METRICS):
+        df[f"{name}_anomaly"] = flags[:, metric]
+    return df, state
+
+
+class AnomalyFlagger:
+    """Flags anomalies in every batch of one invocation, loading the rolling
+    state once at the start and saving it once at the end."""
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self.state = load_state(path)
+        self.flagged = 0
+
+    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Returns the cleaned batch with anomaly flags, counting the flagged readings."""
+        df, self.state = add_anomaly_flags(df, self.state)
+        self.flagged += int(df[[f"{metric}_anomaly" for metric in METRICS]].any(axis=1).sum())
+        return df
+
+    def save(self) -> None:
+        """Persists the rolling state for the next invocation."""
+        save_state(self.state, self.path)
+
+
+def flag_anomalies(df: pd.DataFrame, path: str = STATE_PATH) -> pd.DataFrame:
+    """Returns the transformed batch with anomaly flags, persisting the
+    rolling state between runs at path."""
+    state = load_state(path)
+    df, state = add_anomaly_flags(df, state)
+    save_state(state, path)
+    return df
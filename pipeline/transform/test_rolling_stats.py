@@ -0,0 +1,99 @@
+"""Tests for the rolling statistics anomaly stage."""
+import numpy as np
+import pandas as pd
+from rolling_stats import (
+    new_state,
+    load_state,
+    save_state,
+    ensure_capacity,
+    add_anomaly_flags,
+    flag_anomalies,
+    MIN_SAMPLES
+)
+
+
+def steady_batch(plant_id: int, readings: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "plant_id": [plant_id] * readings,
+        "soil_moisture": [20.0 + (i % 3) * 0.1 for i in range(readings)],
+        "temperature": [15.0 + (i % 2) * 0.1 for i in range(readings)]
+    })
+
+
+def test_add_anomaly_flags_adds_columns():
+    df, _ = add_anomaly_flags(steady_batch(1, 3), new_state())
+
+    assert "soil_moisture_anomaly" in df.columns
+    assert "temperature_anomaly" in df.columns
+    assert not df["soil_moisture_anomaly"].any()
+
+
+def test_add_anomaly_flags_flags_jump():
+    _, state = add_anomaly_flags(steady_batch(1, MIN_SAMPLES * 2), new_state())
+    jump = pd.DataFrame([{"plant_id": 1, "soil_moisture": 90.0, "temperature": 15.05}])
+
+    df, _ = add_anomaly_flags(jump, state)
+
+    assert df["soil_moisture_anomaly"][0]
+    assert not df["temperature_anomaly"][0]
+
+
+def test_add_anomaly_flags_needs_history():
+    jump = pd.DataFrame([{"plant_id": 1, "soil_moisture": 20.0, "temperature": 15.0},
+                         {"plant_id": 1, "soil_moisture": 90.0, "temperature": 15.0}])
+
+    df, _ = add_anomaly_flags(jump, new_state())
+
+    assert not df["soil_moisture_anomaly"].any()
+
+
+def test_add_anomaly_flags_welford_matches_numpy():
+    batch = steady_batch(2, 25)
+    _, state = add_anomaly_flags(batch, new_state())
+
+    assert state["count"][2, 0] == 25
+    assert np.isclose(state["mean"][2, 0], batch["soil_moisture"].mean())
+    assert np.isclose(state["m2"][2, 0] / 24, batch["soil_moisture"].var())
+
+
+def test_add_anomaly_flags_skips_missing_values():
+    batch = pd.DataFrame([{"plant_id": 3, "soil_moisture": np.nan, "temperature": 12.0}])
+    df, state = add_anomaly_flags(batch, new_state())
+
+    assert state["count"][3, 0] == 0
+    assert state["count"][3, 1] == 1
+    assert not df["soil_moisture_anomaly"][0]
+
+
+def test_ensure_capacity_keeps_existing_state():
+    _, state = add_anomaly_flags(steady_batch(1, 5), new_state(4))
+    grown = ensure_capacity(state, 10)
+
+    assert grown["count"].shape[0] > 10
+    assert grown["count"][1, 0] == 5
+
+
+def test_state_round_trip(tmp_path):
+    _, state = add_anomaly_flags(steady_batch(5, 5), new_state())
+    path = str(tmp_path / "stats.npz")
+
+    save_state(state, path)
+    loaded = load_state(path)
+
+    assert loaded.keys() == state.keys()
+    assert np.array_equal(loaded["count"], state["count"])
+
+
+def test_load_state_missing_file(tmp_path):
+    state = load_state(str(tmp_path / "missing.npz"))
+    assert not state["count"].any()
+
+
+def test_flag_anomalies_persists_between_runs(tmp_path):
+    path = str(tmp_path / "stats.npz")
+    flag_anomalies(steady_batch(1, MIN_SAMPLES * 2), path)
+
+    df = flag_anomalies(pd.DataFrame([{"plant_id": 1, "soil_moisture": 90.0,
+                                       "temperature": 15.0}]), path)
+
+    assert df["soil_moisture_anomaly"][0]
@@ -13,7 +13,9 @@ from transform import (
     capitalise_plant_name,
     validate_soil_moisture,
     process_temperature_column,
-    transform_and_clean_data
+    transform_and_clean_data,
+    transform_in_place,
+    TRANSFORM_STEPS
 )
 
 def test_convert_to_dataframe():
@@ -149,6 +151,17 @@ def test_parse_origin_location():
     assert df["country"][0] == "city"
 
 
+def test_parse_origin_location_coordinates():
+    raw_data = [{"name": "Plant 1", "origin_location": ["-19.32556", "-41.25528", "Resplendor", "BR"]},
+                {"name": "Plant 2", "origin_location": ["north", "-41.25528", "Resplendor", "BR"]}]
+    df = convert_to_dataframe(raw_data)
+    df = parse_origin_location(df)
+
+    assert df["latitude"][0] == -19.32556
+    assert df["longitude"][0] == -41.25528
+    assert pd.isna(df["latitude"][1])
+
+
 def test_capitalise_plant_name_missing_column():
     raw_data = [{"botanist_email": "botanist@example.com",
                  "botanist_name": "Botanist One"}]
@@ -348,3 +361,36 @@ def test_empty_data_returns_empty_df():
     empty_data = []
     empty_df = transform_and_clean_data(empty_data)
     assert empty_df.empty
+
+
+def test_transform_in_place_matches_transform_and_clean_data():
+    raw_data = [
+        {
+            "botanist": {"email": "carl.linnaeus@lnhm.co.uk", "name": "Carl Linnaeus", "phone": "(146)994-1635x35992"},
+            "last_watered": "Wed, 05 Feb 2025 14:03:04 GMT",
+            "name": "Epipremnum Aureum",
+            "plant_id": 50,
+            "recording_taken": "2025-02-06 12:44:11",
+            "soil_moisture": 20.9415458664085,
+            "temperature": 13.2073378873147,
+            "origin_location": ["1.2", "3.4", "Region", "GB"],
+            "images": {"license": 45, "original_url": "https://example.com/image.jpg"}
+        }
+    ]
+    expected = transform_and_clean_data(raw_data)
+    df, _ = transform_in_place(raw_data)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_transform_in_place_reports_every_step():
+    raw_data = [{"name": "Plant 1", "plant_id": 1}]
+    _, allocations = transform_in_place(raw_data)
+
+    assert list(allocations) == [step.__name__ for step in TRANSFORM_STEPS] + ["drop_source_columns"]
+    assert all(size >= 0 for size in allocations.values())
+
+
+def test_transform_in_place_empty_data():
+    df, _ = transform_in_place([])
+    assert df.empty
+    assert "botanist" not in df.columns
@@ -1,5 +1,7 @@
 """This script will transform the data into a usable format for the DB."""
 import re
+import tracemalloc
+from collections.abc import Callable
 import pandas as pd
 import numpy as np
 def convert_to_dataframe(raw_data:list[dict]):
@@ -10,7 +12,7 @@ def convert_to_dataframe(raw_data:list[dict]):
     return pd.DataFrame(raw_data)
 
 
-def parse_botanist_data(df: pd.DataFrame) -> pd.DataFrame:
+def parse_botanist_data(df: pd.DataFrame, drop_source: bool = True) -> pd.DataFrame:
     """Returns botanist data into separate columns, ensuring NaN for missing values without dropping rows."""
 
     if "botanist" not in df.columns:
@@ -22,15 +24,24 @@ def parse_botanist_data(df: pd.DataFrame) -> pd.DataFrame:
     df["botanist_phone"] = df["botanist"].apply(
         lambda x: x.get("phone") if isinstance(x, dict) else np.nan)
 
-    df = df.drop(columns=["botanist"])
+    if drop_source:
+        df = df.drop(columns=["botanist"])
     return df
 
 
-def parse_origin_location(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns the origin_location column parsed into separate region and country columns, handling missing values."""
+def parse_origin_location(df: pd.DataFrame, drop_source: bool = True) -> pd.DataFrame:
+    """Returns the origin_location column parsed into separate latitude, longitude,
+    region and country columns, handling missing values."""
     if "origin_location" not in df.columns:
         df["origin_location"] = np.nan
 
+    df["latitude"] = pd.to_numeric(df["origin_location"].apply(
+        lambda x: x[0] if isinstance(x, list) and len(x) > 0 else np.nan
+    ), errors="coerce")
+    df["longitude"] = pd.to_numeric(df["origin_location"].apply(
+        lambda x: x[1] if isinstance(x, list) and len(x) > 1 else np.nan
+    ), errors="coerce")
+
     df["region"] = df["origin_location"].apply(
         lambda x: x[2] if isinstance(x, list) and len(x) > 2 else np.nan
     )
@@ -38,7 +49,8 @@ def parse_origin_location(df: pd.DataFrame) -> pd.DataFrame:
         lambda x: x[3] if isinstance(x, list) and len(x) > 3 else np.nan
     )
 
-    df = df.drop(columns=["origin_location"])
+    if drop_source:
+        df = df.drop(columns=["origin_location"])
     return df
 
 
@@ -58,7 +70,7 @@ def clean_scientific_name(df:pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def clean_image_data(df:pd.DataFrame) -> pd.DataFrame:
+def clean_image_data(df:pd.DataFrame, drop_source: bool = True) -> pd.DataFrame:
     """Returns the images column into separate columns, creating them even if 'images' does not exist."""
 
     if "images" not in df.columns:
@@ -71,7 +83,8 @@ def clean_image_data(df:pd.DataFrame) -> pd.DataFrame:
         'license_url') if isinstance(x, dict) and x.get('license_url') is not None else np.nan)
     df['image_original_url'] = df['images'].apply(lambda x: x.get(
         'original_url') if isinstance(x, dict) and x.get('original_url') is not None else np.nan)
-    df = df.drop(columns=['images'])
+    if drop_source:
+        df = df.drop(columns=['images'])
     df['image_original_url'] = df['image_original_url'].apply(
         lambda x: x if isinstance(x, str) and (x.startswith('http://') or x.startswith('https://')) else np.nan)
     return df
@@ -140,16 +153,65 @@ def process_temperature_column(df:pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def transform_and_clean_data(raw_data: list[dict]):
-    """Returns dataframe that has been cleaned correctly."""
+TRANSFORM_STEPS = (
+    clean_image_data,
+    clean_scientific_name,
+    format_recording_taken,
+    parse_botanist_data,
+    format_watered_column,
+    parse_origin_location,
+    capitalise_plant_name,
+    process_temperature_column
+)
+
+SOURCE_COLUMNS = {
+    clean_image_data: "images",
+    parse_botanist_data: "botanist",
+    parse_origin_location: "origin_location"
+}
+
+
+def transform_and_clean_data(raw_data: list[dict],
+                             flag_anomalies: Callable[[pd.DataFrame], pd.DataFrame] | None = None):
+    """Returns dataframe that has been cleaned correctly, with anomaly flags
+    added after cleaning when a flagger is given."""
     df = convert_to_dataframe(raw_data)
-    df = clean_image_data(df)
-    df = clean_scientific_name(df)
-    df = format_recording_taken(df)
-    df = parse_botanist_data(df)
-    df = format_watered_column(df)
-    df = parse_origin_location(df)
-    df = capitalise_plant_name(df)
-    df = process_temperature_column(df)
+    for step in TRANSFORM_STEPS:
+        df = step(df)
+    if flag_anomalies is not None:
+        df = flag_anomalies(df)
     return df
 
+
+def transform_in_place(raw_data: list[dict]) -> tuple[pd.DataFrame, dict[str, int]]:
+    """Returns the cleaned dataframe and the bytes allocated by each step.
+    Every step replaces columns on a single frame; the nested source columns
+    are only removed once all steps have run."""
+    df = convert_to_dataframe(raw_data)
+    allocations = {}
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        for step in TRANSFORM_STEPS:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            if step in SOURCE_COLUMNS:
+                step(df, drop_source=False)
+            else:
+                step(df)
+            _, peak = tracemalloc.get_traced_memory()
+            allocations[step.__name__] = peak - before
+
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        for column in SOURCE_COLUMNS.values():
+            del df[column]
+        _, peak = tracemalloc.get_traced_memory()
+        allocations["drop_source_columns"] = peak - before
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+
+    return df, allocations
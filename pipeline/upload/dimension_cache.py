@@ -0,0 +1,66 @@
+"""In-process cache of dimension IDs (plants, countries, regions, locations, botanists).
+The cache lives at module level, so warm Lambda invocations share it."""
+
+from os import environ
+from collections import OrderedDict
+from time import monotonic
+
+MAX_ENTRIES = int(environ.get("DIMENSION_CACHE_SIZE", "4096"))
+TTL_SECONDS = float(environ.get("DIMENSION_CACHE_TTL", "900"))
+
+_caches: dict[str, OrderedDict] = {}
+_stats = {"hits": 0, "misses": 0}
+
+
+def lookup(dimension: str, keys: list) -> dict:
+    """Returns the cached, unexpired values for whichever keys are present,
+    counting a hit or miss for each key."""
+    cache = _caches.setdefault(dimension, OrderedDict())
+    now = monotonic()
+    found = {}
+    for key in keys:
+        entry = cache.get(key)
+        if entry is not None and entry[1] > now:
+            cache.move_to_end(key)
+            found[key] = entry[0]
+            _stats["hits"] += 1
+        else:
+            if entry is not None:
+                del cache[key]
+            _stats["misses"] += 1
+    return found
+
+
+def store(dimension: str, values: dict) -> None:
+    """Caches each key's value for TTL_SECONDS, evicting the least recently
+    used entries beyond MAX_ENTRIES."""
+    cache = _caches.setdefault(dimension, OrderedDict())
+    expires_at = monotonic() + TTL_SECONDS
+    for key, value in values.items():
+        cache[key] = (value, expires_at)
+        cache.move_to_end(key)
+    while len(cache) > MAX_ENTRIES:
+        cache.popitem(last=False)
+
+
+def invalidate(dimension: str, keys: list | None = None) -> None:
+    """Removes the given keys from a dimension, or the whole dimension if no keys are given."""
+    if keys is None:
+        _caches.pop(dimension, None)
+        return
+    cache = _caches.get(dimension, {})
+    for key in keys:
+        cache.pop(key, None)
+
+
+def hit_rate() -> float:
+    """Returns the fraction of lookups served from the cache since the last clear."""
+    total = _stats["hits"] + _stats["misses"]
+    return _stats["hits"] / total if total else 0.0
+
+
+def clear() -> None:
+    """Empties every dimension and resets the hit/miss counters."""
+    _caches.clear()
+    _stats["hits"] = 0
+    _stats["misses"] = 0
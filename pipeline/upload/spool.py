@@ -0,0 +1,106 @@
+"""Durable local spool between transform and upload.
+Transformed batches are written to a SQLite file first, then drained to
+SQL Server in coalesced batches. A batch is only removed once it has been
+uploaded, so delivery is at-least-once; the reading upload skips duplicates.
+SPOOL_PATH defaults to /tmp, which on Lambda only survives while the same
+container stays warm: batches spooled during a database outage are retried
+by later invocations in that container, but are lost if it is recycled.
+Point SPOOL_PATH at a mounted file system (such as EFS) to outlive it."""
+
+# pylint: disable=no-member
+
+import sqlite3
+from io import BytesIO
+from os import environ
+from time import time
+
+import pandas as pd
+import pymssql
+
+from upload import upload_new_plants_bulk, update_botanists, upload_readings
+
+SPOOL_PATH = environ.get("SPOOL_PATH", "/tmp/pigasus-spool.sqlite")
+MAX_DRAIN_BATCHES = 60
+SPOOLED_COLUMNS = [
+    "plant_id", "name", "scientific_name", "image_id",
+    "country", "region", "latitude", "longitude",
+    "botanist_name", "botanist_email", "botanist_phone",
+    "soil_moisture", "temperature", "recording_taken", "last_watered"
+]
+
+
+def open_spool(path: str = SPOOL_PATH) -> sqlite3.Connection:
+    """Returns a connection to the spool file, creating its table if needed."""
+    spool = sqlite3.connect(path)
+    spool.execute("PRAGMA journal_mode=WAL;")
+    spool.execute("PRAGMA synchronous=FULL;")
+    spool.execute("""
+        CREATE TABLE IF NOT EXISTS batch (
+            batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            spooled_at REAL NOT NULL,
+            row_count INTEGER NOT NULL,
+            payload BLOB NOT NULL
+        );
+    """)
+    return spool
+
+
+def spool_batch(data: pd.DataFrame, path: str = SPOOL_PATH) -> int:
+    """Writes a transformed batch to the spool, returning its batch_id."""
+    buffer = BytesIO()
+    data.reindex(columns=SPOOLED_COLUMNS).to_parquet(buffer, index=False)
+
+    spool = open_spool(path)
+    with spool:
+        cursor = spool.execute(
+            "INSERT INTO batch (spooled_at, row_count, payload) VALUES (?, ?, ?);",
+            (time(), len(data), buffer.getvalue()))
+    spool.close()
+    return cursor.lastrowid
+
+
+def pending_count(path: str = SPOOL_PATH) -> int:
+    """Returns the number of batches waiting in the spool."""
+    spool = open_spool(path)
+    count = spool.execute("SELECT COUNT(*) FROM batch;").fetchone()[0]
+    spool.close()
+    return count
+
+
+def read_pending(spool: sqlite3.Connection,
+                 max_batches: int) -> tuple[list[int], pd.DataFrame]:
+    """Returns the ids of the oldest spooled batches and their rows as one dataframe."""
+    rows = spool.execute("SELECT batch_id, payload FROM batch ORDER BY batch_id LIMIT ?;",
+                         (max_batches,)).fetchall()
+    if not rows:
+        return [], pd.DataFrame(columns=SPOOLED_COLUMNS)
+    frames = [pd.read_parquet(BytesIO(payload)) for _, payload in rows]
+    return [batch_id for batch_id, _ in rows], pd.concat(frames, ignore_index=True)
+
+
+def drain_spool(conn: pymssql.Connection, path: str = SPOOL_PATH,
+                max_batches: int = MAX_DRAIN_BATCHES,
+                deadline: float | None = None) -> dict[str, int]:
+    """Uploads up to max_batches spooled batches as one coalesced batch and
+    removes them from the spool, returning the batches drained and readings inserted.
+    If the upload fails, or reaches the deadline before every reading is sent,
+    the batches stay spooled and the error is raised."""
+    spool = open_spool(path)
+    try:
+        batch_ids, data = read_pending(spool, max_batches)
+        if not batch_ids:
+            return {"batches": 0, "rows": 0}
+
+        upload_new_plants_bulk(conn, data)
+        botanist_ids = update_botanists(conn, data)
+        inserted = upload_readings(conn, data, botanist_ids=botanist_ids,
+                                   deadline=deadline)["rows"]
+
+        placeholders = ", ".join(["?"] * len(batch_ids))
+        with spool:
+            spool.execute(f"DELETE FROM batch WHERE batch_id IN ({placeholders});",
+                          batch_ids)
+        print(f"Drained {len(batch_ids)} spooled batches ({len(data)} rows).")
+        return {"batches": len(batch_ids), "rows": inserted}
+    finally:
+        spool.close()
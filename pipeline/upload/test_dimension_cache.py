@@ -0,0 +1,55 @@
+"""Tests for the in-process dimension cache."""
+from unittest.mock import patch
+
+import dimension_cache
+from dimension_cache import lookup, store, invalidate, hit_rate, clear
+
+
+def test_lookup_returns_stored_values():
+    store("country", {"GB": 1, "FR": 2})
+    assert lookup("country", ["GB", "DE"]) == {"GB": 1}
+
+
+def test_hit_rate_counts_each_key():
+    store("country", {"GB": 1})
+    lookup("country", ["GB", "DE"])
+    assert hit_rate() == 0.5
+
+
+def test_hit_rate_without_lookups():
+    assert hit_rate() == 0.0
+
+
+def test_entries_expire_after_ttl():
+    with patch("dimension_cache.monotonic", return_value=0):
+        store("region", {"Kent": 3})
+    with patch("dimension_cache.monotonic", return_value=dimension_cache.TTL_SECONDS + 1):
+        assert lookup("region", ["Kent"]) == {}
+
+
+@patch("dimension_cache.MAX_ENTRIES", 2)
+def test_least_recently_used_entry_evicted():
+    store("plant", {1: 1, 2: 2})
+    lookup("plant", [1])
+    store("plant", {3: 3})
+    assert lookup("plant", [1, 2, 3]) == {1: 1, 3: 3}
+
+
+def test_invalidate_keys():
+    store("botanist", {"111": 1, "222": 2})
+    invalidate("botanist", ["111"])
+    assert lookup("botanist", ["111", "222"]) == {"222": 2}
+
+
+def test_invalidate_dimension():
+    store("botanist", {"111": 1})
+    invalidate("botanist")
+    assert lookup("botanist", ["111"]) == {}
+
+
+def test_clear_resets_stats():
+    store("plant", {1: 1})
+    lookup("plant", [1])
+    clear()
+    assert hit_rate() == 0.0
+    assert lookup("plant", [1]) == {}
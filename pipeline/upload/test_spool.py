@@ -0,0 +1,83 @@
+"""Tests for the local write-behind spool."""
+from unittest.mock import MagicMock, patch
+import pandas as pd
+import pytest
+
+from spool import spool_batch, pending_count, drain_spool, open_spool, read_pending
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / "spool.sqlite")
+
+
+def minute_batch(plant_id: int) -> pd.DataFrame:
+    return pd.DataFrame([{
+        "plant_id": plant_id,
+        "name": "Plant",
+        "botanist_phone": "123",
+        "soil_moisture": 20.5,
+        "temperature": 14.2,
+        "recording_taken": pd.Timestamp("2025-02-06 12:00:00"),
+        "last_watered": pd.Timestamp("2025-02-05 09:00:00"),
+        "image_license": 4
+    }])
+
+
+def test_spool_batch_persists(spool_path):
+    spool_batch(minute_batch(1), spool_path)
+    spool_batch(minute_batch(2), spool_path)
+    assert pending_count(spool_path) == 2
+
+
+def test_read_pending_round_trips_types(spool_path):
+    spool_batch(minute_batch(1), spool_path)
+
+    _, data = read_pending(open_spool(spool_path), 10)
+
+    assert data["recording_taken"][0] == pd.Timestamp("2025-02-06 12:00:00")
+    assert data["plant_id"][0] == 1
+    assert "image_license" not in data.columns
+
+
+@patch("spool.upload_readings")
+@patch("spool.update_botanists")
+@patch("spool.upload_new_plants_bulk")
+def test_drain_spool_coalesces_batches(mock_plants, mock_botanists, mock_readings, spool_path):
+    for plant_id in range(3):
+        spool_batch(minute_batch(plant_id), spool_path)
+
+    drained = drain_spool(MagicMock(), spool_path)
+
+    assert drained["batches"] == 3
+    assert mock_readings.call_count == 1
+    assert len(mock_readings.call_args.args[1]) == 3
+    assert pending_count(spool_path) == 0
+
+
+@patch("spool.upload_readings")
+@patch("spool.update_botanists")
+@patch("spool.upload_new_plants_bulk")
+def test_drain_spool_limits_batches(mock_plants, mock_botanists, mock_readings, spool_path):
+    for plant_id in range(3):
+        spool_batch(minute_batch(plant_id), spool_path)
+
+    assert drain_spool(MagicMock(), spool_path, max_batches=2)["batches"] == 2
+    assert pending_count(spool_path) == 1
+
+
+@patch("spool.upload_readings", side_effect=ConnectionError("database unavailable"))
+@patch("spool.update_botanists")
+@patch("spool.upload_new_plants_bulk")
+def test_drain_spool_keeps_batches_on_failure(mock_plants, mock_botanists, mock_readings,
+                                              spool_path):
+    spool_batch(minute_batch(1), spool_path)
+
+    with pytest.raises(ConnectionError):
+        drain_spool(MagicMock(), spool_path)
+
+    assert pending_count(spool_path) == 1
+
+
+def test_drain_empty_spool(spool_path):
+    assert drain_spool(MagicMock(), spool_path) == {"batches": 0, "rows": 0}
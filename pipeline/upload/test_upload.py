@@ -1,11 +1,20 @@
 """Test functions from upload.py module"""
 
 import pandas as pd
-from unittest.mock import MagicMock, patch
+import sqlite3
+from unittest.mock import MagicMock, PropertyMock, patch
+import pytest
+
+import dimension_cache
+import upload
+from backends import connect_sqlite
+from connection_pool import get_pooled_connection, close_all
 
 from upload import (
     get_existing_plant_ids,
-    upload_new_plants_with_location, update_botanists
+    upload_new_plants_with_location, update_botanists,
+    upload_new_plants_bulk, build_insert_sql, insert_rows, to_parameters,
+    get_botanist_ids, prepare_readings, upload_readings
 )
 
 def test_get_existing_plant_ids_empty():
@@ -168,6 +177,10 @@ def test_merge_tables():
         MERGE alpha.botanist as target
         USING alpha.#transaction_botanists as source
         ON target.phone_number = source.phone_number
+        WHEN MATCHED AND EXISTS (
+            SELECT target.name, target.email EXCEPT SELECT source.name, source.email
+        ) THEN
+            UPDATE SET name = source.name, email = source.email
         WHEN NOT MATCHED THEN
             INSERT (name, email, phone_number)
             VALUES (source.name, source.email, source.phone_number)
@@ -216,3 +229,362 @@ def test_populate_temp_table():
             (%s, %s, %s)
         ;
     """, seq_of_parameters=[('bar', 'foo', 'baz'), ('ipsum', 'lorem', 'dei')])
+
+
+def make_plants(plant_ids: list) -> pd.DataFrame:
+    """Returns a batch of transformed plant rows for the given ids."""
+    return pd.DataFrame([{
+        "botanist_email": "new@example.com",
+        "botanist_name": "New Botanist",
+        "botanist_phone": "987654321",
+        "region": "New Region",
+        "country": "NR",
+        "scientific_name": "Newus plantus",
+        "last_watered": pd.to_datetime("2025-02-01 00:00:00"),
+        "recording_taken": pd.to_datetime("2025-02-01 00:00:00"),
+        "plant_id": plant_id,
+        "soil_moisture": 60.0,
+        "temperature": 22.0,
+        "name": "New Plant",
+        "latitude": 30.0,
+        "longitude": 40.0,
+        "image_id": None
+    } for plant_id in plant_ids])
+
+
+def test_build_insert_sql():
+    """Tests that a multi-row insert has one placeholder group per row."""
+    sql = build_insert_sql("alpha.t", ["a", "b"], 2)
+    assert sql == "INSERT INTO alpha.t (a, b) VALUES (%s, %s), (%s, %s);"
+
+
+def test_insert_rows_chunks_by_parameter_limit():
+    """Tests that rows are split so no statement exceeds the parameter limit."""
+    mock_cursor = MagicMock()
+    rows = [(i, i) for i in range(2500)]
+
+    statements = insert_rows(mock_cursor, "alpha.t", ["a", "b"], rows)
+
+    assert statements == 3
+    assert len(mock_cursor.execute.call_args_list[0].args[1]) == 2000
+
+
+def test_to_parameters_converts_nan_to_none():
+    """Tests that missing values are sent to the database as NULL."""
+    data = pd.DataFrame({"a": [1, 2], "b": [1.5, float("nan")]})
+    assert to_parameters(data) == [(1, 1.5), (2, None)]
+
+
+def test_upload_new_plants_bulk_constant_round_trips():
+    """Tests that the bulk path uses the same number of statements for 1 or 200 plants."""
+    counts = []
+    for size in (1, 200):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = []
+
+        upload_new_plants_bulk(mock_conn, make_plants(list(range(size))))
+
+        counts.append(mock_cursor.execute.call_count)
+        mock_conn.commit.assert_called_once()
+    assert counts[0] == counts[1] == 11
+
+
+def test_upload_new_plants_bulk_no_new():
+    """Tests that nothing is staged when every plant already exists."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [(1,)]
+
+    upload_new_plants_bulk(mock_conn, make_plants([1]))
+
+    assert mock_cursor.execute.call_count == 1
+    mock_conn.commit.assert_not_called()
+
+
+def test_upload_new_plants_bulk_stages_unique_plants():
+    """Tests that duplicated plants in a batch are staged once."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = []
+
+    upload_new_plants_bulk(mock_conn, make_plants([7, 7, 8]))
+
+    staged_parameters = mock_cursor.execute.call_args_list[3].args[1]
+    assert len(staged_parameters) == 2 * 8
+
+
+def test_get_botanist_ids_empty():
+    """Tests that no query is run when there are no phone numbers."""
+    mock_conn = MagicMock()
+    assert get_botanist_ids(mock_conn, []) == {}
+    mock_conn.cursor.assert_not_called()
+
+
+def test_get_botanist_ids_maps_phone_to_id():
+    """Tests that botanist rows are returned as a phone to id mapping."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [(4, "987654321")]
+
+    assert get_botanist_ids(mock_conn, ["987654321"]) == {"987654321": 4}
+
+
+def test_prepare_readings_resolves_ids():
+    """Tests that readings get a botanist_id and unknown plants are dropped."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [[(1,)], [(4, "987654321")]]
+
+    readings = prepare_readings(mock_conn, make_plants([1, 2]))
+
+    assert readings["plant_id"].tolist() == [1]
+    assert readings["botanist_id"].tolist() == [4]
+    assert list(readings.columns) == ["plant_id", "soil_moisture", "temperature",
+                                      "at", "botanist_id", "last_watered"]
+
+
+def test_upload_readings_commits_per_batch():
+    """Tests that each batch of readings is committed separately."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [[(i,) for i in range(5)], [(4, "987654321")]]
+    type(mock_cursor).rowcount = PropertyMock(side_effect=[2, 2, 1])
+
+    result = upload_readings(mock_conn, make_plants(list(range(5))), batch_size=2)
+
+    assert result["rows"] == 5
+    assert mock_conn.commit.call_count == 4
+    assert result["rows_per_second"] > 0
+
+
+def test_upload_readings_no_rows():
+    """Tests that nothing is committed when no readings can be resolved."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [[], []]
+
+    result = upload_readings(mock_conn, make_plants([1]))
+
+    assert result["rows"] == 0
+    mock_conn.commit.assert_not_called()
+
+
+def test_get_existing_plant_ids_uses_cache():
+    """Tests that plants found once are not queried for again."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [(1,), (2,)]
+    get_existing_plant_ids(mock_conn, [1, 2])
+
+    result = get_existing_plant_ids(mock_conn, [1, 2])
+
+    assert result == {1, 2}
+    assert mock_cursor.execute.call_count == 1
+
+
+def test_upload_new_plants_bulk_skips_cached_dimensions():
+    """Tests that no dimension statements run when every key is cached."""
+    dimension_cache.store("country", {"NR": 1})
+    dimension_cache.store("region", {("New Region", "NR"): 2})
+    dimension_cache.store("location", {(30.0, 40.0, "New Region", "NR"): 3})
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = []
+
+    upload_new_plants_bulk(mock_conn, make_plants([5]))
+
+    executed = [call.args[0] for call in mock_cursor.execute.call_args_list]
+    assert not any("INSERT INTO alpha.country" in sql for sql in executed)
+    assert mock_cursor.execute.call_count == 7
+
+
+def test_upload_new_plants_bulk_caches_new_plants():
+    """Tests that uploaded plants are answered from the cache afterwards."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [[], [], [(5,)]]
+
+    upload_new_plants_bulk(mock_conn, make_plants([5]))
+
+    assert dimension_cache.lookup("plant", [5]) == {5: 5}
+
+
+def test_upload_new_plants_bulk_caches_only_stored_plants(tmp_path):
+    """Tests that a staged plant the insert could not place is not cached."""
+    dimension_cache.store("country", {"NR": 1})
+    dimension_cache.store("region", {("New Region", "NR"): 2})
+    dimension_cache.store("location", {(30.0, 40.0, "New Region", "NR"): 3})
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+
+    upload_new_plants_bulk(conn, make_plants([5]))
+
+    assert dimension_cache.lookup("plant", [5]) == {}
+    assert get_existing_plant_ids(conn, [5]) == set()
+
+
+def test_update_botanists_skips_cached_botanists():
+    """Tests that known, unchanged botanists do not touch the database."""
+    dimension_cache.store("botanist", {"baz": 1})
+    dimension_cache.store("botanist_details", {"baz": ("bar", "foo")})
+    mock_conn = MagicMock()
+
+    botanist_ids = update_botanists(mock_conn, pd.DataFrame({"botanist_name": ["bar"],
+                                                             "botanist_email": ["foo"],
+                                                             "botanist_phone": ["baz"]}))
+
+    mock_conn.cursor.assert_not_called()
+    assert botanist_ids == {"baz": 1}
+
+
+def test_update_botanists_deduplicates_and_sends_only_changes():
+    """Tests that each botanist is sent once, and only when new or changed."""
+    dimension_cache.store("botanist_details", {"baz": ("bar", "foo")})
+    mock_conn = MagicMock()
+    mock_curr = mock_conn.cursor.return_value.__enter__.return_value
+
+    update_botanists(mock_conn, pd.DataFrame({
+        "botanist_name": ["bar", "bar", "ipsum", "ipsum"],
+        "botanist_email": ["foo", "foo", "lorem", "lorem"],
+        "botanist_phone": ["baz", "baz", "dei", "dei"]}))
+
+    assert mock_curr.executemany.call_args.kwargs["seq_of_parameters"] == [
+        ("ipsum", "lorem", "dei")]
+
+
+def test_update_botanists_changed_details_on_sqlite(tmp_path):
+    """Tests that a botanist's changed email is updated rather than duplicated."""
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    first = update_botanists(conn, pd.DataFrame({"botanist_name": ["bar"],
+                                                 "botanist_email": ["foo"],
+                                                 "botanist_phone": ["baz"]}))
+    second = update_botanists(conn, pd.DataFrame({"botanist_name": ["bar"],
+                                                  "botanist_email": ["new"],
+                                                  "botanist_phone": ["baz"]}))
+
+    assert first == second == {"baz": 1}
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT email FROM alpha.botanist;")
+        assert cursor.fetchall() == [("new",)]
+
+
+def test_upload_readings_reports_skipped_duplicates():
+    """Tests that readings already stored, or repeated in the batch, count as skipped."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [[(1,), (2,)], [(4, "987654321")]]
+    type(mock_cursor).rowcount = PropertyMock(return_value=1)
+
+    result = upload_readings(mock_conn, make_plants([1, 1, 2]))
+
+    assert result["rows"] == 1
+    assert result["skipped"] == 2
+
+
+def test_upload_readings_inserts_only_absent_rows():
+    """Tests that readings are inserted with a NOT EXISTS check on (plant_id, at)."""
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [[(1,)], [(4, "987654321")]]
+    type(mock_cursor).rowcount = PropertyMock(return_value=1)
+
+    upload_readings(mock_conn, make_plants([1]))
+
+    executed = [call.args[0] for call in mock_cursor.execute.call_args_list]
+    insert_sql = next(sql for sql in executed if "INSERT INTO alpha.reading" in sql)
+    assert "r.plant_id = s.plant_id AND r.at = s.at" in insert_sql
+
+
+def test_prepare_readings_uses_given_botanist_ids():
+    """Tests that a mapping from update_botanists saves looking botanists up again."""
+    dimension_cache.store("plant", {1: 1})
+    mock_conn = MagicMock()
+
+    readings = prepare_readings(mock_conn, make_plants([1]), botanist_ids={"987654321": 4})
+
+    mock_conn.cursor.assert_not_called()
+    assert readings["botanist_id"].tolist() == [4]
+
+
+def test_upload_readings_retry_after_failed_batch(tmp_path):
+    """Tests that a batch failing mid-upload leaves nothing behind to break the next call."""
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    data = make_plants([1, 2])
+    upload_new_plants_bulk(conn, data)
+    botanist_ids = update_botanists(conn, data)
+
+    with patch.object(upload, "insert_new_readings",
+                      side_effect=sqlite3.OperationalError("database is locked")):
+        with pytest.raises(sqlite3.OperationalError):
+            upload_readings(conn, data, botanist_ids=botanist_ids)
+    result = upload_readings(conn, data, botanist_ids=botanist_ids)
+
+    assert result["rows"] == 2
+
+
+def test_upload_new_plants_bulk_retry_after_failure(tmp_path):
+    """Tests that the staged plants table left by a failed call is replaced on retry."""
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+
+    with patch.object(upload, "insert_rows", side_effect=ValueError("bad row")):
+        with pytest.raises(ValueError):
+            upload_new_plants_bulk(conn, make_plants([1]))
+    upload_new_plants_bulk(conn, make_plants([1]))
+
+    assert get_existing_plant_ids(conn, [1]) == {1}
+
+
+def test_database_error_discards_pooled_connection(tmp_path):
+    """Tests that a failed upload drops its pooled connection so the next call reconnects."""
+    path = str(tmp_path / "plants.sqlite")
+    conn = get_pooled_connection("upload", lambda: connect_sqlite(path))
+    data = make_plants([1])
+    upload_new_plants_bulk(conn, data)
+    update_botanists(conn, data)
+
+    with patch.object(upload, "insert_new_readings",
+                      side_effect=sqlite3.OperationalError("disk I/O error")):
+        with pytest.raises(sqlite3.OperationalError):
+            upload_readings(conn, data)
+
+    try:
+        assert get_pooled_connection("upload", lambda: connect_sqlite(path)) is not conn
+    finally:
+        close_all()
+
+
+def test_database_error_on_other_connection_keeps_pooled_connection(tmp_path):
+    """Tests that a failed upload on a connection outside the pool leaves the pooled one open."""
+    path = str(tmp_path / "plants.sqlite")
+    pooled = get_pooled_connection("upload", lambda: connect_sqlite(path))
+    conn = connect_sqlite(path)
+    data = make_plants([1])
+    upload_new_plants_bulk(conn, data)
+    update_botanists(conn, data)
+
+    with patch.object(upload, "insert_new_readings",
+                      side_effect=sqlite3.OperationalError("disk I/O error")):
+        with pytest.raises(sqlite3.OperationalError):
+            upload_readings(conn, data)
+
+    try:
+        assert get_pooled_connection("upload", lambda: connect_sqlite(path)) is pooled
+    finally:
+        close_all()
+
+
+def test_upload_readings_stops_between_batches_at_deadline(tmp_path):
+    """Tests that no batch starts once the deadline passes, and the shortfall is raised."""
+    conn = connect_sqlite(str(tmp_path / "plants.sqlite"))
+    data = make_plants([1, 2, 3])
+    upload_new_plants_bulk(conn, data)
+    botanist_ids = update_botanists(conn, data)
+    clock = iter([0.0, 1.0, 2.0, 3.0])
+
+    with patch.object(upload, "perf_counter", lambda: next(clock)):
+        with pytest.raises(TimeoutError, match="after 1 of 3 readings"):
+            upload_readings(conn, data, batch_size=1, botanist_ids=botanist_ids, deadline=1.5)
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM alpha.reading;")
+        assert cursor.fetchone()[0] == 1
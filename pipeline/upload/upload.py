@@ -1,16 +1,25 @@
 """Functions to upload relevant data from plant data batch 
-to short term SQL Server Database"""
+to short term SQL Server Database (or its local SQLite stand-in)"""
 # pylint: disable=no-member
 
 import os
+from time import perf_counter
+from contextlib import contextmanager
+from collections.abc import Iterator
 import pymssql
 import pandas as pd
 from dotenv import load_dotenv
+import dimension_cache
+from connection_pool import get_pooled_connection, connection_metrics, discard
+from backends import get_dialect, connect_sqlite, DATABASE_ERRORS
+from instrumentation import instrument, unwrap, summary_lines
 
+POOL_NAME = "upload"
 
-def get_connection():
+
+def open_connection() -> pymssql.Connection:
     """
-    Returns a connection object to connect to the database,
+    Returns a new connection object to connect to the database,
     using all the required environment variables.
     """
     conn = pymssql.connect(
@@ -23,21 +32,79 @@ def get_connection():
     return conn
 
 
+def get_connection() -> pymssql.Connection:
+    """
+    Returns a live connection to the database, reusing the one kept
+    from a previous warm invocation where possible.
+    Setting DB_BACKEND=sqlite connects to the SQLite file at SQLITE_PATH instead.
+    Every statement run on it is timed by instrumentation.
+    """
+    if os.environ.get("DB_BACKEND") == "sqlite":
+        return instrument(get_pooled_connection(
+            POOL_NAME, lambda: connect_sqlite(os.environ["SQLITE_PATH"])))
+    return instrument(get_pooled_connection(POOL_NAME, open_connection))
+
+
+def abandon_session(conn: pymssql.Connection) -> None:
+    """
+    Rolls back what it can after a database error and, if conn is the pooled
+    connection, discards it so the next call starts on a fresh session.
+    A connection that is not pooled leaves the pooled one open.
+    """
+    try:
+        conn.rollback()
+    except DATABASE_ERRORS:
+        pass
+    discard(POOL_NAME, only=unwrap(conn))
+
+
+@contextmanager
+def staging_table(conn: pymssql.Connection, name: str, create_sql: str) -> Iterator[str]:
+    """
+    Yields a temp table created with create_sql for the block, first dropping
+    one of the same name that an earlier failed call left on the session.
+    The table is dropped and committed once the block succeeds; a database
+    error abandons the session instead, which drops it with the connection.
+    """
+    sql = get_dialect(conn)
+    table = sql["temp_table"].format(name=name)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql["drop_temp_table"].format(name=name))
+            cursor.execute(create_sql)
+        yield table
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {table};")
+        conn.commit()
+    except DATABASE_ERRORS:
+        abandon_session(conn)
+        raise
+
+
 def get_existing_plant_ids(conn: pymssql.Connection, plant_ids: list) -> set:
     """
     Returns a set of plant_ids that already exist in the database.
+    Plants already seen by this process are answered from the dimension cache.
     """
     if not plant_ids:
         return set()
 
-    placeholders = ", ".join(["%s"] * len(plant_ids))
+    plant_ids = list(dict.fromkeys(plant_ids))
+    cached = dimension_cache.lookup("plant", plant_ids)
+    unknown_ids = [plant_id for plant_id in plant_ids if plant_id not in cached]
+    if not unknown_ids:
+        return set(cached)
+
+    placeholders = ", ".join(["%s"] * len(unknown_ids))
     query = f"SELECT plant_id FROM alpha.plant WHERE plant_id IN ({placeholders})"
 
     with conn.cursor() as cursor:
-        cursor.execute(query, tuple(plant_ids))
+        cursor.execute(query, tuple(unknown_ids))
         rows = cursor.fetchall()
 
-    return {row[0] for row in rows}
+    found = {row[0] for row in rows}
+    dimension_cache.store("plant", {plant_id: plant_id for plant_id in found})
+    return set(cached) | found
 
 
 def upload_new_plants_with_location(conn: pymssql.Connection, data: pd.DataFrame) -> None:
@@ -125,52 +192,357 @@ def upload_new_plants_with_location(conn: pymssql.Connection, data: pd.DataFrame
     print("Upload process completed.")
 
 
-def update_botanists(conn: pymssql.Connection, batch_data: pd.DataFrame) -> None:
+MAX_PARAMETERS = 2000
+MAX_ROWS_PER_INSERT = 1000
+READING_BATCH_SIZE = 5000
+READING_COLUMNS = ["plant_id", "soil_moisture", "temperature",
+                   "at", "botanist_id", "last_watered"]
+
+
+def to_parameters(data: pd.DataFrame) -> list[tuple]:
+    """Returns the rows of a dataframe as tuples of native python values, with NaN as None."""
+    return [tuple(None if pd.isna(value) else value for value in row.values())
+            for row in data.to_dict("records")]
+
+
+def build_insert_sql(table: str, columns: list[str], row_count: int) -> str:
+    """Returns a parameterised multi-row INSERT statement for row_count rows."""
+    row_placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    values = ", ".join([row_placeholders] * row_count)
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values};"
+
+
+def insert_rows(cursor: pymssql.Cursor, table: str, columns: list[str], rows: list[tuple]) -> int:
+    """Inserts rows with as few multi-row INSERT statements as SQL Server's
+    parameter limits allow, returning the number of statements executed."""
+    rows_per_statement = min(MAX_ROWS_PER_INSERT, MAX_PARAMETERS // len(columns))
+    statements = 0
+    for start in range(0, len(rows), rows_per_statement):
+        chunk = rows[start:start + rows_per_statement]
+        parameters = tuple(value for row in chunk for value in row)
+        cursor.execute(build_insert_sql(table, columns, len(chunk)), parameters)
+        statements += 1
+    return statements
+
+
+DIMENSION_KEYS = {
+    "country": ["country"],
+    "region": ["region", "country"],
+    "location": ["latitude", "longitude", "region", "country"]
+}
+
+DIMENSION_INSERT_SQL = {
+    "country": """
+        INSERT INTO alpha.country (country_code)
+        SELECT DISTINCT s.country_code
+        FROM {staged} AS s
+        WHERE s.country_code IS NOT NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM alpha.country AS c WHERE c.country_code = s.country_code
+        );
+    """,
+    "region": """
+        INSERT INTO alpha.region (region_name, country_id)
+        SELECT DISTINCT s.region_name, c.country_id
+        FROM {staged} AS s
+        JOIN alpha.country AS c ON c.country_code = s.country_code
+        WHERE s.region_name IS NOT NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM alpha.region AS r
+            WHERE r.region_name = s.region_name AND r.country_id = c.country_id
+        );
+    """,
+    "location": """
+        INSERT INTO alpha.location (latitude, longitude, region_id)
+        SELECT DISTINCT s.latitude, s.longitude, r.region_id
+        FROM {staged} AS s
+        JOIN alpha.country AS c ON c.country_code = s.country_code
+        JOIN alpha.region AS r
+            ON r.region_name = s.region_name AND r.country_id = c.country_id
+        WHERE s.latitude IS NOT NULL AND s.longitude IS NOT NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM alpha.location AS l
+            WHERE l.latitude = s.latitude AND l.longitude = s.longitude
+            AND l.region_id = r.region_id
+        );
+    """
+}
+
+STAGED_PLANT_IDS_SQL = """
+    FROM {staged} AS s
+    JOIN alpha.country AS c ON c.country_code = s.country_code
+    JOIN alpha.region AS r
+        ON r.region_name = s.region_name AND r.country_id = c.country_id
+    JOIN alpha.location AS l
+        ON l.latitude = s.latitude AND l.longitude = s.longitude
+        AND l.region_id = r.region_id
+"""
+
+
+def dimension_keys(staged: pd.DataFrame, dimension: str) -> list:
+    """Returns the distinct, complete cache keys of a dimension in the staged plants."""
+    keys = staged[DIMENSION_KEYS[dimension]].dropna().itertuples(index=False, name=None)
+    return list(dict.fromkeys(key if len(key) > 1 else key[0] for key in keys))
+
+
+def uncached_dimensions(staged: pd.DataFrame) -> list[str]:
+    """Returns the dimensions with at least one key in the batch that is not cached."""
+    missing = []
+    for dimension in DIMENSION_KEYS:
+        keys = dimension_keys(staged, dimension)
+        if len(dimension_cache.lookup(dimension, keys)) < len(keys):
+            missing.append(dimension)
+    return missing
+
+
+def cache_staged_dimensions(cursor: pymssql.Cursor, staged: pd.DataFrame,
+                            staged_table: str) -> None:
+    """Caches the country, region and location IDs resolved for the staged plants."""
+    cursor.execute("SELECT s.plant_id, c.country_id, r.region_id, l.location_id"
+                   + STAGED_PLANT_IDS_SQL.format(staged=staged_table) + ";")
+    plants = staged.set_index("plant_id")
+    for plant_id, country_id, region_id, location_id in cursor.fetchall():
+        if plant_id not in plants.index:
+            continue
+        plant = plants.loc[plant_id]
+        dimension_cache.store("country", {plant["country"]: country_id})
+        dimension_cache.store("region", {(plant["region"], plant["country"]): region_id})
+        dimension_cache.store("location", {
+            (plant["latitude"], plant["longitude"], plant["region"], plant["country"]): location_id
+        })
+
+
+def upload_new_plants_bulk(conn: pymssql.Connection, data: pd.DataFrame) -> None:
+    """
+    Uploads all new plants along with their country, region and location,
+    staging the batch in a temp table and resolving each dimension with one
+    set-based statement, so the number of round-trips does not grow with the batch.
+    Dimensions whose keys are all cached are not written to, and only plants
+    found in alpha.plant afterwards are cached.
+    """
+    existing_ids = get_existing_plant_ids(conn, data["plant_id"].tolist())
+    new_plants_data = data[~data["plant_id"].isin(existing_ids)]
+    if new_plants_data.empty:
+        print("No new plants to upload.")
+        return
+
+    staged = new_plants_data.drop_duplicates(subset="plant_id").reindex(columns=[
+        "plant_id", "country", "region", "latitude", "longitude",
+        "scientific_name", "image_id", "name"])
+    print(f"New plant IDs to upload: {staged['plant_id'].tolist()}")
+    new_dimensions = uncached_dimensions(staged)
+    staged_table = get_dialect(conn)["temp_table"].format(name="staged_plants")
+
+    create_sql = f"""
+        CREATE TABLE {staged_table}(
+            plant_id INT NOT NULL,
+            country_code VARCHAR(2),
+            region_name VARCHAR(20),
+            latitude DECIMAL,
+            longitude DECIMAL,
+            scientific_name VARCHAR(30),
+            image_id INT,
+            common_name VARCHAR(30)
+        )
+        ;
+    """
+
+    with staging_table(conn, "staged_plants", create_sql), conn.cursor() as cursor:
+        insert_rows(cursor, staged_table,
+                    ["plant_id", "country_code", "region_name", "latitude", "longitude",
+                     "scientific_name", "image_id", "common_name"],
+                    to_parameters(staged))
+
+        for dimension in new_dimensions:
+            dimension_cache.invalidate(dimension, dimension_keys(staged, dimension))
+            cursor.execute(DIMENSION_INSERT_SQL[dimension].format(staged=staged_table))
+
+        cursor.execute("INSERT INTO alpha.plant "
+                       "(plant_id, location_id, scientific_name, image_id, common_name) "
+                       "SELECT s.plant_id, l.location_id, s.scientific_name, s.image_id, "
+                       "s.common_name" + STAGED_PLANT_IDS_SQL.format(staged=staged_table)
+                       + "WHERE NOT EXISTS "
+                       "(SELECT 1 FROM alpha.plant AS p WHERE p.plant_id = s.plant_id);")
+        if new_dimensions:
+            cache_staged_dimensions(cursor, staged, staged_table)
+        cursor.execute("SELECT p.plant_id FROM alpha.plant AS p WHERE p.plant_id IN "
+                       f"(SELECT s.plant_id FROM {staged_table} AS s);")
+        stored_ids = [row[0] for row in cursor.fetchall()]
+    dimension_cache.store("plant", {plant_id: plant_id for plant_id in stored_ids})
+    print("Upload process completed.")
+
+
+def update_botanists(conn: pymssql.Connection, batch_data: pd.DataFrame) -> dict[str, int]:
     """
-    Updates the botanists table in the database.
+    Updates the botanists table in the database and returns the botanist_id
+    of each botanist in the batch, keyed by phone number.
+    The batch is deduplicated by phone number first, and only botanists whose
+    name and email differ from the cached details are sent to the database.
     """
-    create_temp_table_sql = """
-        CREATE TABLE alpha.#transaction_botanists(
+    sql = get_dialect(conn)
+    temp_table = sql["temp_table"].format(name="transaction_botanists")
+    create_temp_table_sql = f"""
+        CREATE TABLE {temp_table}(
             name VARCHAR(30) NOT NULL,
             email VARCHAR(30) NOT NULL,
             phone_number VARCHAR(30) NOT NULL
         )
         ;
     """
-    populate_temp_table_sql = """
-        INSERT INTO alpha.#transaction_botanists
+    populate_temp_table_sql = f"""
+        INSERT INTO {temp_table}
             (name, email, phone_number)
         VALUES
             (%s, %s, %s)
         ;
     """
-    merge_tables_sql = """
-        MERGE alpha.botanist as target
-        USING alpha.#transaction_botanists as source
-        ON target.phone_number = source.phone_number
-        WHEN NOT MATCHED THEN
-            INSERT (name, email, phone_number)
-            VALUES (source.name, source.email, source.phone_number)
-        ;
-        """
-    drop_temp_table_sql = "DROP TABLE alpha.#transaction_botanists;"
+    merge_tables_sql = sql["merge_botanists"].format(source=temp_table)
 
     botanist_data = batch_data[[
         "botanist_name",
         "botanist_email",
-        "botanist_phone"]]
-    upload_data = [tuple(x) for x in botanist_data.itertuples(index=False)]
+        "botanist_phone"]].dropna(subset=["botanist_phone"]).drop_duplicates(
+            subset=["botanist_phone"], keep="last")
+    phone_numbers = botanist_data["botanist_phone"].tolist()
+    known_details = dimension_cache.lookup("botanist_details", phone_numbers)
+    upload_data = [tuple(x) for x in botanist_data.itertuples(index=False)
+                   if known_details.get(x[2]) != (x[0], x[1])]
 
-    with conn.cursor() as cursor:
-        cursor.execute(create_temp_table_sql)
+    if not upload_data:
+        print("No new or changed botanists to upload.")
+        return get_botanist_ids(conn, phone_numbers)
+
+    with staging_table(conn, "transaction_botanists", create_temp_table_sql), \
+            conn.cursor() as cursor:
         cursor.executemany(populate_temp_table_sql, seq_of_parameters=upload_data)
+        if sql["update_botanists"]:
+            cursor.execute(sql["update_botanists"].format(source=temp_table))
         cursor.execute(merge_tables_sql)
-        cursor.execute(drop_temp_table_sql)
 
-    conn.commit()
+    dimension_cache.invalidate("botanist", [phone for _, _, phone in upload_data])
+    dimension_cache.store("botanist_details",
+                          {phone: (name, email) for name, email, phone in upload_data})
+    return get_botanist_ids(conn, phone_numbers)
+
+
+def get_botanist_ids(conn: pymssql.Connection, phone_numbers: list) -> dict[str, int]:
+    """
+    Returns a mapping of phone number to botanist_id for the botanists that exist.
+    """
+    if not phone_numbers:
+        return {}
+
+    cached = dimension_cache.lookup("botanist", phone_numbers)
+    unknown_phones = [phone for phone in phone_numbers if phone not in cached]
+    if not unknown_phones:
+        return cached
+
+    placeholders = ", ".join(["%s"] * len(unknown_phones))
+    query = ("SELECT botanist_id, phone_number FROM alpha.botanist "
+             f"WHERE phone_number IN ({placeholders})")
+
+    with conn.cursor() as cursor:
+        cursor.execute(query, tuple(unknown_phones))
+        rows = cursor.fetchall()
+
+    found = {row[1]: row[0] for row in rows}
+    dimension_cache.store("botanist", found)
+    return cached | found
+
+
+def prepare_readings(conn: pymssql.Connection, data: pd.DataFrame,
+                     botanist_ids: dict[str, int] | None = None) -> pd.DataFrame:
+    """
+    Returns the batch as alpha.reading rows, with botanist_id resolved from the
+    botanist's phone number, using the mapping from update_botanists when given.
+    Readings for unknown plants or botanists, or with missing values, are dropped.
+    """
+    plant_ids = data["plant_id"].dropna().unique().tolist()
+    existing_ids = get_existing_plant_ids(conn, plant_ids)
+    if botanist_ids is None:
+        phone_numbers = data["botanist_phone"].dropna().unique().tolist()
+        botanist_ids = get_botanist_ids(conn, phone_numbers)
+
+    readings = pd.DataFrame({
+        "plant_id": data["plant_id"],
+        "soil_moisture": data["soil_moisture"],
+        "temperature": data["temperature"],
+        "at": data["recording_taken"],
+        "botanist_id": data["botanist_phone"].map(botanist_ids),
+        "last_watered": data["last_watered"]
+    })
+    readings = readings[readings["plant_id"].isin(existing_ids)].dropna()
+    return readings.astype({"plant_id": int, "botanist_id": int})
+
+
+def insert_new_readings(cursor: pymssql.Cursor, batch: list[tuple], sql: dict[str, str]) -> int:
+    """
+    Stages a batch of readings and inserts those whose (plant_id, at) is not
+    already in alpha.reading, returning the number inserted.
+    """
+    staged_table = sql["temp_table"].format(name="staged_readings")
+    cursor.execute(sql["truncate"].format(table=staged_table))
+    insert_rows(cursor, staged_table, READING_COLUMNS, batch)
+    cursor.execute(f"""
+        INSERT INTO alpha.reading
+            (plant_id, soil_moisture, temperature, at, botanist_id, last_watered)
+        SELECT s.plant_id, s.soil_moisture, s.temperature, s.at, s.botanist_id, s.last_watered
+        FROM {staged_table} AS s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM alpha.reading AS r {sql["lock_hint"]}
+            WHERE r.plant_id = s.plant_id AND r.at = s.at
+        );
+    """)
+    return cursor.rowcount
+
+
+def upload_readings(conn: pymssql.Connection, data: pd.DataFrame,
+                    batch_size: int = READING_BATCH_SIZE,
+                    botanist_ids: dict[str, int] | None = None,
+                    deadline: float | None = None) -> dict[str, float]:
+    """
+    Uploads the batch's readings in transactions of batch_size rows, skipping
+    any reading whose (plant_id, at) is already stored, so re-running a batch is safe.
+    A failed batch is rolled back and its pooled connection discarded.
+    Once the deadline, a perf_counter() time, has passed no further batch is
+    started and TimeoutError is raised; batches already committed stay.
+    Returns the rows inserted, duplicates skipped, seconds taken and rows/sec.
+    """
+    start = perf_counter()
+    readings = prepare_readings(conn, data, botanist_ids)
+    rows = to_parameters(readings.drop_duplicates(subset=["plant_id", "at"]))
+    inserted = sent = 0
+    sql = get_dialect(conn)
+
+    if rows:
+        with staging_table(conn, "staged_readings", f"""
+                CREATE TABLE {sql["temp_table"].format(name="staged_readings")}(
+                    plant_id INT NOT NULL,
+                    soil_moisture DECIMAL NOT NULL,
+                    temperature DECIMAL NOT NULL,
+                    at DATETIME NOT NULL,
+                    botanist_id SMALLINT NOT NULL,
+                    last_watered DATETIME NOT NULL
+                )
+                ;
+            """):
+            while sent < len(rows) and (deadline is None or perf_counter() < deadline):
+                with conn.cursor() as cursor:
+                    inserted += insert_new_readings(cursor, rows[sent:sent + batch_size], sql)
+                conn.commit()
+                sent += batch_size
+        if sent < len(rows):
+            raise TimeoutError(f"Upload deadline reached after {inserted} of "
+                               f"{len(rows)} readings.")
+
+    skipped = len(readings) - inserted
+    seconds = perf_counter() - start
+    rows_per_second = len(readings) / seconds if seconds else 0.0
+    print(f"Uploaded {inserted} readings, skipped {skipped} duplicates "
+          f"in {seconds:.2f}s ({rows_per_second:.0f} rows/sec).")
+    return {"rows": inserted, "skipped": skipped,
+            "seconds": seconds, "rows_per_second": rows_per_second}
 
-def upload_readings(df:pd.DataFrame) -> None:
-    ...
 
 if __name__ == '__main__':
     load_dotenv()
@@ -199,5 +571,9 @@ if __name__ == '__main__':
     }])
 
     print(new_plant_data)
-    upload_new_plants_with_location(connection, new_plant_data)
-    connection.close()
+    upload_new_plants_bulk(connection, new_plant_data)
+    new_botanist_ids = update_botanists(connection, new_plant_data)
+    upload_readings(connection, new_plant_data, botanist_ids=new_botanist_ids)
+    print(f"Dimension cache hit rate: {dimension_cache.hit_rate():.0%}")
+    print(f"Connection metrics: {connection_metrics()}")
+    print("\n".join(summary_lines()))